@@ -0,0 +1,75 @@
+"""
+Conditional GET (ETag / If-None-Match) for the list endpoints.
+
+ETags come from a cheap version marker, not from the response body:
+InventoryService increments the pharmacy's inventory_versions row inside
+every write transaction, so the marker - that row when the request is
+scoped to one pharmacy, the sum over all pharmacies otherwise - moves
+exactly when a committed write can change the rows the endpoint returns.
+Risk rows also move when a usage catch-up rescores them, so their marker
+adds the feature store watermark (committed in the same transaction as
+the rescore) and the risk mode.
+
+The marker is read before the rows, so a body is never older than its
+ETag. A request whose If-None-Match matches gets 304 before the list
+query runs. Cache-Control is configured per route (CACHE_CONTROL_<ROUTE>).
+"""
+from __future__ import annotations
+
+import os
+from typing import Dict, Optional
+
+from fastapi import Request, Response, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.ml.feature_store import WATERMARK_NAME
+from app.models.db_models import FeatureWatermark, InventoryVersion
+
+# no-cache: clients and proxies may store responses but revalidate each use
+CACHE_CONTROL: Dict[str, str] = {
+    "inventory": os.getenv("CACHE_CONTROL_INVENTORY", "private, no-cache"),
+    "shortage_risks": os.getenv("CACHE_CONTROL_SHORTAGE_RISKS", "private, no-cache"),
+}
+
+
+async def inventory_marker(db: AsyncSession, pharmacy_id: Optional[int] = None) -> int:
+    """Inventory version of one pharmacy, or the sum over all (0 before any write)."""
+    if pharmacy_id:
+        stmt = select(InventoryVersion.version).where(InventoryVersion.pharmacy_id == pharmacy_id)
+    else:
+        stmt = select(func.sum(InventoryVersion.version))
+    return await db.scalar(stmt) or 0
+
+
+async def usage_marker(db: AsyncSession) -> int:
+    """Last StockHistory id folded into the usage features."""
+    return await db.scalar(
+        select(FeatureWatermark.last_history_id)
+        .where(FeatureWatermark.name == WATERMARK_NAME)
+    ) or 0
+
+
+def make_etag(*parts: object) -> str:
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for GET)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in {tag.strip().removeprefix("W/") for tag in header.split(",")}
+
+
+def validator_headers(route: str, etag: str) -> Dict[str, str]:
+    headers = {"ETag": etag, "Vary": "Accept"}
+    if CACHE_CONTROL[route]:
+        headers["Cache-Control"] = CACHE_CONTROL[route]
+    return headers
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
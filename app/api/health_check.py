@@ -1,10 +1,15 @@
 from fastapi import APIRouter, status, Depends
 from datetime import datetime
 from typing import Dict
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, text
 
-from app.database.session import get_db
+from app.database.connection import async_engine, engine
+from app.database.pool import pool_status
+from app.database.session import get_async_db
+from app.ml.model_utils import model_holder
+from app.services.result_cache import result_cache
+from app.services.risk_events import risk_events
 
 router = APIRouter()
 
@@ -36,7 +41,7 @@ async def health_check() -> Dict[str, str]:
     summary="Detailed Status",
     description="Get detailed API status information including database connectivity"
 )
-async def detailed_status(db: Session = Depends(get_db)) -> Dict:
+async def detailed_status(db: AsyncSession = Depends(get_async_db)) -> Dict:
     """
     Detailed status endpoint with database and service checks.
     
@@ -49,7 +54,7 @@ async def detailed_status(db: Session = Depends(get_db)) -> Dict:
     
     try:
         # Execute simple query to verify database connection
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         db_status = "connected"
     except Exception as e:
         db_error = str(e)
@@ -59,7 +64,7 @@ async def detailed_status(db: Session = Depends(get_db)) -> Dict:
     try:
         from app.models.db_models import Inventory
         # Try to count inventory records
-        inventory_count = db.query(Inventory).count()
+        inventory_count = await db.scalar(select(func.count()).select_from(Inventory))
         tables_exist = True
     except Exception as e:
         inventory_count = 0
@@ -70,11 +75,18 @@ async def detailed_status(db: Session = Depends(get_db)) -> Dict:
         "database": {
             "status": db_status,
             "tables_initialized": tables_exist,
+            "pool": {
+                "async": pool_status(async_engine.sync_engine),
+                "sync": pool_status(engine),
+            },
         },
         "services": {
             "inventory_service": "available",
             "shortage_service": "available"
         },
+        "model": model_holder.describe(),
+        "result_cache": result_cache.stats(),
+        "risk_events": risk_events.stats(),
         "timestamp": datetime.utcnow().isoformat(),
         "version": "1.0.0"
     }
@@ -89,8 +101,12 @@ async def detailed_status(db: Session = Depends(get_db)) -> Dict:
             from app.models.db_models import Pharmacy, Medication
             response["statistics"] = {
                 "total_inventory_items": inventory_count,
-                "total_pharmacies": db.query(Pharmacy).count(),
-                "total_medications": db.query(Medication).count()
+                "total_pharmacies": await db.scalar(
+                    select(func.count()).select_from(Pharmacy)
+                ),
+                "total_medications": await db.scalar(
+                    select(func.count()).select_from(Medication)
+                )
             }
         except Exception:
             pass
@@ -0,0 +1,109 @@
+"""
+Keyset pagination and NDJSON streaming for the list endpoints.
+
+Pages are ordered by (pharmacy_id, medication_id), which is unique per
+inventory row and covered by ix_inventory_pharmacy_med, so fetching the
+next page is an index range scan no matter how deep the client pages.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+MAX_PAGE_SIZE = 10000
+STREAM_BATCH_SIZE = 1000
+
+
+def encode_cursor(pharmacy_id: int, medication_id: int) -> str:
+    """Cursor pointing just after the given row: "<pharmacy_id>:<medication_id>"."""
+    return f"{pharmacy_id}:{medication_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        pharmacy_id, medication_id = cursor.split(":")
+        return int(pharmacy_id), int(medication_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid cursor {cursor!r}; expected '<pharmacy_id>:<medication_id>'"
+        )
+
+
+def paginate(
+    stmt: Select,
+    pharmacy_col: Any,
+    medication_col: Any,
+    *,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Select:
+    """
+    Order stmt by (pharmacy_id, medication_id) and start after cursor.
+
+    limit is applied as-is; callers that need to know whether another page
+    exists should ask for limit + 1 rows (see split_page).
+    """
+    stmt = stmt.order_by(pharmacy_col, medication_col)
+
+    if cursor:
+        after = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(pharmacy_col, medication_col) > tuple_(*after))
+
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    return stmt
+
+
+def split_page(
+    rows: Sequence[Any],
+    limit: Optional[int],
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Split a limit + 1 result into (page, next_cursor).
+    """
+    rows = list(rows)
+    if limit is None or len(rows) <= limit:
+        return rows, None
+
+    page = rows[:limit]
+    last = page[-1]
+    return page, encode_cursor(last.pharmacy_id, last.medication_id)
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_response(
+    db: AsyncSession,
+    stmt: Select,
+    to_dict: Callable[[Any], Dict[str, Any]],
+    *,
+    batch_size: int = STREAM_BATCH_SIZE,
+) -> StreamingResponse:
+    """
+    Stream stmt as newline-delimited JSON.
+
+    Rows are fetched with yield_per (a server-side cursor on PostgreSQL) and
+    written out one batch at a time, so memory use does not depend on the
+    size of the result.
+    """
+
+    async def generate() -> AsyncIterator[str]:
+        result = await db.stream(stmt.execution_options(yield_per=batch_size))
+        async for batch in result.partitions():
+            yield "".join(
+                json.dumps(to_dict(row), default=str) + "\n" for row in batch
+            )
+
+    return StreamingResponse(generate(), media_type=NDJSON_MEDIA_TYPE)
@@ -1,20 +1,50 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List, Optional
+import math
+import os
+from dataclasses import asdict
+from enum import Enum
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request, Response
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
-from app.database.session import get_db
+from app.api.conditional import (
+    etag_matches,
+    inventory_marker,
+    make_etag,
+    not_modified,
+    usage_marker,
+    validator_headers,
+)
+from app.api.pagination import (
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    ndjson_response,
+    paginate,
+    split_page,
+    wants_ndjson,
+)
+from app.api.sse import risk_event_stream, sse_response
+from app.database.session import get_async_db, get_async_db_with_timeout
 from app.services.inventory_service import (
-    InventoryService,
+    AsyncInventoryService,
     InventoryNotFoundError,
     InventoryValidationError,
+    StockOperation,
 )
-from app.services.shortage_service import ShortageService
+from app.services.reporting_service import ReportingService
+from app.services.result_cache import result_cache
+from app.services.risk_events import risk_events
+from app.services.shortage_service import AsyncShortageService, ShortageServiceError, get_risk_level
 
 router = APIRouter()
 
+MAX_BULK_OPERATIONS = 250000
+# Bulk syncs may legitimately outlast the default DB_STATEMENT_TIMEOUT_MS
+BULK_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_BULK_STATEMENT_TIMEOUT_MS", "300000"))
+
 # ===== PYDANTIC SCHEMAS =====
 
 class InventoryCreate(BaseModel):
@@ -89,6 +119,59 @@ class InventoryChangeResponse(BaseModel):
         }
 
 
+class StockOperationType(str, Enum):
+    """Operations accepted by the bulk endpoint"""
+    ADD = "add"
+    UPDATE = "update"
+    REMOVE = "remove"
+
+
+class InventoryBulkOperation(BaseModel):
+    """One operation in a bulk request; quantity is validated per item"""
+    op: StockOperationType
+    pharmacy_id: int = Field(..., description="ID of the pharmacy", gt=0)
+    medication_id: int = Field(..., description="ID of the medication", gt=0)
+    quantity: int = Field(..., description="Quantity to add/remove, or new quantity for update")
+
+
+class InventoryBulkRequest(BaseModel):
+    """Schema for applying many stock changes at once"""
+    operations: List[InventoryBulkOperation] = Field(
+        ..., min_length=1, max_length=MAX_BULK_OPERATIONS
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "operations": [
+                    {"op": "add", "pharmacy_id": 1, "medication_id": 101, "quantity": 50},
+                    {"op": "remove", "pharmacy_id": 1, "medication_id": 102, "quantity": 5},
+                    {"op": "update", "pharmacy_id": 2, "medication_id": 101, "quantity": 30}
+                ]
+            }
+        }
+
+
+class InventoryBulkItemResult(BaseModel):
+    """Per-operation result of a bulk request"""
+    index: int
+    pharmacy_id: int
+    medication_id: int
+    applied: bool
+    previous_quantity: Optional[int] = None
+    new_quantity: Optional[int] = None
+    change_amount: int = 0
+    error: Optional[str] = None
+
+
+class InventoryBulkResponse(BaseModel):
+    """Response schema for bulk inventory changes"""
+    applied: int
+    rejected: int
+    changed_at: datetime
+    results: List[InventoryBulkItemResult]
+
+
 class InventoryItem(BaseModel):
     """Schema for inventory item details"""
     id: int
@@ -117,6 +200,8 @@ class ShortageRiskResponse(BaseModel):
     risk_level: str
     reason: str
     calculated_at: datetime
+    level_changed_at: Optional[datetime] = None
+    days_of_cover: Optional[float] = None
 
     class Config:
         json_schema_extra = {
@@ -127,23 +212,46 @@ class ShortageRiskResponse(BaseModel):
                 "risk_score": 0.85,
                 "risk_level": "CRITICAL",
                 "reason": "critical_low_stock",
-                "calculated_at": "2026-02-02T12:34:56"
+                "calculated_at": "2026-02-02T12:34:56",
+                "level_changed_at": "2026-02-01T08:00:00",
+                "days_of_cover": 1.5
             }
         }
 
 
+class RiskLevel(str, Enum):
+    """Risk levels returned by get_risk_level()"""
+    CRITICAL = "CRITICAL"
+    WARNING = "WARNING"
+    LOW = "LOW"
+    NORMAL = "NORMAL"
+
+
 # ===== HELPER FUNCTIONS =====
 
-def get_risk_level(risk_score: float) -> str:
-    """Convert risk score to human-readable level"""
-    if risk_score >= 0.8:
-        return "CRITICAL"
-    elif risk_score >= 0.5:
-        return "WARNING"
-    elif risk_score >= 0.3:
-        return "LOW"
-    else:
-        return "NORMAL"
+def _inventory_row_to_dict(row: Any) -> Dict[str, Any]:
+    """Serialize an inventory row (used by JSON and NDJSON responses)"""
+    return {
+        "id": row.id,
+        "pharmacy_id": row.pharmacy_id,
+        "medication_id": row.medication_id,
+        "quantity": row.quantity,
+    }
+
+
+def _risk_row_to_dict(row: Any) -> Dict[str, Any]:
+    """Serialize a ShortageService.stored_risk_statement() row for NDJSON streaming"""
+    return {
+        "pharmacy_id": row.pharmacy_id,
+        "medication_id": row.medication_id,
+        "quantity": row.quantity,
+        "risk_score": float(row.risk_score),
+        "risk_level": row.risk_level,
+        "reason": row.reason,
+        "calculated_at": row.calculated_at.isoformat(),
+        "level_changed_at": row.level_changed_at.isoformat(),
+        "days_of_cover": row.days_of_cover,
+    }
 
 
 # ===== INVENTORY ENDPOINTS =====
@@ -157,7 +265,7 @@ def get_risk_level(risk_score: float) -> str:
 )
 async def add_inventory_stock(
     inventory: InventoryCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Add stock to inventory.
@@ -169,8 +277,8 @@ async def add_inventory_stock(
     Returns the previous quantity, new quantity, and change amount.
     """
     try:
-        service = InventoryService(db)
-        result = service.add_stock(
+        service = AsyncInventoryService(db)
+        result = await service.add_stock(
             pharmacy_id=inventory.pharmacy_id,
             medication_id=inventory.medication_id,
             quantity=inventory.quantity
@@ -206,7 +314,7 @@ async def add_inventory_stock(
 )
 async def update_inventory_stock(
     inventory: InventoryUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update inventory to a specific quantity.
@@ -218,8 +326,8 @@ async def update_inventory_stock(
     This replaces the current quantity with the new value.
     """
     try:
-        service = InventoryService(db)
-        result = service.update_stock(
+        service = AsyncInventoryService(db)
+        result = await service.update_stock(
             pharmacy_id=inventory.pharmacy_id,
             medication_id=inventory.medication_id,
             new_quantity=inventory.new_quantity
@@ -255,7 +363,7 @@ async def update_inventory_stock(
 )
 async def remove_inventory_stock(
     inventory: InventoryRemove,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Remove stock from inventory.
@@ -267,8 +375,8 @@ async def remove_inventory_stock(
     Will fail if trying to remove more stock than available.
     """
     try:
-        service = InventoryService(db)
-        result = service.remove_stock(
+        service = AsyncInventoryService(db)
+        result = await service.remove_stock(
             pharmacy_id=inventory.pharmacy_id,
             medication_id=inventory.medication_id,
             quantity=inventory.quantity
@@ -301,18 +409,74 @@ async def remove_inventory_stock(
         )
 
 
+@router.post(
+    "/inventory/bulk",
+    response_model=InventoryBulkResponse,
+    summary="Apply Bulk Inventory Changes",
+    description="Apply many add/update/remove operations in a single transaction"
+)
+async def bulk_inventory_changes(
+    request: InventoryBulkRequest,
+    db: AsyncSession = Depends(get_async_db_with_timeout(BULK_STATEMENT_TIMEOUT_MS))
+):
+    """
+    Apply a batch of stock changes (e.g. a nightly wholesaler sync).
+    
+    - **operations**: list of `{op, pharmacy_id, medication_id, quantity}` where
+      `op` is `add`, `update` or `remove`
+    
+    Operations are applied in order in one transaction. Invalid operations
+    (for example removing more stock than available) are reported in
+    `results` with `applied: false` and do not stop the rest of the batch.
+    """
+    operations = [
+        StockOperation(
+            op=item.op.value,
+            pharmacy_id=item.pharmacy_id,
+            medication_id=item.medication_id,
+            quantity=item.quantity,
+        )
+        for item in request.operations
+    ]
+    
+    try:
+        service = AsyncInventoryService(db)
+        results = await service.apply_batch(operations)
+        applied = sum(1 for r in results if r.applied)
+        
+        return InventoryBulkResponse(
+            applied=applied,
+            rejected=len(results) - applied,
+            changed_at=datetime.utcnow(),
+            results=[InventoryBulkItemResult(**asdict(r)) for r in results],
+        )
+    
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to apply bulk changes: {str(e)}"
+        )
+
+
 @router.get(
     "/inventory",
     response_model=List[InventoryItem],
     summary="Get All Inventory",
-    description="Retrieve all inventory records, optionally filtered by pharmacy or low stock"
+    description=(
+        "Retrieve all inventory records, optionally filtered by pharmacy or low stock. "
+        "Supports keyset pagination and NDJSON streaming."
+    )
 )
 async def get_all_inventory(
+    request: Request,
+    response: Response,
     pharmacy_id: Optional[int] = None,
     medication_id: Optional[int] = None,
     low_stock_only: bool = False,
     min_quantity: Optional[int] = None,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get inventory records with optional filters.
@@ -321,37 +485,75 @@ async def get_all_inventory(
     - **medication_id**: Filter by medication ID (optional)
     - **low_stock_only**: Show only items at or below reorder point (optional)
     - **min_quantity**: Filter items with quantity >= this value (optional)
+    - **cursor**: Return rows after this `pharmacy_id:medication_id` (optional)
+    - **limit**: Page size; the next cursor is returned in `X-Next-Cursor` (optional)
+    
+    Rows are ordered by (pharmacy_id, medication_id). Send
+    `Accept: application/x-ndjson` to stream rows as they are read.
+    
+    Responses carry an `ETag`; send it back in `If-None-Match` to get
+    `304 Not Modified` while the inventory (of `pharmacy_id`, if given)
+    has not changed (nor, for `low_stock_only` in coverage mode, the usage
+    features).
     """
     from app.models.db_models import Inventory
     
     try:
-        query = db.query(Inventory)
+        ndjson = wants_ndjson(request)
+        shortage_service = AsyncShortageService(db, critical_threshold=5, low_threshold=15)
+        etag_parts = [await inventory_marker(db, pharmacy_id)]
+        if low_stock_only and shortage_service.rules.mode == "coverage":
+            # The filter then also depends on usage
+            etag_parts += [await usage_marker(db), shortage_service.rules.mode]
+        etag = make_etag("inventory", *etag_parts, "ndjson" if ndjson else "json")
+        headers = validator_headers("inventory", etag)
+        if etag_matches(request, etag):
+            return not_modified(headers)
+        
+        stmt = select(
+            Inventory.id,
+            Inventory.pharmacy_id,
+            Inventory.medication_id,
+            Inventory.quantity,
+        )
         
         # Apply filters
         if pharmacy_id:
-            query = query.filter(Inventory.pharmacy_id == pharmacy_id)
+            stmt = stmt.where(Inventory.pharmacy_id == pharmacy_id)
         
         if medication_id:
-            query = query.filter(Inventory.medication_id == medication_id)
+            stmt = stmt.where(Inventory.medication_id == medication_id)
         
         if min_quantity is not None:
-            query = query.filter(Inventory.quantity >= min_quantity)
+            stmt = stmt.where(Inventory.quantity >= min_quantity)
         
-        results = query.all()
-        
-        # Apply low stock filter if needed
+        # Apply low stock filter if needed (warning level or higher, evaluated in SQL)
         if low_stock_only:
-            # Use shortage service to identify low stock items
-            shortage_service = ShortageService(db, critical_threshold=5, low_threshold=15)
-            low_stock_items = []
-            for item in results:
-                risk = shortage_service.compute_risk(item)
-                if risk.risk_score >= 0.5:  # Warning level or higher
-                    low_stock_items.append(item)
-            results = low_stock_items
+            stmt = stmt.where(shortage_service.rules.risk_filter(min_risk=0.5))
         
-        return results
+        if ndjson:
+            stmt = paginate(
+                stmt, Inventory.pharmacy_id, Inventory.medication_id,
+                cursor=cursor, limit=limit,
+            )
+            stream = ndjson_response(db, stmt, _inventory_row_to_dict)
+            stream.headers.update(headers)
+            return stream
+        
+        stmt = paginate(
+            stmt, Inventory.pharmacy_id, Inventory.medication_id,
+            cursor=cursor, limit=limit + 1 if limit else None,
+        )
+        results, next_cursor = split_page((await db.execute(stmt)).all(), limit)
+        
+        response.headers.update(headers)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        
+        return [_inventory_row_to_dict(row) for row in results]
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -368,7 +570,7 @@ async def get_all_inventory(
 async def get_inventory_item(
     pharmacy_id: int,
     medication_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get inventory for a specific pharmacy and medication.
@@ -379,13 +581,11 @@ async def get_inventory_item(
     from app.models.db_models import Inventory
     
     try:
-        inventory = (
-            db.query(Inventory)
-            .filter(
+        inventory = await db.scalar(
+            select(Inventory).where(
                 Inventory.pharmacy_id == pharmacy_id,
                 Inventory.medication_id == medication_id
             )
-            .first()
         )
         
         if not inventory:
@@ -414,10 +614,15 @@ async def get_inventory_item(
     description="Get shortage risk scores for all inventory items or high-risk items only"
 )
 async def get_shortage_risks(
+    request: Request,
+    response: Response,
     high_risk_only: bool = False,
     min_risk_score: float = 0.8,
     pharmacy_id: Optional[int] = None,
-    db: Session = Depends(get_db)
+    risk_level: Optional[RiskLevel] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get shortage risk assessment for inventory items.
@@ -425,44 +630,107 @@ async def get_shortage_risks(
     - **high_risk_only**: If true, only return items with risk >= min_risk_score
     - **min_risk_score**: Minimum risk score threshold (0.0 to 1.0)
     - **pharmacy_id**: Filter by pharmacy ID (optional)
+    - **risk_level**: Only return items at this risk level (optional)
+    - **cursor**: Return rows after this `pharmacy_id:medication_id` (optional)
+    - **limit**: Page size; the next cursor is returned in `X-Next-Cursor` (optional)
     
     Risk Levels:
     - CRITICAL: risk_score >= 0.8
     - WARNING: risk_score >= 0.5
     - LOW: risk_score >= 0.3
     - NORMAL: risk_score < 0.3
+    
+    Send `Accept: application/x-ndjson` to stream results as they are read.
+    
+    Risks are read from the shortage_risk table, which is updated with
+    every stock change. JSON pages are served from the result cache until
+    the ETag changes. `level_changed_at` is when the item last moved
+    between risk levels. `days_of_cover` is quantity / average daily
+    usage (null without usage history); with SHORTAGE_RISK_MODE=coverage
+    it drives the risk score instead of the fixed quantity thresholds.
+    
+    Responses carry an `ETag` (see `GET /inventory`); a matching
+    `If-None-Match` gets `304 Not Modified` without reading the risks.
     """
-    from app.models.db_models import Inventory
+    from app.models.db_models import ShortageRisk
     
     try:
-        shortage_service = ShortageService(db)
+        shortage_service = AsyncShortageService(db)
         
-        if high_risk_only:
-            # Use the service method for high-risk items
-            results = shortage_service.get_high_risk_items(min_risk=min_risk_score)
-        else:
-            # Calculate risk for all items
-            query = db.query(Inventory)
-            if pharmacy_id:
-                query = query.filter(Inventory.pharmacy_id == pharmacy_id)
-            
-            inventory_items = query.all()
-            results = [shortage_service.compute_risk(item) for item in inventory_items]
+        ndjson = wants_ndjson(request)
+        etag = make_etag(
+            "risks",
+            await inventory_marker(db, pharmacy_id),
+            await usage_marker(db),
+            shortage_service.rules.mode,
+            "ndjson" if ndjson else "json",
+        )
+        headers = validator_headers("shortage_risks", etag)
+        if etag_matches(request, etag):
+            return not_modified(headers)
+        
+        # Indexed lookup on the materialized risk table
+        stmt = shortage_service.rules.stored_risk_statement(
+            pharmacy_id=pharmacy_id,
+            min_risk=min_risk_score if high_risk_only else None,
+            risk_level=risk_level.value if risk_level else None,
+        )
         
-        # Convert to response schema
-        return [
-            ShortageRiskResponse(
-                pharmacy_id=r.pharmacy_id,
-                medication_id=r.medication_id,
-                quantity=r.quantity,
-                risk_score=r.risk_score,
-                risk_level=get_risk_level(r.risk_score),
-                reason=r.reason,
-                calculated_at=r.calculated_at
+        if ndjson:
+            stmt = paginate(
+                stmt, ShortageRisk.pharmacy_id, ShortageRisk.medication_id,
+                cursor=cursor, limit=limit,
             )
-            for r in results
-        ]
+            stream = ndjson_response(db, stmt, _risk_row_to_dict)
+            stream.headers.update(headers)
+            return stream
+        
+        async def load_page():
+            page = paginate(
+                stmt, ShortageRisk.pharmacy_id, ShortageRisk.medication_id,
+                cursor=cursor, limit=limit + 1 if limit else None,
+            )
+            rows, next_cursor = split_page((await db.execute(page)).all(), limit)
+            
+            # Convert to response schema
+            return [
+                ShortageRiskResponse(
+                    pharmacy_id=row.pharmacy_id,
+                    medication_id=row.medication_id,
+                    quantity=row.quantity,
+                    risk_score=row.risk_score,
+                    risk_level=row.risk_level,
+                    reason=row.reason,
+                    calculated_at=row.calculated_at,
+                    level_changed_at=row.level_changed_at,
+                    days_of_cover=row.days_of_cover
+                )
+                for row in rows
+            ], next_cursor
+        
+        results, next_cursor = await result_cache.aget_or_compute(
+            "shortage_risks",
+            {
+                # Ties the entry to the data version, so a cached page is
+                # never served under a newer ETag than it was read at
+                "etag": etag,
+                "pharmacy_id": pharmacy_id,
+                "min_risk": min_risk_score if high_risk_only else None,
+                "risk_level": risk_level.value if risk_level else None,
+                "cursor": cursor,
+                "limit": limit,
+            },
+            load_page,
+        )
+        
+        response.headers.update(headers)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        
+        return results
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -479,7 +747,7 @@ async def get_shortage_risks(
 async def get_item_shortage_risk(
     pharmacy_id: int,
     medication_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get shortage risk for a specific inventory item.
@@ -487,16 +755,30 @@ async def get_item_shortage_risk(
     - **pharmacy_id**: ID of the pharmacy
     - **medication_id**: ID of the medication
     """
-    from app.models.db_models import Inventory
+    from app.models.db_models import Inventory, ShortageRisk
     
     try:
-        inventory = (
-            db.query(Inventory)
-            .filter(
+        stored = await db.get(ShortageRisk, (pharmacy_id, medication_id))
+        
+        if stored is not None:
+            return ShortageRiskResponse(
+                pharmacy_id=stored.pharmacy_id,
+                medication_id=stored.medication_id,
+                quantity=stored.quantity,
+                risk_score=stored.risk_score,
+                risk_level=stored.risk_level,
+                reason=stored.reason,
+                calculated_at=stored.calculated_at,
+                level_changed_at=stored.level_changed_at,
+                days_of_cover=stored.days_of_cover
+            )
+        
+        # Not materialized yet (e.g. inventory written outside the service)
+        inventory = await db.scalar(
+            select(Inventory).where(
                 Inventory.pharmacy_id == pharmacy_id,
                 Inventory.medication_id == medication_id
             )
-            .first()
         )
         
         if not inventory:
@@ -505,8 +787,11 @@ async def get_item_shortage_risk(
                 detail=f"No inventory found for pharmacy {pharmacy_id} and medication {medication_id}"
             )
         
-        shortage_service = ShortageService(db)
-        result = shortage_service.compute_risk(inventory)
+        shortage_service = AsyncShortageService(db)
+        [usage] = await shortage_service.daily_usage_many([(pharmacy_id, medication_id)])
+        result = shortage_service.compute_risk(
+            inventory, None if math.isnan(usage) else float(usage)
+        )
         
         return ShortageRiskResponse(
             pharmacy_id=result.pharmacy_id,
@@ -515,7 +800,8 @@ async def get_item_shortage_risk(
             risk_score=result.risk_score,
             risk_level=get_risk_level(result.risk_score),
             reason=result.reason,
-            calculated_at=result.calculated_at
+            calculated_at=result.calculated_at,
+            days_of_cover=result.days_of_cover
         )
     
     except HTTPException:
@@ -524,4 +810,71 @@ async def get_item_shortage_risk(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to calculate shortage risk: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+# ===== REPORT ENDPOINTS =====
+
+@router.get(
+    "/reports/shortages",
+    summary="Get Shortage Report",
+    description="Shortage totals and per-pharmacy shortage items across all inventory"
+)
+async def get_shortage_report(
+    db: AsyncSession = Depends(get_async_db_with_timeout(BULK_STATEMENT_TIMEOUT_MS))
+):
+    """
+    Get the shortage report (ReportingService.generate_shortage_report).
+    
+    Scored and grouped by pharmacy in a single SQL query; the result is
+    cached until the inventory version or the usage rollups move.
+    """
+    try:
+        return await result_cache.aget_or_compute(
+            "shortage_report",
+            {
+                # Database-side versions: any worker's commit moves them
+                "inventory": await inventory_marker(db),
+                "usage": await usage_marker(db),
+            },
+            lambda: db.run_sync(
+                lambda session: ReportingService(session).generate_shortage_report().to_dict()
+            ),
+        )
+    
+    except ShortageServiceError as e:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to generate shortage report: {str(e)}"
+        )
+
+
+# ===== EVENT ENDPOINTS =====
+
+@router.get(
+    "/events/risk-levels",
+    summary="Stream Risk Level Changes",
+    description="Server-Sent Events stream of inventory items moving between risk levels"
+)
+async def stream_risk_level_changes(
+    pharmacy_id: Optional[List[int]] = Query(None)
+):
+    """
+    Subscribe to risk level changes (Server-Sent Events).
+    
+    - **pharmacy_id**: Only changes for these pharmacies; repeat for several (optional)
+    
+    Every stock change that moves an item between NORMAL, LOW, WARNING
+    and CRITICAL (or scores a new item) is pushed as a
+    `risk_level_changed` event with `previous_level` and the new
+    `risk_level`, `risk_score`, `quantity` and `days_of_cover`.
+    
+    A slow client loses the oldest buffered events rather than holding
+    up writers; a `dropped` event with the count then tells it to
+    resync from `GET /inventory/shortage-risks`.
+    """
+    return sse_response(risk_event_stream(risk_events, pharmacy_id))
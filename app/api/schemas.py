@@ -1,10 +1,27 @@
 # defined a request model for the API using Pydantic's BaseModel. This model will be used to validate incoming data for shortage predictions.
-from pydantic import BaseModel
+from typing import List, Optional
 
+from pydantic import BaseModel, Field
+
+# Inventory pair to score; features are assembled server-side from the DB.
 class ShortageRequest(BaseModel):
-    quantity: int
-    stock_change: int
-    is_low_stock: int
-    medication_freq: int
     pharmacy_id: int
     medication_id: int
+
+
+class ShortageBatchRequest(BaseModel):
+    items: List[ShortageRequest] = Field(..., min_length=1, max_length=10000)
+
+
+class ShortagePrediction(BaseModel):
+    pharmacy_id: int
+    medication_id: int
+    shortage_pred: Optional[int] = None
+    shortage_proba: Optional[float] = None
+    error: Optional[str] = None  # set when the pair has no inventory row
+
+
+class ShortageBatchResponse(BaseModel):
+    model_version: str
+    count: int
+    predictions: List[ShortagePrediction]
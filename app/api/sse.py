@@ -0,0 +1,64 @@
+"""
+Server-Sent Events streaming for the risk level event endpoint.
+
+Each RiskLevelChange is one `risk_level_changed` event with the change as
+JSON data. A comment line is sent every heartbeat_seconds while idle, so
+proxies keep the connection open and a closed client is noticed. When the
+subscription dropped events (slow client, see app/services/risk_events.py)
+a `dropped` event with the count precedes the next change; clients should
+then resync from GET /inventory/shortage-risks.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+
+from fastapi.responses import StreamingResponse
+
+from app.services.risk_events import RiskEventBroker
+
+SSE_MEDIA_TYPE = "text/event-stream"
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+
+def format_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def risk_event_stream(
+    broker: RiskEventBroker,
+    pharmacy_ids: Optional[Iterable[int]] = None,
+    heartbeat_seconds: float = SSE_HEARTBEAT_SECONDS,
+) -> AsyncIterator[str]:
+    """
+    Subscribe and stream the events until the client goes away.
+
+    The subscription lives exactly as long as the generator runs.
+    """
+    subscription = broker.subscribe(pharmacy_ids)
+    try:
+        # Sent at once so the client knows it is subscribed
+        yield ": subscribed\n\n"
+        reported = 0
+        while True:
+            try:
+                change = await asyncio.wait_for(subscription.get(), heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if subscription.dropped > reported:
+                yield format_event("dropped", {"count": subscription.dropped - reported})
+                reported = subscription.dropped
+            yield format_event("risk_level_changed", change.to_dict())
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def sse_response(stream: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        stream,
+        media_type=SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
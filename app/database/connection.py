@@ -1,11 +1,20 @@
 import os
+from typing import Any, Dict, Optional
+
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.engine import Engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Connection, Engine, URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, SessionTransaction, sessionmaker, declarative_base
+
+from app.database.pool import PoolSettings, TimedAsyncAdaptedQueuePool, TimedQueuePool
 
 load_dotenv()
 
+# Session.info key holding a per-request statement timeout (ms), see session.py
+STATEMENT_TIMEOUT_KEY = "statement_timeout_ms"
+
+
 def get_database_url() -> str:
     url = os.getenv("DATABASE_URL")
     if not url:
@@ -16,13 +25,93 @@ def get_database_url() -> str:
     return url
 
 
-def create_db_engine() -> Engine:
-    echo = os.getenv("DB_ECHO", "false").lower() in {"1", "true", "yes", "y"}
+def get_async_database_url() -> str:
+    """
+    DATABASE_URL with an async driver.
+
+    postgresql+psycopg is used as-is (psycopg 3 has a native async mode);
+    sqlite is switched to aiosqlite for local runs and tests.
+    """
+    url = make_url(get_database_url())
+    if url.drivername in {"postgresql", "postgresql+psycopg2"}:
+        url = url.set(drivername="postgresql+psycopg")
+    elif url.drivername in {"sqlite", "sqlite+pysqlite"}:
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url.render_as_string(hide_password=False)
+
+
+def _echo_enabled() -> bool:
+    return os.getenv("DB_ECHO", "false").lower() in {"1", "true", "yes", "y"}
+
+
+def engine_options(url: URL, settings: PoolSettings, *, is_async: bool = False) -> Dict[str, Any]:
+    """
+    create_engine kwargs for url.
+
+    sqlite picks its own pool class (SingletonThreadPool / NullPool /
+    QueuePool depending on the URL), so pool settings only apply to
+    server databases.
+    """
     # pool_pre_ping helps avoid stale connections
-    return create_engine(get_database_url(), echo=echo, pool_pre_ping=True)
+    options: Dict[str, Any] = {"echo": _echo_enabled(), "pool_pre_ping": True}
+
+    if url.get_backend_name() == "sqlite":
+        return options
+
+    options.update(
+        poolclass=TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+        pool_recycle=settings.pool_recycle,
+    )
+
+    if url.get_backend_name() == "postgresql":
+        connect_args: Dict[str, Any] = {}
+        if settings.statement_timeout_ms:
+            # Server-side default for every statement; no extra round trip
+            connect_args["options"] = f"-c statement_timeout={settings.statement_timeout_ms}"
+        if url.get_driver_name() == "psycopg":
+            connect_args["prepare_threshold"] = settings.prepare_threshold
+        options["connect_args"] = connect_args
+
+    return options
+
+
+def create_db_engine(settings: Optional[PoolSettings] = None) -> Engine:
+    settings = settings or PoolSettings.from_env()
+    url = make_url(get_database_url())
+    return create_engine(url, **engine_options(url, settings))
+
+
+def create_async_db_engine(settings: Optional[PoolSettings] = None) -> AsyncEngine:
+    settings = settings or PoolSettings.from_env()
+    url = make_url(get_async_database_url())
+    return create_async_engine(url, **engine_options(url, settings, is_async=True))
+
+
+@event.listens_for(Session, "after_begin")
+def _apply_statement_timeout(
+    session: Session, transaction: SessionTransaction, connection: Connection
+) -> None:
+    """
+    Per-request statement timeout: SET LOCAL at the start of every
+    transaction of a session that asked for one, so it also survives the
+    commits services do mid-request.
+    """
+    timeout_ms = session.info.get(STATEMENT_TIMEOUT_KEY)
+    if timeout_ms is None or connection.dialect.name != "postgresql":
+        return
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
 
 
 engine = create_db_engine()
+async_engine = create_async_db_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+)
+Base = declarative_base()
@@ -0,0 +1,160 @@
+"""
+Connection pool settings (from the environment) and pool metrics.
+
+Environment variables (PostgreSQL only; sqlite URLs keep SQLAlchemy's
+defaults):
+
+  DB_POOL_SIZE             persistent connections per engine      (5)
+  DB_MAX_OVERFLOW          extra connections allowed under bursts (10)
+  DB_POOL_TIMEOUT          seconds to wait for a free connection  (30)
+  DB_POOL_RECYCLE          seconds before a connection is renewed (1800)
+  DB_STATEMENT_TIMEOUT_MS  default per-statement timeout, 0 = off (30000)
+  DB_PREPARE_THRESHOLD     psycopg server-side prepare threshold;
+                           "none" disables prepared statements, e.g.
+                           behind PgBouncer in transaction mode    (5)
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise RuntimeError(f"{name} must be an integer, got {value!r}")
+
+
+def _env_optional_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.getenv(name)
+    if value is not None and value.strip().lower() in {"none", "off", "disable"}:
+        return None
+    if default is None and not value:
+        return None
+    return _env_int(name, default or 0)
+
+
+@dataclass(frozen=True)
+class PoolSettings:
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: int = 30
+    pool_recycle: int = 1800
+    statement_timeout_ms: int = 30000
+    prepare_threshold: Optional[int] = 5
+
+    @classmethod
+    def from_env(cls) -> "PoolSettings":
+        return cls(
+            pool_size=_env_int("DB_POOL_SIZE", cls.pool_size),
+            max_overflow=_env_int("DB_MAX_OVERFLOW", cls.max_overflow),
+            pool_timeout=_env_int("DB_POOL_TIMEOUT", cls.pool_timeout),
+            pool_recycle=_env_int("DB_POOL_RECYCLE", cls.pool_recycle),
+            statement_timeout_ms=_env_int(
+                "DB_STATEMENT_TIMEOUT_MS", cls.statement_timeout_ms
+            ),
+            prepare_threshold=_env_optional_int(
+                "DB_PREPARE_THRESHOLD", cls.prepare_threshold
+            ),
+        )
+
+
+class PoolWaitStats:
+    """
+    How long checkouts waited for a connection (thread-safe counters).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, seconds: float, *, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait / attempts * 1000, 3) if attempts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+
+class _WaitTimingMixin:
+    """Times every checkout that has to go through the pool queue."""
+
+    wait_stats: PoolWaitStats
+
+    def _do_get(self):  # type: ignore[override]
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()  # type: ignore[misc]
+        except PoolTimeoutError:
+            self.wait_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - start)
+        return conn
+
+    def recreate(self):  # type: ignore[override]
+        pool = super().recreate()  # type: ignore[misc]
+        pool.wait_stats = self.wait_stats
+        return pool
+
+
+class TimedQueuePool(_WaitTimingMixin, QueuePool):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+
+class TimedAsyncAdaptedQueuePool(_WaitTimingMixin, AsyncAdaptedQueuePool):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+
+def pool_status(engine: Engine) -> Dict[str, Any]:
+    """
+    Live pool numbers for the status endpoint.
+    """
+    pool = engine.pool
+    status: Dict[str, Any] = {"pool_class": type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        status.update(
+            {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+            }
+        )
+
+    wait_stats = getattr(pool, "wait_stats", None)
+    if wait_stats is not None:
+        status["wait"] = wait_stats.to_dict()
+
+    return status
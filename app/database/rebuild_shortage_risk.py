@@ -0,0 +1,47 @@
+"""
+Rebuild the shortage_risk table from Inventory.
+
+Usage (inside container):
+  python -m app.database.rebuild_shortage_risk
+
+Notes:
+- InventoryService keeps shortage_risk up to date on every change; run this
+  after writing Inventory directly (seeds, imports, manual SQL), after
+  changing the risk thresholds or SHORTAGE_RISK_MODE, or to backfill an
+  existing database.
+- Scoring is a single INSERT ... SELECT in the database, joined with
+  usage_features for days_of_cover. Pairs whose risk level did not change
+  keep their level_changed_at.
+"""
+
+from __future__ import annotations
+
+from app.database.connection import SessionLocal, engine
+from app.database.utils import add_missing_columns
+from app.models.db_models import Base, ShortageRisk
+from app.services.shortage_service import ShortageService
+
+
+def main() -> None:
+    # Create the table (and newer columns) on databases that predate it
+    Base.metadata.create_all(bind=engine, tables=[ShortageRisk.__table__])
+    add_missing_columns(engine, ShortageRisk.__table__)
+
+    db = SessionLocal()
+
+    try:
+        scored = ShortageService(db).rebuild_risk_table()
+        db.commit()
+
+    except Exception:
+        db.rollback()
+        raise
+
+    finally:
+        db.close()
+
+    print(f"✅ Rebuilt shortage_risk for {scored} inventory rows")
+
+
+if __name__ == "__main__":
+    main()
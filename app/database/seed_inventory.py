@@ -7,6 +7,7 @@ Usage (inside container):
 Notes:
 - This inserts StockHistory rows for ML/testing.
 - It ALSO upserts Inventory so the current stock exists (required for training).
+- shortage_risk is rebuilt afterwards so the risk endpoints see the new stock.
 """
 
 from __future__ import annotations
@@ -16,6 +17,7 @@ from random import Random
 
 from app.database.connection import SessionLocal
 from app.models.db_models import Inventory, StockHistory
+from app.services.shortage_service import ShortageService
 
 
 def upsert_inventory(
@@ -103,6 +105,10 @@ def main() -> None:
             )
 
         db.add_all(history_rows)
+        db.flush()
+
+        # Inventory was written directly, so rescore shortage_risk
+        ShortageService(db).rebuild_risk_table()
         db.commit()
 
     finally:
@@ -1,7 +1,7 @@
-from sqlalchemy.orm import sessionmaker
-from app.database.connection import engine
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+from app.database.connection import AsyncSessionLocal, SessionLocal, STATEMENT_TIMEOUT_KEY
 
 
 def get_db():
@@ -14,3 +14,27 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """
+    Async FastAPI dependency: yields an AsyncSession so route handlers await
+    database I/O instead of blocking the event loop.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_async_db_with_timeout(timeout_ms: int):
+    """
+    Dependency factory: an AsyncSession whose statements may run for
+    timeout_ms instead of the DB_STATEMENT_TIMEOUT_MS default.
+
+    Applied with SET LOCAL on each transaction (PostgreSQL only).
+    """
+
+    async def dependency(db: AsyncSession = Depends(get_async_db)) -> AsyncSession:
+        db.sync_session.info[STATEMENT_TIMEOUT_KEY] = timeout_ms
+        return db
+
+    return dependency
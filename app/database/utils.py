@@ -1,9 +1,17 @@
 from __future__ import annotations
 
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import Table, inspect, select, text
 
-from app.models.db_models import Pharmacy, Medication, Inventory, StockHistory
+from app.models.db_models import (
+    CREATED_REASON,
+    Inventory,
+    InventoryVersion,
+    Medication,
+    Pharmacy,
+    StockHistory,
+)
 
 
 # ---------- Generic helper ----------
@@ -14,6 +22,30 @@ def add_and_commit(db: Session, obj):
     return obj
 
 
+# ---------- Schema ----------
+def add_missing_columns(engine: Engine, table: Table) -> list[str]:
+    """
+    ALTER TABLE ... ADD COLUMN for model columns an existing table lacks
+    (create_all only creates missing tables). New NOT NULL columns need a
+    server_default. Returns the names of the added columns.
+    """
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    added = []
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+            ddl += column.type.compile(dialect=engine.dialect)
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            if not column.nullable:
+                ddl += " NOT NULL"
+            conn.execute(text(ddl))
+            added.append(column.name)
+    return added
+
+
 # ---------- Pharmacy ----------
 def create_pharmacy(db: Session, name: str, address: str | None = None) -> Pharmacy:
     return add_and_commit(db, Pharmacy(name=name, address=address))
@@ -48,6 +80,29 @@ def get_inventory_row(db: Session, pharmacy_id: int, medication_id: int) -> Inve
     return db.scalars(stmt).first()
 
 
+def bump_inventory_version(db: Session, pharmacy_id: int) -> None:
+    """
+    Increment the pharmacy's inventory_versions row (the ETag / cache
+    version marker) in the caller's transaction, creating it at 1.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise ValueError(f"Inventory versions are not supported for {dialect!r}")
+
+    table = InventoryVersion.__table__
+    stmt = dialect_insert(table).values(pharmacy_id=pharmacy_id, version=1)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[table.c.pharmacy_id],
+            set_={"version": table.c.version + 1},
+        )
+    )
+
+
 def upsert_inventory_quantity(
     db: Session,
     pharmacy_id: int,
@@ -57,7 +112,8 @@ def upsert_inventory_quantity(
 ) -> Inventory:
     """
     Creates inventory row if missing; otherwise updates quantity.
-    Writes StockHistory each change.
+    Writes StockHistory each change (reason CREATED_REASON for a new row)
+    and bumps the pharmacy's inventory version in the same transaction.
     """
     if new_quantity < 0:
         raise ValueError("new_quantity cannot be negative")
@@ -79,15 +135,17 @@ def upsert_inventory_quantity(
                 medication_id=medication_id,
                 old_quantity=0,
                 new_quantity=new_quantity,
-                reason=reason,
+                reason=CREATED_REASON,
             )
         )
+        bump_inventory_version(db, pharmacy_id)
         db.commit()
         db.refresh(row)
         return row
 
     old = row.quantity
     row.quantity = new_quantity
+    db.flush()  # inventory before history (see UsageFeatureStore)
 
     db.add(
         StockHistory(
@@ -98,6 +156,7 @@ def upsert_inventory_quantity(
             reason=reason,
         )
     )
+    bump_inventory_version(db, pharmacy_id)
     db.commit()
     db.refresh(row)
     return row
@@ -1,19 +1,32 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+import asyncio
 import logging
+import os
 
 from app.api import health_check, routes
-from app.database.connection import engine
-from app.models.db_models import Base
+from app.database.connection import SessionLocal, async_engine, engine
+from app.database.utils import add_missing_columns
+from app.models.db_models import Base, UsageDaily
 
-from fastapi import HTTPException
-from app.api.schemas import ShortageRequest  # import schema
+from fastapi import Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.schemas import (  # import schema
+    ShortageRequest,
+    ShortageBatchRequest,
+    ShortageBatchResponse,
+)
 
 from pydantic import BaseModel
-from app.ml.predict import predict_shortage
-from xml.parsers.expat import model
-from app.ml.train_model import train_model
+from app.database.session import get_async_db
+from app.ml.feature_store import CatchUpResult, UsageFeatureStore
+from app.ml.features import feature_assembler
+from app.ml.predict import predict_shortage, predict_shortage_frame
+from app.ml.retrain import retrain_manager
+from app.services.risk_events import risk_events
+from app.services.shortage_service import ShortageService
 
 
 # Configure logging
@@ -23,6 +36,43 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# How often the usage feature store folds in new stock history (0 = never)
+USAGE_FEATURES_REFRESH_SECONDS = int(os.getenv("USAGE_FEATURES_REFRESH_SECONDS", "60"))
+
+
+def catch_up_usage() -> CatchUpResult:
+    """
+    Fold new stock history into usage_features, then rescore the pairs it
+    touched so shortage_risk.days_of_cover follows the new usage. Cached
+    reports and risk pages are keyed by the watermark, so they are
+    recomputed too.
+    """
+    def rescore(result: CatchUpResult) -> None:
+        if result.rows:
+            ShortageService(db).rescore_history_range(
+                result.from_history_id, result.to_history_id
+            )
+
+    db = SessionLocal()
+    try:
+        # One transaction: the watermark (part of the risk ETags) never
+        # moves ahead of the rescored rows
+        return UsageFeatureStore(db).catch_up(before_commit=rescore)
+    finally:
+        db.close()
+
+
+async def refresh_usage_features(interval: int) -> None:
+    """Keep usage_features (and the risk scores derived from it) current."""
+    while True:
+        try:
+            result = await asyncio.to_thread(catch_up_usage)
+            if result.rows:
+                logger.info(f"Usage features: folded in {result.rows} history rows")
+        except Exception as e:
+            logger.warning(f"Usage feature refresh failed: {str(e)}")
+        await asyncio.sleep(interval)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -37,11 +87,22 @@ async def lifespan(app: FastAPI):
         # Create database tables if they don't exist
         logger.info("Initializing database tables...")
         Base.metadata.create_all(bind=engine)
+        # usage_daily gained rollup columns; backfill with feature_store --rebuild
+        add_missing_columns(engine, UsageDaily.__table__)
         logger.info("Database tables initialized successfully")
     except Exception as e:
         logger.error(f"Database initialization failed: {str(e)}")
         # Don't prevent startup, as tables might already exist
     
+    # Relays risk level events from other workers (RISK_EVENTS_BACKEND=postgres)
+    risk_events_task = asyncio.create_task(risk_events.run())
+    
+    refresh_task = None
+    if USAGE_FEATURES_REFRESH_SECONDS > 0:
+        refresh_task = asyncio.create_task(
+            refresh_usage_features(USAGE_FEATURES_REFRESH_SECONDS)
+        )
+    
     # Log service availability
     logger.info("Inventory Service: Ready")
     logger.info("Shortage Service: Ready")
@@ -54,6 +115,15 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down Pharmacy Shortage Prediction API...")
+    if refresh_task is not None:
+        refresh_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await refresh_task
+    risk_events_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await risk_events_task
+    retrain_manager.shutdown()
+    await async_engine.dispose()
     logger.info("Cleanup complete")
 
 
@@ -127,30 +197,121 @@ if __name__ == "__main__":
     )
 
 
+async def _score_pairs(db: AsyncSession, pairs):
+    """Assemble features for pairs from the DB, then score them off the event loop."""
+    assembled = await db.run_sync(lambda session: feature_assembler.assemble(session, pairs))
+    result = await run_in_threadpool(predict_shortage_frame, assembled.frame)
+    return assembled, result
+
+
 @app.post("/api/v1/inventory/shortage-risk")
-async def shortage_risk(request: ShortageRequest):
+async def shortage_risk(
+    request: ShortageRequest,
+    db: AsyncSession = Depends(get_async_db),
+):
     """
     Calculate the shortage risk probability for a given inventory item.
+
+    Features are built server-side from current inventory and stock history.
     """
+    pair = (request.pharmacy_id, request.medication_id)
     try:
-        features = request.dict()
-        probability = predict_shortage(features)
-        # If model not loaded, inform user
-        if probability == 0.0 and model is None:
-            raise HTTPException(
-                status_code=503,
-                detail="ML model not loaded yet. Train the model first."
-            )
-        return {"shortage_risk_probability": round(probability, 4)}
+        assembled, result = await _score_pairs(db, [pair])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
+
+    # If model not loaded, inform user
+    if not result["available"]:
+        raise HTTPException(
+            status_code=503,
+            detail="ML model not loaded yet. Train the model first."
+        )
+    if assembled.missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Inventory item not found for pharmacy {pair[0]}, medication {pair[1]}"
+        )
+    # None when the model has no predict_proba, as in the batch endpoint
+    proba = result["predictions"][0]["shortage_proba"]
+    return {"shortage_risk_probability": None if proba is None else round(proba, 4)}
+
+
+@app.post(
+    "/api/v1/inventory/shortage-risk/batch",
+    response_model=ShortageBatchResponse,
+)
+async def shortage_risk_batch(
+    request: ShortageBatchRequest,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Score many inventory items in one vectorized model call.
+
+    Features are built server-side for each (pharmacy_id, medication_id).
+    Predictions are returned in the same order as `items`; pairs with no
+    inventory row get an `error` instead of a prediction.
+    """
+    pairs = [(item.pharmacy_id, item.medication_id) for item in request.items]
+
+    try:
+        assembled, result = await _score_pairs(db, pairs)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not result["available"]:
+        raise HTTPException(
+            status_code=503,
+            detail="ML model not loaded yet. Train the model first."
+        )
+
+    scored = iter(result["predictions"])
+    missing = set(assembled.missing)
+
+    return {
+        "model_version": result["model_version"],
+        "count": len(pairs),
+        "predictions": [
+            {
+                "pharmacy_id": pharmacy_id,
+                "medication_id": medication_id,
+                **(
+                    {"error": "inventory item not found"}
+                    if (pharmacy_id, medication_id) in missing
+                    else next(scored)
+                ),
+            }
+            for pharmacy_id, medication_id in pairs
+        ],
+    }
+
 
 
 @app.get("/predict/{drug_id}")
 def predict(drug_id: int):
     return predict_shortage(drug_id)
 
-@app.post("/retrain-model")
+@app.post("/retrain-model", status_code=202)
 def retrain():
-    return train_model()
\ No newline at end of file
+    """
+    Start retraining the shortage model in the background.
+
+    Returns the job right away; poll /retrain-model/jobs/{job_id}. While a
+    job is running, further calls return that job (deduplicated=true).
+    """
+    job, created = retrain_manager.submit()
+    return {**job.to_dict(), "deduplicated": not created}
+
+
+@app.get("/retrain-model/jobs")
+def retrain_jobs():
+    """Recent retraining jobs, newest first."""
+    return [job.to_dict() for job in retrain_manager.jobs()]
+
+
+@app.get("/retrain-model/jobs/{job_id}")
+def retrain_job(job_id: str):
+    """Status and progress of one retraining job."""
+    job = retrain_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Retrain job {job_id} not found")
+    return job.to_dict()
@@ -1,59 +1,111 @@
+from sqlalchemy import Select, func, select
 from sqlalchemy.orm import Session
 from app.models.db_models import Inventory, StockHistory
 import pandas as pd
 
 MIN_ROWS_REQUIRED = 50  # adjust as needed
 
+COLUMNS = ["pharmacy_id", "medication_id", "quantity", "old_quantity", "new_quantity", "changed_at"]
+
+
+def latest_history_subquery():
+    """
+    Latest StockHistory row per pharmacy × medication.
+
+    ROW_NUMBER() over each pair (newest changed_at first, id breaking ties)
+    is computed by the database in one pass over stock_history; works on
+    PostgreSQL and SQLite >= 3.25.
+    """
+    rn = func.row_number().over(
+        partition_by=(StockHistory.pharmacy_id, StockHistory.medication_id),
+        order_by=(StockHistory.changed_at.desc(), StockHistory.id.desc()),
+    ).label("rn")
+
+    ranked = select(
+        StockHistory.pharmacy_id,
+        StockHistory.medication_id,
+        StockHistory.old_quantity,
+        StockHistory.new_quantity,
+        StockHistory.changed_at,
+        rn,
+    ).subquery("ranked_history")
+
+    return (
+        select(
+            ranked.c.pharmacy_id,
+            ranked.c.medication_id,
+            ranked.c.old_quantity,
+            ranked.c.new_quantity,
+            ranked.c.changed_at,
+        )
+        .where(ranked.c.rn == 1)
+        .subquery("latest_history")
+    )
+
+
+def inventory_dataset_statement() -> Select:
+    """
+    Inventory rows joined to their latest history row (if any).
+
+    Pairs without history keep their current quantity as old/new quantity
+    and a NULL changed_at.
+    """
+    latest = latest_history_subquery()
+
+    return (
+        select(
+            Inventory.pharmacy_id,
+            Inventory.medication_id,
+            Inventory.quantity,
+            func.coalesce(latest.c.old_quantity, Inventory.quantity).label("old_quantity"),
+            func.coalesce(latest.c.new_quantity, Inventory.quantity).label("new_quantity"),
+            latest.c.changed_at,
+        )
+        .outerjoin(
+            latest,
+            (latest.c.pharmacy_id == Inventory.pharmacy_id)
+            & (latest.c.medication_id == Inventory.medication_id),
+        )
+        .order_by(Inventory.pharmacy_id, Inventory.medication_id)
+    )
+
+
+def history_dataset_statement() -> Select:
+    """
+    Latest history row per pair, with quantity = new_quantity.
+    """
+    latest = latest_history_subquery()
+
+    return select(
+        latest.c.pharmacy_id,
+        latest.c.medication_id,
+        latest.c.new_quantity.label("quantity"),
+        latest.c.old_quantity,
+        latest.c.new_quantity,
+        latest.c.changed_at,
+    ).order_by(latest.c.pharmacy_id, latest.c.medication_id)
+
+
+def _to_frame(db: Session, stmt: Select) -> pd.DataFrame:
+    rows = db.execute(stmt).all()
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
 def load_inventory_dataset(db: Session):
-    # Query inventory
-    inventory_records = db.query(Inventory).all()
-    stock_history_records = db.query(StockHistory).all()
+    """
+    One row per pair: current quantity plus the latest stock change.
 
-    columns = ["pharmacy_id", "medication_id", "quantity", "old_quantity", "new_quantity", "changed_at"]
+    The "latest history row" lookup is a window function in SQL, so the
+    cost is linear in inventory + history rows and only plain columns (no
+    ORM objects) are transferred.
+    """
+    inventory_count = db.scalar(select(func.count()).select_from(Inventory)) or 0
 
-    if not inventory_records or len(inventory_records) < MIN_ROWS_REQUIRED:
-        print(f"Not enough inventory rows ({len(inventory_records)}), creating dataset from stock history")
+    if inventory_count < MIN_ROWS_REQUIRED:
+        print(f"Not enough inventory rows ({inventory_count}), creating dataset from stock history")
 
         # Use latest stock_history per pharmacy × medication
-        data = []
-        df_history = pd.DataFrame([{
-            "pharmacy_id": r.pharmacy_id,
-            "medication_id": r.medication_id,
-            "old_quantity": r.old_quantity,
-            "new_quantity": r.new_quantity,
-            "changed_at": r.changed_at
-        } for r in stock_history_records])
-
-        if not df_history.empty:
-            latest_df = df_history.sort_values("changed_at").groupby(
-                ["pharmacy_id", "medication_id"], as_index=False
-            ).last()
-
-            latest_df["quantity"] = latest_df["new_quantity"]
-            return latest_df[columns]
-        else:
-            return pd.DataFrame(columns=columns)
+        return _to_frame(db, history_dataset_statement())
 
     # Normal inventory + stock history merge
-    data = []
-    for r in inventory_records:
-        # Get latest stock_history for this pharmacy × medication
-        history = [h for h in stock_history_records if h.pharmacy_id == r.pharmacy_id and h.medication_id == r.medication_id]
-        if history:
-            latest = max(history, key=lambda x: x.changed_at)
-            old_q = latest.old_quantity
-            new_q = latest.new_quantity
-        else:
-            old_q = r.quantity
-            new_q = r.quantity
-
-        data.append({
-            "pharmacy_id": r.pharmacy_id,
-            "medication_id": r.medication_id,
-            "quantity": r.quantity,
-            "old_quantity": old_q,
-            "new_quantity": new_q,
-            "changed_at": latest.changed_at if history else None
-        })
-
-    return pd.DataFrame(data, columns=columns)
+    return _to_frame(db, inventory_dataset_statement())
@@ -0,0 +1,176 @@
+"""
+Columnar, chunked extraction of training data.
+
+Query results are streamed in chunks (yield_per, i.e. a server-side cursor
+on PostgreSQL) and each chunk is converted straight into typed numpy
+columns, so no ORM objects or per-row dicts are built and peak memory is
+the typed columns plus one chunk of raw rows.
+
+Usage aggregates (count, sum of decreases, first/last change) can be
+computed by the database with GROUP BY, so StockHistory never has to be
+loaded in full to build usage features.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Mapping
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Select, case, func, select
+from sqlalchemy.orm import Session
+
+from app.models.db_models import Inventory, StockHistory
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+INVENTORY_DTYPES: Dict[str, np.dtype] = {
+    "inventory_id": np.dtype("int32"),
+    "pharmacy_id": np.dtype("int32"),
+    "medication_id": np.dtype("int32"),
+    "quantity": np.dtype("int32"),
+}
+
+STOCK_HISTORY_DTYPES: Dict[str, np.dtype] = {
+    "pharmacy_id": np.dtype("int32"),
+    "medication_id": np.dtype("int32"),
+    "old_quantity": np.dtype("int32"),
+    "new_quantity": np.dtype("int32"),
+    "changed_at": np.dtype("datetime64[ns]"),
+    "reason": np.dtype("object"),
+}
+
+USAGE_AGGREGATE_DTYPES: Dict[str, np.dtype] = {
+    "pharmacy_id": np.dtype("int32"),
+    "medication_id": np.dtype("int32"),
+    "history_points": np.dtype("int32"),
+    "total_decrease": np.dtype("int64"),
+    "first_change": np.dtype("datetime64[ns]"),
+    "last_change": np.dtype("datetime64[ns]"),
+}
+
+
+def read_columns(
+    db: Session,
+    stmt: Select,
+    dtypes: Mapping[str, np.dtype],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> pd.DataFrame:
+    """
+    Execute stmt and build a DataFrame with one typed array per column.
+
+    stmt must select exactly the columns in dtypes, in that order.
+    """
+    names = list(dtypes)
+    parts: Dict[str, List[np.ndarray]] = {name: [] for name in names}
+
+    result = db.execute(stmt.execution_options(yield_per=chunk_size))
+    for chunk in result.partitions():
+        for name, values in zip(names, zip(*chunk)):
+            parts[name].append(np.asarray(values, dtype=dtypes[name]))
+
+    columns = {
+        name: (
+            np.concatenate(parts[name]) if parts[name]
+            else np.empty(0, dtype=dtypes[name])
+        )
+        for name in names
+    }
+    return pd.DataFrame(columns, copy=False)
+
+
+def to_utc(df: pd.DataFrame, *names: str) -> pd.DataFrame:
+    """Timestamps are stored as naive UTC; make them tz-aware."""
+    for name in names:
+        df[name] = df[name].dt.tz_localize("UTC")
+    return df
+
+
+def inventory_statement() -> Select:
+    return select(
+        Inventory.id,
+        Inventory.pharmacy_id,
+        Inventory.medication_id,
+        Inventory.quantity,
+    )
+
+
+def stock_history_statement() -> Select:
+    return select(
+        StockHistory.pharmacy_id,
+        StockHistory.medication_id,
+        StockHistory.old_quantity,
+        StockHistory.new_quantity,
+        StockHistory.changed_at,
+        StockHistory.reason,
+    )
+
+
+def history_decrease_expr():
+    """max(0, old_quantity - new_quantity) for a StockHistory row."""
+    return case(
+        (
+            StockHistory.old_quantity > StockHistory.new_quantity,
+            StockHistory.old_quantity - StockHistory.new_quantity,
+        ),
+        else_=0,
+    )
+
+
+def history_increase_expr():
+    """max(0, new_quantity - old_quantity) for a StockHistory row."""
+    return case(
+        (
+            StockHistory.new_quantity > StockHistory.old_quantity,
+            StockHistory.new_quantity - StockHistory.old_quantity,
+        ),
+        else_=0,
+    )
+
+
+def usage_aggregates_statement() -> Select:
+    """
+    Per-pair aggregates used by usage features:
+    history_points, total_decrease (sum of max(0, old - new)),
+    first_change and last_change.
+    """
+    decrease = history_decrease_expr()
+
+    return select(
+        StockHistory.pharmacy_id,
+        StockHistory.medication_id,
+        func.count().label("history_points"),
+        func.coalesce(func.sum(decrease), 0).label("total_decrease"),
+        func.min(StockHistory.changed_at).label("first_change"),
+        func.max(StockHistory.changed_at).label("last_change"),
+    ).group_by(StockHistory.pharmacy_id, StockHistory.medication_id)
+
+
+def load_inventory_columns(
+    db: Session,
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> pd.DataFrame:
+    return read_columns(db, inventory_statement(), INVENTORY_DTYPES, chunk_size=chunk_size)
+
+
+def load_stock_history_columns(
+    db: Session,
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> pd.DataFrame:
+    df = read_columns(
+        db, stock_history_statement(), STOCK_HISTORY_DTYPES, chunk_size=chunk_size
+    )
+    return to_utc(df, "changed_at")
+
+
+def load_usage_aggregates(
+    db: Session,
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> pd.DataFrame:
+    df = read_columns(
+        db, usage_aggregates_statement(), USAGE_AGGREGATE_DTYPES, chunk_size=chunk_size
+    )
+    return to_utc(df, "first_change", "last_change")
@@ -0,0 +1,573 @@
+"""
+Incremental usage-feature store and daily stock rollups.
+
+usage_features keeps per-pair aggregates over StockHistory (history_points,
+total_decrease, first_change, last_change) and usage_daily keeps per-pair,
+per-day buckets (units consumed and received, stockouts, end-of-day
+quantity) for rolling windows. pharmacy_daily rolls the same day up per
+pharmacy, plus crossings of the low stock threshold (including pairs
+created below it), for report trends.
+catch_up() folds in only the history rows past the "usage_features"
+watermark, so a run costs O(new rows), and reading features costs
+O(pairs) - the same rows for training and online scoring.
+
+Usage (inside container):
+  python -m app.ml.feature_store            # fold in new history rows
+  python -m app.ml.feature_store --rebuild  # recompute from scratch
+
+Notes:
+- StockHistory is treated as append-only; deleting or editing history
+  rows needs a --rebuild. So do existing databases after the rollup
+  columns were added, and a change of LOW_THRESHOLD.
+- Ids are drawn in insert order but committed in any order, so the
+  watermark only moves to an id below which every row is committed or
+  rolled back (see _committed_history_bound). On PostgreSQL catch_up()
+  waits for the write transactions in flight at its snapshot to end,
+  without locking stock_history: writers are never blocked by it. A run
+  that cannot prove a bound within WRITER_WAIT_SECONDS folds nothing.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import (
+    BigInteger,
+    Date,
+    Integer,
+    Select,
+    and_,
+    case,
+    cast,
+    delete,
+    func,
+    literal_column,
+    or_,
+    select,
+    text,
+    true,
+    tuple_,
+)
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.ml.extract import (
+    DEFAULT_CHUNK_SIZE,
+    history_decrease_expr,
+    history_increase_expr,
+    read_columns,
+    to_utc,
+)
+from app.models.db_models import (
+    CREATED_REASON,
+    FeatureWatermark,
+    PharmacyDaily,
+    StockHistory,
+    UsageDaily,
+    UsageFeatures,
+)
+from app.services.shortage_service import LOW_THRESHOLD
+
+WATERMARK_NAME = "usage_features"
+
+# Rolling usage windows (days) returned as usage_<n>d
+ROLLING_WINDOWS = (7, 30)
+
+# History ids folded per statement
+CATCH_UP_BATCH = 100_000
+
+# How long a PostgreSQL catch-up waits for in-flight history writers
+WRITER_WAIT_SECONDS = 5.0
+WRITER_POLL_SECONDS = 0.05
+
+FEATURE_DTYPES: Dict[str, np.dtype] = {
+    "pharmacy_id": np.dtype("int32"),
+    "medication_id": np.dtype("int32"),
+    "history_points": np.dtype("int32"),
+    "total_decrease": np.dtype("int64"),
+    "first_change": np.dtype("datetime64[ns]"),
+    "last_change": np.dtype("datetime64[ns]"),
+    **{f"usage_{days}d": np.dtype("int64") for days in ROLLING_WINDOWS},
+}
+
+
+def shortage_entry_expr() -> Any:
+    """
+    True for a stock_history row that puts its pair on the low stock list
+    (quantity <= LOW_THRESHOLD): pharmacy_daily.shortage_entries. A
+    created pair enters if it starts there.
+    """
+    old, new = StockHistory.old_quantity, StockHistory.new_quantity
+    created = func.coalesce(StockHistory.reason == CREATED_REASON, False)
+    return and_(new <= LOW_THRESHOLD, or_(created, old > LOW_THRESHOLD))
+
+
+def shortage_exit_expr() -> Any:
+    """
+    True for a stock_history row that takes its pair off the low stock
+    list: pharmacy_daily.shortage_exits. A creation never exits (its
+    old_quantity 0 is no stock level).
+    """
+    old, new = StockHistory.old_quantity, StockHistory.new_quantity
+    created = func.coalesce(StockHistory.reason == CREATED_REASON, False)
+    return and_(~created, old <= LOW_THRESHOLD, new > LOW_THRESHOLD)
+
+
+class FeatureStoreError(Exception):
+    """Raised when the feature store cannot be updated."""
+
+
+@dataclass(frozen=True)
+class CatchUpResult:
+    from_history_id: int  # exclusive
+    to_history_id: int    # inclusive; the new watermark
+    rows: int             # history rows folded in
+
+
+class UsageFeatureStore:
+    """
+    Reads and incrementally maintains usage_features / usage_daily.
+    """
+
+    def __init__(self, db: Session, *, batch_size: int = CATCH_UP_BATCH) -> None:
+        self.db = db
+        self.batch_size = batch_size
+
+    # ---------- helpers ----------
+
+    def _dialect(self) -> str:
+        return self.db.get_bind().dialect.name
+
+    def _insert(self, table: Any) -> Any:
+        dialect = self._dialect()
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            raise FeatureStoreError(
+                f"Feature store upserts are not supported for {dialect!r}"
+            )
+        return dialect_insert(table)
+
+    def _lock_watermark(self, skip_locked: bool = False) -> Optional[int]:
+        """
+        Current watermark, locked until commit (one catch-up at a time).
+
+        With skip_locked, None while another catch-up holds the lock.
+        """
+        stmt = self._insert(FeatureWatermark.__table__).values(
+            name=WATERMARK_NAME, last_history_id=0, updated_at=datetime.utcnow()
+        )
+        self.db.execute(stmt.on_conflict_do_nothing(index_elements=["name"]))
+
+        return self.db.execute(
+            select(FeatureWatermark.last_history_id)
+            .where(FeatureWatermark.name == WATERMARK_NAME)
+            .with_for_update(skip_locked=skip_locked)
+        ).scalar_one_or_none()
+
+    def _set_watermark(self, history_id: int) -> None:
+        self.db.execute(
+            FeatureWatermark.__table__.update()
+            .where(FeatureWatermark.name == WATERMARK_NAME)
+            .values(last_history_id=history_id, updated_at=datetime.utcnow())
+        )
+
+    def _committed_history_bound(self, watermark: int) -> int:
+        """
+        Largest StockHistory id at or below which every row is committed
+        or rolled back, so the watermark cannot skip a row that commits
+        later (watermark itself if none can be proven).
+
+        SQLite has one writer, and this transaction already holds the
+        write lock (_lock_watermark). On PostgreSQL, max(id) and the
+        snapshot are read in one statement; every writer has a
+        transaction id before it draws a history id (InventoryService
+        writes the inventory row first), so any transaction that can
+        still commit an id <= max(id) was in progress at that snapshot.
+        Waiting for those to end (polling pg_xact_status, no locks) makes
+        max(id) safe. Needs READ COMMITTED, so the fold then sees them.
+        """
+        latest = select(func.max(StockHistory.id)).scalar_subquery()
+        if self._dialect() != "postgresql":
+            return self.db.scalar(select(latest)) or watermark
+
+        row = self.db.execute(
+            select(
+                latest.label("latest"),
+                literal_column("pg_current_snapshot()::text").label("snapshot"),
+            )
+        ).one()
+        if row.latest is None or row.latest <= watermark:
+            return watermark
+
+        in_flight = text(
+            "SELECT count(*) FROM unnest(pg_snapshot_xip(CAST(:snapshot AS pg_snapshot))) AS x(xid) "
+            "WHERE pg_xact_status(x.xid) = 'in progress'"
+        )
+        deadline = time.monotonic() + WRITER_WAIT_SECONDS
+        while self.db.scalar(in_flight, {"snapshot": row.snapshot}):
+            if time.monotonic() >= deadline:
+                return watermark
+            time.sleep(WRITER_POLL_SECONDS)
+        return row.latest
+
+    def _fold(self, after_id: int, up_to_id: int) -> None:
+        """
+        Add history rows after_id < id <= up_to_id to every table.
+        """
+        in_range = (StockHistory.id > after_id) & (StockHistory.id <= up_to_id)
+        decrease = history_decrease_expr()
+        pair = (StockHistory.pharmacy_id, StockHistory.medication_id)
+
+        features = UsageFeatures.__table__
+        stmt = self._insert(features).from_select(
+            [
+                features.c.pharmacy_id,
+                features.c.medication_id,
+                features.c.history_points,
+                features.c.total_decrease,
+                features.c.first_change,
+                features.c.last_change,
+            ],
+            select(
+                *pair,
+                func.count(),
+                cast(func.sum(decrease), BigInteger),
+                func.min(StockHistory.changed_at),
+                func.max(StockHistory.changed_at),
+            )
+            .where(in_range)
+            .group_by(*pair),
+        )
+        self.db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[features.c.pharmacy_id, features.c.medication_id],
+                set_={
+                    "history_points": features.c.history_points + stmt.excluded.history_points,
+                    "total_decrease": features.c.total_decrease + stmt.excluded.total_decrease,
+                    "first_change": case(
+                        (stmt.excluded.first_change < features.c.first_change,
+                         stmt.excluded.first_change),
+                        else_=features.c.first_change,
+                    ),
+                    "last_change": case(
+                        (stmt.excluded.last_change > features.c.last_change,
+                         stmt.excluded.last_change),
+                        else_=features.c.last_change,
+                    ),
+                },
+            )
+        )
+
+        increase = history_increase_expr()
+        old, new = StockHistory.old_quantity, StockHistory.new_quantity
+
+        def count_where(condition: Any) -> Any:
+            return func.sum(case((condition, 1), else_=0))
+
+        stockouts = count_where(and_(old > 0, new <= 0))
+
+        daily = UsageDaily.__table__
+        day = func.date(StockHistory.changed_at, type_=Date)
+        by_day = (
+            select(
+                *pair,
+                day.label("day"),
+                func.count().label("changes"),
+                cast(func.sum(decrease), BigInteger).label("decrease"),
+                cast(func.sum(increase), BigInteger).label("increase"),
+                cast(stockouts, Integer).label("stockouts"),
+                func.max(StockHistory.id).label("last_id"),
+            )
+            .where(in_range)
+            .group_by(*pair, day)
+            .subquery("by_day")
+        )
+        last_change = StockHistory.__table__.alias("last_change")
+        stmt = self._insert(daily).from_select(
+            [
+                daily.c.pharmacy_id,
+                daily.c.medication_id,
+                daily.c.day,
+                daily.c.changes,
+                daily.c.decrease,
+                daily.c.increase,
+                daily.c.stockouts,
+                daily.c.end_quantity,
+            ],
+            select(
+                by_day.c.pharmacy_id,
+                by_day.c.medication_id,
+                by_day.c.day,
+                by_day.c.changes,
+                by_day.c.decrease,
+                by_day.c.increase,
+                by_day.c.stockouts,
+                last_change.c.new_quantity,
+            )
+            .join(last_change, last_change.c.id == by_day.c.last_id)
+            # WHERE is required by SQLite for INSERT ... SELECT ... ON CONFLICT
+            .where(true()),
+        )
+        self.db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[daily.c.pharmacy_id, daily.c.medication_id, daily.c.day],
+                set_={
+                    "changes": daily.c.changes + stmt.excluded.changes,
+                    "decrease": daily.c.decrease + stmt.excluded.decrease,
+                    "increase": daily.c.increase + stmt.excluded.increase,
+                    "stockouts": daily.c.stockouts + stmt.excluded.stockouts,
+                    # batches are folded in id order: this one holds the later change
+                    "end_quantity": stmt.excluded.end_quantity,
+                },
+            )
+        )
+
+        per_pharmacy = PharmacyDaily.__table__
+        stmt = self._insert(per_pharmacy).from_select(
+            [
+                per_pharmacy.c.pharmacy_id,
+                per_pharmacy.c.day,
+                per_pharmacy.c.changes,
+                per_pharmacy.c.decrease,
+                per_pharmacy.c.increase,
+                per_pharmacy.c.stockouts,
+                per_pharmacy.c.shortage_entries,
+                per_pharmacy.c.shortage_exits,
+            ],
+            select(
+                StockHistory.pharmacy_id,
+                day,
+                func.count(),
+                cast(func.sum(decrease), BigInteger),
+                cast(func.sum(increase), BigInteger),
+                cast(stockouts, Integer),
+                cast(count_where(shortage_entry_expr()), Integer),
+                cast(count_where(shortage_exit_expr()), Integer),
+            )
+            .where(in_range)
+            .group_by(StockHistory.pharmacy_id, day),
+        )
+        self.db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[per_pharmacy.c.pharmacy_id, per_pharmacy.c.day],
+                set_={
+                    name: per_pharmacy.c[name] + stmt.excluded[name]
+                    for name in (
+                        "changes",
+                        "decrease",
+                        "increase",
+                        "stockouts",
+                        "shortage_entries",
+                        "shortage_exits",
+                    )
+                },
+            )
+        )
+
+    def _catch_up_locked(self, watermark: int) -> CatchUpResult:
+        latest = self._committed_history_bound(watermark)
+        if latest <= watermark:
+            return CatchUpResult(watermark, watermark, 0)
+
+        rows = self.db.scalar(
+            select(func.count()).where(
+                StockHistory.id > watermark, StockHistory.id <= latest
+            )
+        ) or 0
+
+        for start in range(watermark, latest, self.batch_size):
+            self._fold(start, min(start + self.batch_size, latest))
+
+        self._set_watermark(latest)
+        return CatchUpResult(watermark, latest, rows)
+
+    # ---------- maintenance ----------
+
+    def catch_up(
+        self,
+        before_commit: Optional[Callable[[CatchUpResult], None]] = None,
+    ) -> CatchUpResult:
+        """
+        Fold StockHistory rows written since the last run into the store
+        and advance the watermark, in one transaction.
+
+        before_commit(result) runs inside that transaction, so work derived
+        from the new features (rescoring shortage_risk) commits with them.
+        Returns an empty result while another catch-up is running.
+        """
+        try:
+            watermark = self._lock_watermark(skip_locked=True)
+            if watermark is None:
+                # Another worker's catch-up is folding these rows
+                self.db.rollback()
+                watermark = self.watermark()
+                return CatchUpResult(watermark, watermark, 0)
+            result = self._catch_up_locked(watermark)
+            if before_commit is not None:
+                before_commit(result)
+            self.db.commit()
+        except SQLAlchemyError as exc:
+            self.db.rollback()
+            raise FeatureStoreError("Failed to update usage features") from exc
+        return result
+
+    def rebuild(self) -> CatchUpResult:
+        """
+        Recompute every table from all of StockHistory.
+        """
+        try:
+            self._lock_watermark()
+            self.db.execute(delete(UsageFeatures))
+            self.db.execute(delete(UsageDaily))
+            self.db.execute(delete(PharmacyDaily))
+            result = self._catch_up_locked(0)
+            self.db.commit()
+        except SQLAlchemyError as exc:
+            self.db.rollback()
+            raise FeatureStoreError("Failed to rebuild usage features") from exc
+        return result
+
+    # ---------- reads ----------
+
+    def watermark(self) -> int:
+        """Last StockHistory id folded into the store (0 before the first run)."""
+        return self.db.scalar(
+            select(FeatureWatermark.last_history_id)
+            .where(FeatureWatermark.name == WATERMARK_NAME)
+        ) or 0
+
+    def features_statement(
+        self,
+        pairs: Optional[Sequence[Tuple[int, int]]] = None,
+        *,
+        as_of: Optional[date] = None,
+    ) -> Select:
+        """
+        SELECT the FEATURE_DTYPES columns, one row per pair with history.
+
+        usage_<n>d is the total decrease over the n days ending on as_of
+        (today, UTC, by default).
+        """
+        as_of = as_of or datetime.utcnow().date()
+        oldest = as_of - timedelta(days=max(ROLLING_WINDOWS) - 1)
+
+        windows = (
+            select(
+                UsageDaily.pharmacy_id,
+                UsageDaily.medication_id,
+                *[
+                    func.sum(
+                        case(
+                            (UsageDaily.day >= as_of - timedelta(days=days - 1),
+                             UsageDaily.decrease),
+                            else_=0,
+                        )
+                    ).label(f"usage_{days}d")
+                    for days in ROLLING_WINDOWS
+                ],
+            )
+            .where(UsageDaily.day >= oldest, UsageDaily.day <= as_of)
+            .group_by(UsageDaily.pharmacy_id, UsageDaily.medication_id)
+        )
+        if pairs is not None:
+            windows = windows.where(
+                tuple_(UsageDaily.pharmacy_id, UsageDaily.medication_id).in_(pairs)
+            )
+        windows = windows.subquery("usage_windows")
+
+        stmt = select(
+            UsageFeatures.pharmacy_id,
+            UsageFeatures.medication_id,
+            UsageFeatures.history_points,
+            UsageFeatures.total_decrease,
+            UsageFeatures.first_change,
+            UsageFeatures.last_change,
+            *[
+                cast(func.coalesce(windows.c[f"usage_{days}d"], 0), BigInteger)
+                .label(f"usage_{days}d")
+                for days in ROLLING_WINDOWS
+            ],
+        ).outerjoin(
+            windows,
+            (windows.c.pharmacy_id == UsageFeatures.pharmacy_id)
+            & (windows.c.medication_id == UsageFeatures.medication_id),
+        )
+
+        if pairs is not None:
+            stmt = stmt.where(
+                tuple_(UsageFeatures.pharmacy_id, UsageFeatures.medication_id).in_(pairs)
+            )
+
+        return stmt.order_by(UsageFeatures.pharmacy_id, UsageFeatures.medication_id)
+
+    def load(
+        self,
+        pairs: Optional[Iterable[Tuple[int, int]]] = None,
+        *,
+        as_of: Optional[date] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> pd.DataFrame:
+        """
+        Stored features as typed columns (timestamps tz-aware UTC).
+
+        The first six columns are exactly extract.load_usage_aggregates(),
+        so they feed train_baseline_model.apply_usage_aggregates directly.
+        """
+        pairs = list(pairs) if pairs is not None else None
+        df = read_columns(
+            self.db,
+            self.features_statement(pairs, as_of=as_of),
+            FEATURE_DTYPES,
+            chunk_size=chunk_size,
+        )
+        return to_utc(df, "first_change", "last_change")
+
+
+def main() -> None:
+    from app.database.connection import SessionLocal, engine
+    from app.database.utils import add_missing_columns
+    from app.models.db_models import Base
+
+    parser = argparse.ArgumentParser(description="Update the usage feature store")
+    parser.add_argument("--rebuild", action="store_true", help="recompute from scratch")
+    args = parser.parse_args()
+
+    # Create the tables (and rollup columns) on databases that predate them
+    Base.metadata.create_all(
+        bind=engine,
+        tables=[
+            UsageFeatures.__table__,
+            UsageDaily.__table__,
+            PharmacyDaily.__table__,
+            FeatureWatermark.__table__,
+        ],
+    )
+    add_missing_columns(engine, UsageDaily.__table__)
+
+    db = SessionLocal()
+    try:
+        store = UsageFeatureStore(db)
+        result = store.rebuild() if args.rebuild else store.catch_up()
+    finally:
+        db.close()
+
+    if not result.rows:
+        print(f"✅ usage_features already up to date (history id {result.to_history_id})")
+        return
+
+    print(
+        f"✅ Folded {result.rows} history rows "
+        f"(ids {result.from_history_id + 1}..{result.to_history_id}) into usage_features"
+    )
+
+
+if __name__ == "__main__":
+    main()
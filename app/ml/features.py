@@ -0,0 +1,135 @@
+"""
+Online feature assembly for shortage scoring.
+
+Given (pharmacy_id, medication_id) pairs, builds the same feature vector
+build_training_frame() produces, from current inventory quantities and the
+usage feature store, so API clients only send pair ids. Assembled rows are
+kept in a bounded TTL cache: repeated requests for a hot pair skip the
+database, and a row is never more than FEATURE_CACHE_TTL_SECONDS stale.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from app.ml.extract import INVENTORY_DTYPES, inventory_statement, read_columns
+from app.ml.feature_store import UsageFeatureStore
+from app.ml.predict import FEATURE_COLUMNS
+from app.ml.train_baseline_model import TrainConfig, feature_frame, feature_matrix
+from app.models.db_models import Inventory
+from app.utils.cache import TTLCache
+
+FEATURE_CACHE_TTL_SECONDS = float(os.getenv("FEATURE_CACHE_TTL_SECONDS", "30"))
+FEATURE_CACHE_MAX_ENTRIES = int(os.getenv("FEATURE_CACHE_MAX_ENTRIES", "50000"))
+
+# Pairs per IN (...) lookup
+PAIR_LOOKUP_CHUNK = 1000
+
+Pair = Tuple[int, int]
+
+
+@dataclass(frozen=True)
+class AssembledFeatures:
+    frame: pd.DataFrame      # FEATURE_COLUMNS, one row per found pair, input order
+    pairs: List[Pair]        # pairs in frame, input order
+    missing: List[Pair]      # requested pairs with no inventory row
+
+
+class FeatureAssembler:
+    """
+    Builds model feature rows for inventory pairs, with a TTL+LRU cache.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float = FEATURE_CACHE_TTL_SECONDS,
+        max_entries: int = FEATURE_CACHE_MAX_ENTRIES,
+        min_history_points: int = TrainConfig.min_history_points,
+    ) -> None:
+        self.cache: TTLCache[Pair, Tuple[float, ...]] = TTLCache(
+            max_entries, ttl_seconds
+        )
+        self.min_history_points = min_history_points
+
+    # ---------- helpers ----------
+
+    def _load_inventory(self, db: Session, pairs: Sequence[Pair]) -> pd.DataFrame:
+        parts = [
+            read_columns(
+                db,
+                inventory_statement().where(
+                    tuple_(Inventory.pharmacy_id, Inventory.medication_id).in_(
+                        pairs[i:i + PAIR_LOOKUP_CHUNK]
+                    )
+                ),
+                INVENTORY_DTYPES,
+            )
+            for i in range(0, len(pairs), PAIR_LOOKUP_CHUNK)
+        ]
+        return pd.concat(parts, ignore_index=True)
+
+    def _build(self, db: Session, pairs: Sequence[Pair]) -> Dict[Pair, Tuple[float, ...]]:
+        """Feature rows for pairs that exist in inventory."""
+        inv = self._load_inventory(db, pairs)
+        if inv.empty:
+            return {}
+
+        found = list(zip(inv["pharmacy_id"].tolist(), inv["medication_id"].tolist()))
+        agg = UsageFeatureStore(db).load(found)
+
+        df = feature_frame(inv, agg, min_history_points=self.min_history_points)
+        X = feature_matrix(df)[FEATURE_COLUMNS].astype(float)
+
+        return {
+            (int(p), int(m)): tuple(row)
+            for p, m, row in zip(
+                df["pharmacy_id"], df["medication_id"], X.itertuples(index=False)
+            )
+        }
+
+    # ---------- public ----------
+
+    def assemble(self, db: Session, pairs: Iterable[Pair]) -> AssembledFeatures:
+        """
+        Feature rows for pairs, in input order (duplicates are kept).
+
+        Cached rows are reused; the rest are built in one pass over the
+        database and cached. Pairs without an inventory row are reported in
+        `missing` and are not cached, so they resolve as soon as they exist.
+        """
+        pairs = [(int(p), int(m)) for p, m in pairs]
+        rows = self.cache.get_many(pairs)
+
+        todo = list(dict.fromkeys(pair for pair in pairs if pair not in rows))
+        if todo:
+            built = self._build(db, todo)
+            self.cache.set_many(built.items())
+            rows.update(built)
+
+        found = [pair for pair in pairs if pair in rows]
+        frame = pd.DataFrame(
+            np.array([rows[pair] for pair in found], dtype=float).reshape(
+                len(found), len(FEATURE_COLUMNS)
+            ),
+            columns=FEATURE_COLUMNS,
+        )
+        return AssembledFeatures(
+            frame=frame,
+            pairs=found,
+            missing=[pair for pair in pairs if pair not in rows],
+        )
+
+    def invalidate(self, pairs: Iterable[Pair] | None = None) -> None:
+        """Forget cached rows for pairs (all rows when pairs is None)."""
+        self.cache.invalidate(pairs)
+
+
+# Shared by the API process
+feature_assembler = FeatureAssembler()
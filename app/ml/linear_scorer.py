@@ -0,0 +1,154 @@
+"""
+Pure-NumPy scorer for the baseline pipeline.
+
+The baseline model is SimpleImputer(median) -> StandardScaler ->
+LogisticRegression, i.e. one affine transform and a sigmoid. export()
+pulls the fitted parameters out of the sklearn Pipeline and save() writes
+them to a small uncompressed .npz, so a scorer loads in microseconds and
+scores float32 arrays without pandas or sklearn's per-call validation.
+
+Columns the imputer dropped at fit time (all-NaN during training) get a
+zero weight, so inputs keep the full FEATURE_COLUMNS layout.
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Sequence, Tuple
+
+import numpy as np
+
+
+class ScorerExportError(Exception):
+    """Raised when a pipeline is not the imputer -> scaler -> logistic shape."""
+
+
+@dataclass(frozen=True)
+class LinearScorer:
+    feature_columns: Tuple[str, ...]
+    medians: np.ndarray    # fill value per input column
+    means: np.ndarray      # StandardScaler mean_ (0 where dropped)
+    scales: np.ndarray     # StandardScaler scale_ (1 where dropped)
+    coef: np.ndarray       # logistic coefficients (0 where dropped)
+    intercept: float
+    positive_is_class_1: bool = True
+
+    def __post_init__(self) -> None:
+        # Fold the scaler into the linear term: z = x . w + b
+        weights = self.coef / self.scales
+        object.__setattr__(self, "_weights", weights)
+        object.__setattr__(
+            self, "_bias", float(self.intercept - np.dot(self.means, weights))
+        )
+
+    # ---------- scoring ----------
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        """Logit of class 1 for an (n, n_features) array; NaN is imputed."""
+        X = np.asarray(X, dtype=np.float32)
+        X = np.where(np.isnan(X), self.medians.astype(np.float32), X)
+        return X @ self._weights + self._bias
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probability of shortage (the positive class) per row."""
+        z = self.decision_function(X)
+        if not self.positive_is_class_1:
+            z = -z
+        # Numerically stable sigmoid
+        return np.exp(-np.logaddexp(0.0, -z))
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        # Same tie-breaking as predict_shortage: p > 0.5 is a shortage
+        return (self.predict_proba(X) > 0.5).astype(int)
+
+    # ---------- persistence ----------
+
+    def save(self, path: Path) -> Path:
+        """Write the parameters to path (.npz), atomically."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                np.savez(
+                    fh,
+                    feature_columns=np.array(self.feature_columns),
+                    medians=self.medians,
+                    means=self.means,
+                    scales=self.scales,
+                    coef=self.coef,
+                    intercept=np.array(self.intercept),
+                    positive_is_class_1=np.array(self.positive_is_class_1),
+                )
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "LinearScorer":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                feature_columns=tuple(str(c) for c in data["feature_columns"]),
+                medians=data["medians"],
+                means=data["means"],
+                scales=data["scales"],
+                coef=data["coef"],
+                intercept=float(data["intercept"]),
+                positive_is_class_1=bool(data["positive_is_class_1"]),
+            )
+
+
+def export(pipe: Any, feature_columns: Sequence[str]) -> LinearScorer:
+    """
+    Extract a LinearScorer from a fitted baseline Pipeline
+    (train_baseline_model.train_and_evaluate).
+    """
+    try:
+        num = pipe.named_steps["pre"].named_transformers_["num"]
+        imputer = num.named_steps["imputer"]
+        scaler = num.named_steps["scaler"]
+        model = pipe.named_steps["model"]
+    except (AttributeError, KeyError) as exc:
+        raise ScorerExportError("Pipeline is not the baseline pre -> model shape") from exc
+
+    if not hasattr(model, "coef_"):
+        raise ScorerExportError(f"{type(model).__name__} is not a linear model")
+    if getattr(imputer, "strategy", None) != "median":
+        raise ScorerExportError("Only median imputation can be exported")
+    if model.coef_.shape[0] != 1:
+        raise ScorerExportError("Only binary logistic models can be exported")
+
+    n = len(feature_columns)
+    statistics = np.asarray(imputer.statistics_, dtype=np.float64)
+    if len(statistics) != n:
+        raise ScorerExportError(
+            f"Pipeline was fitted on {len(statistics)} columns, expected {n}"
+        )
+
+    # Columns that were all-NaN at fit time are dropped by the imputer;
+    # scaler and model parameters only exist for the kept ones.
+    kept = ~np.isnan(statistics)
+
+    medians = np.where(kept, statistics, 0.0)
+    means = np.zeros(n)
+    scales = np.ones(n)
+    coef = np.zeros(n)
+    means[kept] = scaler.mean_ if scaler.with_mean else 0.0
+    scales[kept] = scaler.scale_ if scaler.with_std else 1.0
+    coef[kept] = model.coef_[0]
+
+    classes = list(model.classes_)
+
+    return LinearScorer(
+        feature_columns=tuple(feature_columns),
+        medians=medians,
+        means=means,
+        scales=scales,
+        coef=coef,
+        intercept=float(model.intercept_[0]),
+        positive_is_class_1=(1 not in classes) or classes.index(1) == 1,
+    )
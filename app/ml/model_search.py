@@ -0,0 +1,232 @@
+"""
+Hyperparameter search and model comparison for the shortage classifier.
+
+Every candidate (LogisticRegression over regularization strengths and
+class weights, HistGradientBoostingClassifier over learning rates, depths
+and class weights) is fitted on the same time-ordered TimeSeriesSplit
+folds; candidate x fold fits run in a joblib process pool (n_jobs, all
+cores by default). After the search, each candidate's single-row predict
+latency is timed serially in this process so the numbers are not skewed
+by the pool. The winner is the best mean F1 (then recall) among the
+candidates whose p95 latency fits the budget; train_and_evaluate then
+refits it with the newest rows (in time_order) held out.
+
+Used by `python -m app.ml.train_baseline_model --search`.
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import f1_score, precision_score, recall_score
+from sklearn.model_selection import TimeSeriesSplit
+from sklearn.pipeline import Pipeline
+
+from app.ml.train_baseline_model import TrainConfig, build_pipeline, time_order
+
+# Single-row predict_proba calls timed per candidate
+LATENCY_SAMPLES = 200
+
+
+@dataclass(frozen=True)
+class Candidate:
+    name: str
+    model: Any  # unfitted sklearn classifier
+
+
+@dataclass(frozen=True)
+class CandidateResult:
+    name: str
+    params: Dict[str, Any]
+    f1: float
+    recall: float
+    precision: float
+    fit_seconds: float           # mean per fold
+    latency_p50_ms: float        # single-row predict_proba
+    latency_p95_ms: float
+    batch_us_per_row: float      # predict over a whole fold
+    within_budget: bool
+
+
+@dataclass(frozen=True)
+class SearchResult:
+    winner: CandidateResult
+    candidates: List[CandidateResult]
+    cv_splits: int
+    latency_budget_ms: float
+    winner_model: Any  # unfitted estimator, for the final fit
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "cv": f"TimeSeriesSplit(n_splits={self.cv_splits})",
+            "latency_budget_ms": self.latency_budget_ms,
+            "winner": self.winner.name,
+            "candidates": [asdict(c) for c in self.candidates],
+        }
+
+
+def candidate_grid(cfg: TrainConfig) -> List[Candidate]:
+    candidates = []
+
+    for class_weight in (None, "balanced"):
+        weight = class_weight or "none"
+        for C in (0.01, 0.1, 1.0, 10.0):
+            candidates.append(
+                Candidate(
+                    f"logreg_C{C:g}_{weight}",
+                    LogisticRegression(
+                        C=C,
+                        max_iter=1000,
+                        class_weight=class_weight,
+                        random_state=cfg.random_state,
+                    ),
+                )
+            )
+        for learning_rate in (0.05, 0.1):
+            for max_depth in (3, None):
+                candidates.append(
+                    Candidate(
+                        f"hgb_lr{learning_rate:g}_depth{max_depth or 'none'}_{weight}",
+                        HistGradientBoostingClassifier(
+                            learning_rate=learning_rate,
+                            max_depth=max_depth,
+                            class_weight=class_weight,
+                            random_state=cfg.random_state,
+                        ),
+                    )
+                )
+
+    return candidates
+
+
+# ---------- helpers ----------
+
+def _fit_fold(
+    candidate: Candidate,
+    X: pd.DataFrame,
+    y: pd.Series,
+    train_idx: np.ndarray,
+    test_idx: np.ndarray,
+) -> Dict[str, Any]:
+    pipe = build_pipeline(list(X.columns), clone(candidate.model))
+    y_train = y.iloc[train_idx]
+    y_test = y.iloc[test_idx]
+    X_test = X.iloc[test_idx]
+
+    start = time.perf_counter()
+    pipe.fit(X.iloc[train_idx], y_train)
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    y_pred = pipe.predict(X_test)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "name": candidate.name,
+        "pipe": pipe,
+        "fit_seconds": fit_seconds,
+        "batch_us_per_row": batch_seconds / len(test_idx) * 1e6,
+        "f1": f1_score(y_test, y_pred, zero_division=0),
+        "recall": recall_score(y_test, y_pred, zero_division=0),
+        "precision": precision_score(y_test, y_pred, zero_division=0),
+    }
+
+
+def _single_row_latency_ms(
+    pipe: Pipeline,
+    row: pd.DataFrame,
+    timer: Callable[[], float],
+) -> Tuple[float, float]:
+    pipe.predict_proba(row)  # warm up
+    samples = np.empty(LATENCY_SAMPLES)
+    for i in range(LATENCY_SAMPLES):
+        start = timer()
+        pipe.predict_proba(row)
+        samples[i] = timer() - start
+    p50, p95 = np.percentile(samples * 1000.0, [50, 95])
+    return float(p50), float(p95)
+
+
+# ---------- public ----------
+
+def search_models(
+    X: pd.DataFrame,
+    y: pd.Series,
+    cfg: TrainConfig,
+    candidates: Optional[Sequence[Candidate]] = None,
+    timer: Callable[[], float] = time.perf_counter,
+) -> SearchResult:
+    """
+    Cross-validate candidates (candidate_grid by default) and pick the
+    winner under cfg.latency_budget_ms, timing predict latency with timer
+    (seconds).
+    """
+    candidates = list(candidates or candidate_grid(cfg))
+    X, y = time_order(X, y)
+
+    folds = []
+    for train_idx, test_idx in TimeSeriesSplit(n_splits=cfg.cv_splits).split(X):
+        # Time-ordered folds can be one-class; those say nothing about F1
+        if y.iloc[train_idx].nunique() == 2 and y.iloc[test_idx].nunique() == 2:
+            folds.append((train_idx, test_idx))
+    if not folds:
+        raise RuntimeError(
+            "No time-ordered CV fold contains both classes. "
+            "Need more varied data or fewer cv_splits."
+        )
+
+    runs = Parallel(n_jobs=cfg.n_jobs)(
+        delayed(_fit_fold)(candidate, X, y, train_idx, test_idx)
+        for candidate in candidates
+        for train_idx, test_idx in folds
+    )
+
+    row = X.iloc[[-1]]
+    results = []
+    for candidate in candidates:
+        mine = [r for r in runs if r["name"] == candidate.name]
+        p50, p95 = _single_row_latency_ms(mine[-1]["pipe"], row, timer)
+        results.append(
+            CandidateResult(
+                name=candidate.name,
+                params={
+                    k: v for k, v in candidate.model.get_params().items()
+                    if k in ("C", "class_weight", "learning_rate", "max_depth")
+                },
+                f1=float(np.mean([r["f1"] for r in mine])),
+                recall=float(np.mean([r["recall"] for r in mine])),
+                precision=float(np.mean([r["precision"] for r in mine])),
+                fit_seconds=float(np.mean([r["fit_seconds"] for r in mine])),
+                latency_p50_ms=p50,
+                latency_p95_ms=p95,
+                batch_us_per_row=float(np.mean([r["batch_us_per_row"] for r in mine])),
+                within_budget=p95 <= cfg.latency_budget_ms,
+            )
+        )
+
+    eligible = [r for r in results if r.within_budget]
+    if not eligible:
+        fastest = min(results, key=lambda r: r.latency_p95_ms)
+        raise RuntimeError(
+            f"No candidate meets the {cfg.latency_budget_ms}ms latency budget "
+            f"(fastest: {fastest.name} at {fastest.latency_p95_ms:.2f}ms p95)."
+        )
+
+    winner = max(eligible, key=lambda r: (r.f1, r.recall, -r.latency_p95_ms))
+
+    return SearchResult(
+        winner=winner,
+        candidates=results,
+        cv_splits=cfg.cv_splits,
+        latency_budget_ms=cfg.latency_budget_ms,
+        winner_model=clone(
+            next(c.model for c in candidates if c.name == winner.name)
+        ),
+    )
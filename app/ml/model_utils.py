@@ -1,28 +1,251 @@
 # app/ml/model_utils.py
 from __future__ import annotations
 
+import logging
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Dict, Optional, Tuple
 
 import joblib
 
+from app.ml.registry import ModelRegistry, file_sha256
+
+logger = logging.getLogger(__name__)
+
 ARTIFACTS_DIR = Path("app/ml/artifacts")
 DEFAULT_MODEL_PATH = ARTIFACTS_DIR / "baseline_model.joblib"
 
+# joblib.load mmap_mode for model artifacts ("none" = read into memory).
+# With "r", the numpy arrays inside the model (e.g. tree node tables) are
+# mapped read-only from the file, so every worker on a host shares one
+# page-cached copy instead of holding its own.
+MODEL_MMAP_MODE: Optional[str] = os.getenv("MODEL_MMAP_MODE", "r")
+if MODEL_MMAP_MODE.lower() == "none":
+    MODEL_MMAP_MODE = None
+
 
 def save_model(model: Any, path: Path = DEFAULT_MODEL_PATH) -> Path:
     """
     Save a trained model (joblib).
+
+    The file is written next to its destination and renamed into place, so a
+    running ModelHolder never sees a half-written artifact. It is written
+    uncompressed: joblib then stores numpy arrays aligned in the file, which
+    is what lets load_model memory-map them. Replacing the file leaves
+    existing mappings on the old inode intact.
     """
     path.parent.mkdir(parents=True, exist_ok=True)
-    joblib.dump(model, path)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            joblib.dump(model, fh, compress=0)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
     return path
 
 
-def load_model(path: Path = DEFAULT_MODEL_PATH) -> Optional[Any]:
+def load_model(
+    path: Path = DEFAULT_MODEL_PATH,
+    *,
+    mmap_mode: Optional[str] = MODEL_MMAP_MODE,
+) -> Optional[Any]:
     """
     Load a trained model (joblib). Returns None if missing.
+
+    Arrays are memory-mapped with mmap_mode (see MODEL_MMAP_MODE).
     """
     if not path.exists():
         return None
-    return joblib.load(path)
\ No newline at end of file
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+@dataclass(frozen=True)
+class LoadedModel:
+    model: Any
+    version: str          # short sha256 of the artifact bytes (or registry version)
+    path: str
+    mtime: float
+    loaded_at: datetime
+
+
+class ModelHolder:
+    """
+    Keeps one deserialized model in memory for the whole process.
+
+    The artifact is only re-read when its mtime/size changes, and only
+    re-unpickled when its content hash changes. A reload builds a new
+    LoadedModel and swaps the reference in one assignment, so requests that
+    already hold the previous snapshot keep using it safely.
+
+    With a registry, the registry's CURRENT pointer is watched instead and
+    the version is the registry version; path is only used until a version
+    has been promoted.
+    """
+
+    def __init__(
+        self,
+        path: Path = DEFAULT_MODEL_PATH,
+        *,
+        registry: Optional[ModelRegistry] = None,
+        check_interval: float = 1.0,
+        mmap_mode: Optional[str] = MODEL_MMAP_MODE,
+    ) -> None:
+        self.path = Path(path)
+        self.registry = registry
+        self.check_interval = check_interval
+        self.mmap_mode = mmap_mode
+
+        self._lock = threading.Lock()
+        self._current: Optional[LoadedModel] = None
+        self._stat_key: Optional[Tuple[int, int]] = None
+        self._last_check = float("-inf")
+
+    # ---------- helpers ----------
+
+    def _refresh_from_registry(self) -> Tuple[bool, Optional[LoadedModel]]:
+        """
+        (handled, model): handled is False when nothing has been promoted
+        yet, so the caller falls back to the plain artifact path.
+        """
+        try:
+            st = self.registry.current_file.stat()
+        except FileNotFoundError:
+            return False, None
+
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if stat_key == self._stat_key:
+            return True, self._current
+
+        version = self.registry.current_version()
+        if self._current is not None and self._current.version == version:
+            # Pointer rewritten but still on the same version
+            self._stat_key = stat_key
+            return True, self._current
+
+        try:
+            entry = self.registry.get(version)
+            model = joblib.load(entry.model_path, mmap_mode=self.mmap_mode)
+            model_mtime = entry.model_path.stat().st_mtime
+        except Exception as exc:
+            logger.warning("Failed to load registry model %s: %s", version, exc)
+            return True, self._current
+
+        self._current = LoadedModel(
+            model=model,
+            version=version,
+            path=str(entry.model_path),
+            mtime=model_mtime,
+            loaded_at=datetime.utcnow(),
+        )
+        self._stat_key = stat_key
+        logger.info("Loaded registry model version %s", version)
+        return True, self._current
+
+    def _refresh(self) -> Optional[LoadedModel]:
+        # Only one thread reloads; others keep serving the current snapshot
+        # (or wait, if nothing has been loaded yet).
+        if not self._lock.acquire(blocking=self._current is None):
+            return self._current
+
+        try:
+            self._last_check = time.monotonic()
+
+            if self.registry is not None:
+                handled, current = self._refresh_from_registry()
+                if handled:
+                    return current
+
+            try:
+                st = self.path.stat()
+            except FileNotFoundError:
+                return self._current
+
+            stat_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if stat_key == self._stat_key:
+                return self._current
+
+            # Hash and load from the path (not from bytes in memory) so the
+            # arrays can be memory-mapped
+            version = file_sha256(self.path)[:12]
+
+            if self._current is not None and self._current.version == version:
+                # Touched or rewritten with identical bytes: nothing to load.
+                self._stat_key = stat_key
+                return self._current
+
+            try:
+                model = joblib.load(self.path, mmap_mode=self.mmap_mode)
+                replaced = self.path.stat().st_ino != st.st_ino
+            except Exception as exc:
+                logger.warning(
+                    "Failed to load model artifact %s: %s", self.path, exc
+                )
+                return self._current
+
+            if replaced:
+                # Swapped while loading: the hash may not match what was
+                # loaded, so look again on the next check.
+                stat_key = None
+
+            self._current = LoadedModel(
+                model=model,
+                version=version,
+                path=str(self.path),
+                mtime=st.st_mtime,
+                loaded_at=datetime.utcnow(),
+            )
+            self._stat_key = stat_key
+            logger.info("Loaded model %s (version %s)", self.path, version)
+            return self._current
+
+        finally:
+            self._lock.release()
+
+    # ---------- public API ----------
+
+    def get(self) -> Optional[LoadedModel]:
+        """
+        Return the current model snapshot, reloading it first if the artifact
+        changed. Returns None if no artifact has been trained yet.
+        """
+        current = self._current
+        if (
+            current is not None
+            and time.monotonic() - self._last_check < self.check_interval
+        ):
+            return current
+        return self._refresh()
+
+    def reload(self) -> Optional[LoadedModel]:
+        """
+        Check the artifact immediately, ignoring check_interval.
+        """
+        self._last_check = float("-inf")
+        return self._refresh()
+
+    def describe(self) -> Dict[str, Any]:
+        """
+        JSON-ready summary of the loaded model (for status endpoints).
+        """
+        current = self._current
+        if current is None:
+            return {"loaded": False, "path": str(self.path)}
+        return {
+            "loaded": True,
+            "source": "registry" if self.registry is not None and current.path != str(self.path) else "file",
+            "version": current.version,
+            "path": current.path,
+            "loaded_at": current.loaded_at.isoformat(),
+            "artifact_mtime": datetime.utcfromtimestamp(current.mtime).isoformat(),
+        }
+
+
+# Shared by the prediction code and the API.
+model_holder = ModelHolder(registry=ModelRegistry())
@@ -1,10 +1,88 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Mapping, Optional, Sequence
 
+import numpy as np
 import pandas as pd
 
-from app.ml.model_utils import load_model
+from app.ml.model_utils import model_holder
+
+# Column order used by train_baseline_model.build_training_frame
+FEATURE_COLUMNS = [
+    "quantity",
+    "usage_rate_per_day",
+    "days_until_zero",
+    "last_change_days_ago",
+    "pharmacy_id",
+    "medication_id",
+]
+
+
+def _score(model: Any, df: pd.DataFrame) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Score a frame with a single model pass.
+
+    For classifiers the label is derived from predict_proba instead of
+    running the model a second time: p > 0.5 picks the positive class and
+    p == 0.5 the negative one, same as LogisticRegression.predict.
+    """
+    if not hasattr(model, "predict_proba"):
+        return np.asarray(model.predict(df)).astype(int), None
+
+    p = model.predict_proba(df)
+    classes = list(getattr(model, "classes_", [0, 1]))
+    positive = p[:, classes.index(1)] if 1 in classes else p[:, -1]
+
+    pred = (positive > 0.5).astype(int)
+    return pred, positive
+
+
+def predict_shortage_frame(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Predict shortage risk for a FEATURE_COLUMNS frame in one vectorized pass.
+
+    Predictions are returned in row order.
+    """
+
+    loaded = model_holder.get()
+
+    if loaded is None:
+        return {
+            "available": False,
+            "message": "Model not trained yet"
+        }
+
+    if df.empty:
+        return {"available": True, "predictions": [], "model_version": loaded.version}
+
+    pred, proba = _score(loaded.model, df[FEATURE_COLUMNS])
+
+    predictions: List[Dict[str, Any]] = [
+        {
+            "shortage_pred": int(pred[i]),
+            "shortage_proba": float(proba[i]) if proba is not None else None,
+        }
+        for i in range(len(df))
+    ]
+
+    return {
+        "available": True,
+        "predictions": predictions,
+        "model_version": loaded.version,
+    }
+
+
+def predict_shortage_batch(rows: Sequence[Mapping[str, Any]]) -> Dict[str, Any]:
+    """
+    Predict shortage risk for many feature rows in one vectorized pass.
+
+    Rows use the same features as predict_shortage(); missing values are
+    passed to the model as NaN. Predictions are returned in input order.
+    """
+    df = pd.DataFrame.from_records(rows, columns=FEATURE_COLUMNS)
+    df = df.apply(pd.to_numeric, errors="coerce").astype(float)
+
+    return predict_shortage_frame(df)
 
 
 def predict_shortage(features: Dict[str, Any]) -> Dict[str, Any]:
@@ -20,25 +98,16 @@ def predict_shortage(features: Dict[str, Any]) -> Dict[str, Any]:
       medication_id
     """
 
-    model = load_model()
-
-    if model is None:
-        return {
-            "available": False,
-            "message": "Model not trained yet"
-        }
-
-    df = pd.DataFrame([features])
+    result = predict_shortage_batch([features])
 
-    pred = int(model.predict(df)[0])
+    if not result["available"]:
+        return result
 
-    proba: List[float] = [None, None]
-    if hasattr(model, "predict_proba"):
-        p = model.predict_proba(df)[0]
-        proba = [float(p[0]), float(p[1])]
+    prediction = result["predictions"][0]
 
     return {
         "available": True,
-        "shortage_pred": pred,            # 1 = shortage soon, 0 = safe
-        "shortage_proba": proba[1]        # probability of shortage
-    }
\ No newline at end of file
+        "shortage_pred": prediction["shortage_pred"],    # 1 = shortage soon, 0 = safe
+        "shortage_proba": prediction["shortage_proba"],  # probability of shortage
+        "model_version": result["model_version"],
+    }
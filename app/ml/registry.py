@@ -0,0 +1,250 @@
+"""
+File-based model registry.
+
+Layout under MODEL_REGISTRY_DIR (app/ml/artifacts/registry by default):
+
+    versions/<version>/model.joblib     immutable once registered
+    versions/<version>/scorer.npz       NumPy scorer, linear models only
+    versions/<version>/metadata.json    metrics, config, feature schema,
+                                        data watermark, sha256
+    CURRENT                             {"version": ..., "history": [...]}
+
+A version directory is assembled under a temporary name and renamed into
+place, so it is either complete or absent. CURRENT is rewritten the same
+way (os.replace), so promote() and rollback() are atomic for readers and
+rollback is just a pointer flip. history is the stack of previously
+current versions, most recent first.
+
+Serving processes watch CURRENT through ModelHolder(registry=...): a
+promotion is picked up on the next check without a restart, and an
+unchanged version is never reloaded.
+
+Usage (inside container):
+  python -m app.ml.registry list
+  python -m app.ml.registry promote <version>
+  python -m app.ml.registry rollback
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+MODEL_REGISTRY_DIR = Path(os.getenv("MODEL_REGISTRY_DIR", "app/ml/artifacts/registry"))
+
+MODEL_FILENAME = "model.joblib"
+SCORER_FILENAME = "scorer.npz"
+METADATA_FILENAME = "metadata.json"
+CURRENT_FILENAME = "CURRENT"
+
+# Previously current versions remembered for rollback
+MAX_HISTORY = 20
+
+
+class RegistryError(Exception):
+    """Raised for unknown versions or an impossible promote/rollback."""
+
+
+@dataclass(frozen=True)
+class ModelVersion:
+    version: str
+    path: Path
+    metadata: Dict[str, Any]
+
+    @property
+    def model_path(self) -> Path:
+        return self.path / MODEL_FILENAME
+
+    @property
+    def scorer_path(self) -> Optional[Path]:
+        path = self.path / SCORER_FILENAME
+        return path if path.exists() else None
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json_atomic(path: Path, payload: Dict[str, Any]) -> None:
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh, indent=2)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+class ModelRegistry:
+    """
+    Immutable model versions plus an atomic "current" pointer.
+    """
+
+    def __init__(self, root: Path = MODEL_REGISTRY_DIR) -> None:
+        self.root = Path(root)
+
+    # ---------- helpers ----------
+
+    @property
+    def versions_dir(self) -> Path:
+        return self.root / "versions"
+
+    @property
+    def current_file(self) -> Path:
+        return self.root / CURRENT_FILENAME
+
+    def _pointer(self) -> Dict[str, Any]:
+        try:
+            return json.loads(self.current_file.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {"version": None, "history": []}
+
+    def _set_pointer(self, version: str, history: List[str]) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        _write_json_atomic(
+            self.current_file,
+            {
+                "version": version,
+                "promoted_at": datetime.now(timezone.utc).isoformat(),
+                "history": history[:MAX_HISTORY],
+            },
+        )
+
+    # ---------- versions ----------
+
+    def register(
+        self,
+        model_file: Path,
+        *,
+        metrics: Dict[str, Any],
+        config: Dict[str, Any],
+        feature_columns: Sequence[str],
+        data_watermark: Optional[Dict[str, Any]] = None,
+        scorer_file: Optional[Path] = None,
+    ) -> ModelVersion:
+        """
+        Copy a trained artifact into a new immutable version (not promoted).
+        """
+        model_file = Path(model_file)
+        sha256 = file_sha256(model_file)
+        created_at = datetime.now(timezone.utc)
+        version = f"{created_at:%Y%m%dT%H%M%S}-{sha256[:8]}"
+
+        self.versions_dir.mkdir(parents=True, exist_ok=True)
+        final = self.versions_dir / version
+        if final.exists():
+            raise RegistryError(f"Version {version} is already registered")
+
+        staging = Path(tempfile.mkdtemp(dir=self.versions_dir, prefix=".staging-"))
+        try:
+            shutil.copyfile(model_file, staging / MODEL_FILENAME)
+            if scorer_file is not None:
+                shutil.copyfile(scorer_file, staging / SCORER_FILENAME)
+
+            metadata = {
+                "version": version,
+                "created_at": created_at.isoformat(),
+                "sha256": sha256,
+                "metrics": metrics,
+                "config": config,
+                "feature_columns": list(feature_columns),
+                "data_watermark": data_watermark,
+            }
+            _write_json_atomic(staging / METADATA_FILENAME, metadata)
+            os.rename(staging, final)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        return ModelVersion(version, final, metadata)
+
+    def get(self, version: str) -> ModelVersion:
+        path = self.versions_dir / version
+        try:
+            metadata = json.loads((path / METADATA_FILENAME).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise RegistryError(f"Unknown model version {version!r}") from None
+        return ModelVersion(version, path, metadata)
+
+    def list_versions(self) -> List[ModelVersion]:
+        """Registered versions, oldest first."""
+        if not self.versions_dir.exists():
+            return []
+        return [
+            self.get(path.name)
+            for path in sorted(self.versions_dir.iterdir())
+            if path.is_dir() and not path.name.startswith(".")
+        ]
+
+    # ---------- pointer ----------
+
+    def current_version(self) -> Optional[str]:
+        return self._pointer().get("version")
+
+    def current(self) -> Optional[ModelVersion]:
+        version = self.current_version()
+        return self.get(version) if version else None
+
+    def promote(self, version: str) -> ModelVersion:
+        """Make version current; the previous current version can be rolled back to."""
+        promoted = self.get(version)
+        pointer = self._pointer()
+        current = pointer.get("version")
+        if current == version:
+            return promoted
+
+        history = ([current] if current else []) + pointer.get("history", [])
+        self._set_pointer(version, history)
+        return promoted
+
+    def rollback(self) -> ModelVersion:
+        """Point CURRENT back at the previously current version."""
+        pointer = self._pointer()
+        history = list(pointer.get("history", []))
+        if not history:
+            raise RegistryError("No previous model version to roll back to")
+
+        previous = self.get(history.pop(0))
+        self._set_pointer(previous.version, history)
+        return previous
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage registered model versions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="list versions (* = current)")
+    promote = sub.add_parser("promote", help="make a version current")
+    promote.add_argument("version")
+    sub.add_parser("rollback", help="return to the previously current version")
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+
+    if args.command == "list":
+        current = registry.current_version()
+        for entry in registry.list_versions():
+            marker = "*" if entry.version == current else " "
+            f1 = entry.metadata.get("metrics", {}).get("f1")
+            print(f"{marker} {entry.version}  f1={f1}")
+    elif args.command == "promote":
+        print(f"✅ Promoted {registry.promote(args.version).version}")
+    else:
+        print(f"✅ Rolled back to {registry.rollback().version}")
+
+
+if __name__ == "__main__":
+    main()
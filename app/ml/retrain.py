@@ -0,0 +1,389 @@
+"""
+Background retraining of the baseline shortage model.
+
+RetrainManager.submit() starts a job and returns immediately. Training runs
+in a separate (spawned) process against a candidate directory, so the API
+worker never holds the GIL, a DB session or a request open for the fit.
+The child reports progress over a queue; a monitor thread in the API
+process records it on the job. Once the child is done, the candidate is
+validated and only then registered and promoted in the model registry
+(app/ml/registry.py) and the ModelHolder is reloaded, so a bad fit is
+never served.
+
+Deduplication: while a job is queued or running, submit() returns that job
+instead of starting another. Across API workers, the child holds an
+exclusive lock on RETRAIN_LOCK_FILENAME for the whole fit, so a second
+worker's job fails fast instead of training concurrently.
+"""
+from __future__ import annotations
+
+import fcntl
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from app.ml.predict import FEATURE_COLUMNS
+from app.ml.registry import ModelRegistry, ModelVersion
+from app.ml.train_baseline_model import TrainConfig
+
+logger = logging.getLogger(__name__)
+
+# Minimum holdout F1 a new model needs before it replaces the served one
+RETRAIN_MIN_F1 = float(os.getenv("RETRAIN_MIN_F1", "0.5"))
+
+RETRAIN_LOCK_FILENAME = ".retrain.lock"
+CANDIDATES_DIRNAME = "candidates"
+
+# Finished jobs kept for the status endpoints
+MAX_FINISHED_JOBS = 20
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+ReportFn = Callable[[float, str], None]
+TrainFn = Callable[[str, ReportFn], Dict[str, Any]]
+
+
+class RetrainValidationError(Exception):
+    """Raised when a newly trained model must not replace the served one."""
+
+
+@dataclass
+class RetrainJob:
+    id: str
+    status: str = QUEUED
+    progress: float = 0.0
+    stage: str = "queued"
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    metrics: Optional[Dict[str, Any]] = None
+    model_version: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "stage": self.stage,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "metrics": self.metrics,
+            "model_version": self.model_version,
+            "error": self.error,
+        }
+
+
+# ---------- child process ----------
+
+def train_candidate(artifacts_dir: str, report: ReportFn) -> Dict[str, Any]:
+    """
+    Default training function: the baseline model, written to artifacts_dir.
+    """
+    from app.database.connection import SessionLocal
+    from app.ml.feature_store import UsageFeatureStore
+    from app.ml.train_baseline_model import (
+        build_training_frame,
+        save_artifacts,
+        train_and_evaluate,
+    )
+
+    cfg = TrainConfig(artifacts_dir=artifacts_dir)
+
+    report(0.05, "loading training data")
+    db = SessionLocal()
+    try:
+        X, y = build_training_frame(db, cfg)
+        watermark = UsageFeatureStore(db).watermark()
+    finally:
+        db.close()
+
+    report(0.5, f"fitting model on {len(X)} rows")
+    pipe, metrics = train_and_evaluate(X, y, cfg)
+
+    report(0.9, "saving candidate")
+    save_artifacts(pipe, metrics, cfg)
+
+    return {
+        "rows": int(len(X)),
+        "data_watermark": {"stock_history_id": watermark},
+        **{k: metrics[k] for k in ("accuracy", "precision", "recall", "f1")},
+    }
+
+
+def _child_main(
+    train_fn: TrainFn,
+    artifacts_dir: str,
+    lock_path: str,
+    messages: "multiprocessing.Queue[Tuple[str, Any]]",
+) -> None:
+    def report(progress: float, stage: str) -> None:
+        messages.put(("progress", (progress, stage)))
+
+    try:
+        with open(lock_path, "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise RuntimeError("Another retraining job is already running")
+            messages.put(("result", train_fn(artifacts_dir, report)))
+    except Exception as exc:
+        messages.put(("error", f"{type(exc).__name__}: {exc}"))
+
+
+# ---------- validation / registration ----------
+
+def validate_candidate(
+    candidate_dir: Path,
+    metrics: Dict[str, Any],
+    cfg: TrainConfig,
+    min_f1: float,
+) -> None:
+    """
+    The candidate must load, use FEATURE_COLUMNS, return probabilities for
+    a row of missing features, and reach min_f1 on its holdout split.
+    """
+    model_path = candidate_dir / cfg.model_filename
+    try:
+        model = joblib.load(model_path)
+    except Exception as exc:
+        raise RetrainValidationError(f"Candidate model does not load: {exc}") from exc
+
+    if not hasattr(model, "predict_proba"):
+        raise RetrainValidationError("Candidate model has no predict_proba")
+
+    names = list(getattr(model, "feature_names_in_", []))
+    if names != FEATURE_COLUMNS:
+        raise RetrainValidationError(
+            f"Candidate features {names} do not match {FEATURE_COLUMNS}"
+        )
+
+    probe = pd.DataFrame([[np.nan] * len(FEATURE_COLUMNS)], columns=FEATURE_COLUMNS)
+    proba = np.asarray(model.predict_proba(probe), dtype=float)
+    if not np.all(np.isfinite(proba)) or proba.min() < 0 or proba.max() > 1:
+        raise RetrainValidationError("Candidate model returns invalid probabilities")
+
+    f1 = metrics.get("f1")
+    if f1 is None or math.isnan(f1) or f1 < min_f1:
+        raise RetrainValidationError(f"Candidate F1 {f1} is below the minimum {min_f1}")
+
+
+def register_candidate(
+    registry: ModelRegistry,
+    candidate_dir: Path,
+    result: Dict[str, Any],
+    cfg: TrainConfig,
+) -> ModelVersion:
+    """Register a validated candidate as a new (not yet promoted) version."""
+    scorer = candidate_dir / cfg.scorer_filename
+    return registry.register(
+        candidate_dir / cfg.model_filename,
+        metrics={k: v for k, v in result.items() if k != "data_watermark"},
+        config=asdict(cfg),
+        feature_columns=FEATURE_COLUMNS,
+        data_watermark=result.get("data_watermark"),
+        scorer_file=scorer if scorer.exists() else None,
+    )
+
+
+# ---------- manager ----------
+
+class RetrainManager:
+    """
+    Starts retraining jobs in a child process and tracks their status.
+    """
+
+    def __init__(
+        self,
+        *,
+        train_fn: TrainFn = train_candidate,
+        cfg: TrainConfig = TrainConfig(),
+        registry: Optional[ModelRegistry] = None,
+        min_f1: float = RETRAIN_MIN_F1,
+        holder: Any = None,
+    ) -> None:
+        self.train_fn = train_fn
+        self.cfg = cfg
+        self.registry = registry or ModelRegistry()
+        self.min_f1 = min_f1
+        self._holder = holder
+
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, RetrainJob]" = OrderedDict()
+        self._process: Optional[multiprocessing.process.BaseProcess] = None
+
+    # ---------- helpers ----------
+
+    @property
+    def holder(self) -> Any:
+        if self._holder is not None:
+            return self._holder
+        from app.ml import predict
+
+        return predict.model_holder
+
+    @property
+    def work_dir(self) -> Path:
+        """Holds per-job candidate directories and the retrain lock."""
+        return Path(self.cfg.artifacts_dir)
+
+    def _update(self, job: RetrainJob, **changes: Any) -> None:
+        with self._lock:
+            for name, value in changes.items():
+                setattr(job, name, value)
+
+    def _finish(self, job: RetrainJob, status: str, stage: str, **changes: Any) -> None:
+        self._update(
+            job,
+            status=status,
+            stage=stage,
+            finished_at=datetime.utcnow(),
+            **changes,
+        )
+        with self._lock:
+            finished = [j.id for j in self._jobs.values() if not j.active]
+            for job_id in finished[:-MAX_FINISHED_JOBS]:
+                del self._jobs[job_id]
+
+    def _monitor(
+        self,
+        job: RetrainJob,
+        process: multiprocessing.process.BaseProcess,
+        messages: "multiprocessing.Queue[Tuple[str, Any]]",
+        candidate_dir: Path,
+    ) -> None:
+        outcome: Optional[Tuple[str, Any]] = None
+        try:
+            while outcome is None:
+                try:
+                    kind, payload = messages.get(timeout=0.5)
+                except queue.Empty:
+                    if not process.is_alive():
+                        outcome = ("error", f"Training process exited with code {process.exitcode}")
+                    continue
+                if kind == "progress":
+                    progress, stage = payload
+                    self._update(job, progress=progress, stage=stage)
+                else:
+                    outcome = (kind, payload)
+
+            process.join()
+            kind, payload = outcome
+            if kind == "error":
+                self._finish(job, FAILED, "training failed", error=payload)
+                return
+
+            self._update(job, progress=0.95, stage="validating", metrics=payload)
+            validate_candidate(candidate_dir, payload, self.cfg, self.min_f1)
+            entry = register_candidate(self.registry, candidate_dir, payload, self.cfg)
+            self.registry.promote(entry.version)
+
+            loaded = self.holder.reload()
+            self._finish(
+                job,
+                SUCCEEDED,
+                "done",
+                progress=1.0,
+                model_version=loaded.version if loaded is not None else None,
+            )
+            logger.info("Retrain job %s installed model %s", job.id, job.model_version)
+
+        except RetrainValidationError as exc:
+            self._finish(job, FAILED, "validation failed", error=str(exc))
+        except Exception as exc:
+            logger.exception("Retrain job %s failed", job.id)
+            self._finish(job, FAILED, "failed", error=f"{type(exc).__name__}: {exc}")
+        finally:
+            shutil.rmtree(candidate_dir, ignore_errors=True)
+
+    # ---------- public ----------
+
+    def submit(self) -> Tuple[RetrainJob, bool]:
+        """
+        Start a retraining job, or return the one already in progress.
+
+        Returns (job, created).
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.active:
+                    return job, False
+
+            job = RetrainJob(id=uuid.uuid4().hex[:12])
+            self._jobs[job.id] = job
+
+        candidate_dir = self.work_dir / CANDIDATES_DIRNAME / job.id
+        candidate_dir.mkdir(parents=True, exist_ok=True)
+
+        # spawn: never fork a process that runs an event loop and threads
+        ctx = multiprocessing.get_context("spawn")
+        messages = ctx.Queue()
+        process = ctx.Process(
+            target=_child_main,
+            args=(
+                self.train_fn,
+                str(candidate_dir),
+                str(self.work_dir / RETRAIN_LOCK_FILENAME),
+                messages,
+            ),
+            name=f"retrain-{job.id}",
+            daemon=True,
+        )
+        try:
+            process.start()
+        except Exception as exc:
+            self._finish(job, FAILED, "failed to start", error=str(exc))
+            shutil.rmtree(candidate_dir, ignore_errors=True)
+            return job, True
+
+        self._process = process
+        self._update(job, status=RUNNING, stage="starting", started_at=datetime.utcnow())
+        threading.Thread(
+            target=self._monitor,
+            args=(job, process, messages, candidate_dir),
+            name=f"retrain-monitor-{job.id}",
+            daemon=True,
+        ).start()
+        return job, True
+
+    def get(self, job_id: str) -> Optional[RetrainJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[RetrainJob]:
+        """Known jobs, newest first."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def shutdown(self) -> None:
+        """Stop a running training process (API shutdown)."""
+        process = self._process
+        if process is not None and process.is_alive():
+            process.terminate()
+            process.join(timeout=5)
+
+
+# Shared by the API process
+retrain_manager = RetrainManager()
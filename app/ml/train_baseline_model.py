@@ -1,13 +1,13 @@
 # app/ml/train_baseline_model.py
 from __future__ import annotations
 
+import argparse
 import json
 from dataclasses import asdict, dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
-import joblib
 import numpy as np
 import pandas as pd
 from sklearn.compose import ColumnTransformer
@@ -27,8 +27,11 @@ from sklearn.preprocessing import StandardScaler
 from sqlalchemy.orm import Session
 
 from app.database.connection import SessionLocal
+from app.ml.extract import load_inventory_columns, load_stock_history_columns
+from app.ml.feature_store import UsageFeatureStore
+from app.ml.linear_scorer import ScorerExportError, export as export_scorer
 from app.ml.model_utils import save_model
-from app.models.db_models import Inventory, StockHistory
+from app.ml.registry import ModelRegistry
 
 
 @dataclass(frozen=True)
@@ -47,6 +50,13 @@ class TrainConfig:
     artifacts_dir: str = "app/ml/artifacts"
     model_filename: str = "baseline_model.joblib"
     metrics_filename: str = "baseline_metrics.json"
+    scorer_filename: str = "baseline_scorer.npz"
+
+    # Model search (--search): time-aware CV folds, joblib workers
+    # (-1 = all cores) and the p95 single-row predict budget for the winner.
+    cv_splits: int = 5
+    n_jobs: int = -1
+    latency_budget_ms: float = 10.0
 
 
 def utc_now() -> datetime:
@@ -58,69 +68,52 @@ def open_db_session() -> Session:
 
 
 def load_inventory_df(db: Session) -> pd.DataFrame:
-    rows = db.query(Inventory).all()
-    data = [
-        {
-            "inventory_id": r.id,
-            "pharmacy_id": r.pharmacy_id,
-            "medication_id": r.medication_id,
-            "quantity": int(r.quantity),
-        }
-        for r in rows
-    ]
-    return pd.DataFrame(data)
+    # Typed columns (int32), streamed in chunks - see app/ml/extract.py
+    return load_inventory_columns(db)
 
 
 def load_stock_history_df(db: Session) -> pd.DataFrame:
-    rows = db.query(StockHistory).all()
-    data = [
-        {
-            "pharmacy_id": r.pharmacy_id,
-            "medication_id": r.medication_id,
-            "old_quantity": int(r.old_quantity),
-            "new_quantity": int(r.new_quantity),
-            "changed_at": r.changed_at,
-            "reason": r.reason,
-        }
-        for r in rows
-    ]
-    df = pd.DataFrame(data)
-    if not df.empty:
-        df["changed_at"] = pd.to_datetime(df["changed_at"], utc=True, errors="coerce")
-    return df
+    return load_stock_history_columns(db)
 
 
-def compute_usage_features(
+def aggregate_usage(hist: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-pair usage aggregates from raw StockHistory rows (pandas version of
+    extract.usage_aggregates_statement).
+    """
+    hist = hist.copy()
+    hist["decrease"] = (hist["old_quantity"] - hist["new_quantity"]).clip(lower=0)
+
+    grp = hist.groupby(["pharmacy_id", "medication_id"], as_index=False)
+    return grp.agg(
+        history_points=("decrease", "count"),
+        total_decrease=("decrease", "sum"),
+        first_change=("changed_at", "min"),
+        last_change=("changed_at", "max"),
+    )
+
+
+def apply_usage_aggregates(
     inv: pd.DataFrame,
-    hist: pd.DataFrame,
+    agg: pd.DataFrame,
     *,
     min_history_points: int,
 ) -> pd.DataFrame:
     """
-    Build simple usage_rate per (pharmacy_id, medication_id) from StockHistory.
+    Join usage_rate_per_day and last_change_days_ago onto inventory rows.
 
     usage_rate = total_decrease / total_days
     - decrease is max(0, old - new)
     """
     inv = inv.copy()
 
-    if hist.empty:
+    if agg.empty:
         # Ensure columns exist even when history is missing
         inv["usage_rate_per_day"] = np.nan
         inv["last_change_days_ago"] = np.nan
         return inv
 
-    hist = hist.copy()
-    hist["decrease"] = (hist["old_quantity"] - hist["new_quantity"]).clip(lower=0)
-
-    grp = hist.groupby(["pharmacy_id", "medication_id"], as_index=False)
-    agg = grp.agg(
-        history_points=("decrease", "count"),
-        total_decrease=("decrease", "sum"),
-        first_change=("changed_at", "min"),
-        last_change=("changed_at", "max"),
-    )
-
+    agg = agg.copy()
     agg["total_days"] = (
         (agg["last_change"] - agg["first_change"]).dt.total_seconds() / 86400.0
     )
@@ -148,16 +141,41 @@ def compute_usage_features(
     return out
 
 
-def build_training_frame(
-    db: Session,
-    cfg: TrainConfig,
-) -> Tuple[pd.DataFrame, pd.Series]:
-    inv = load_inventory_df(db)
-    if inv.empty:
-        raise RuntimeError("No inventory data found. Cannot train baseline model.")
+def compute_usage_features(
+    inv: pd.DataFrame,
+    hist: pd.DataFrame,
+    *,
+    min_history_points: int,
+) -> pd.DataFrame:
+    """
+    Build simple usage_rate per (pharmacy_id, medication_id) from StockHistory.
+
+    usage_rate = total_decrease / total_days
+    - decrease is max(0, old - new)
+    """
+    if hist.empty:
+        return apply_usage_aggregates(
+            inv, hist, min_history_points=min_history_points
+        )
+
+    return apply_usage_aggregates(
+        inv, aggregate_usage(hist), min_history_points=min_history_points
+    )
 
-    hist = load_stock_history_df(db)
-    df = compute_usage_features(inv, hist, min_history_points=cfg.min_history_points)
+
+def feature_frame(
+    inv: pd.DataFrame,
+    agg: pd.DataFrame,
+    *,
+    min_history_points: int,
+) -> pd.DataFrame:
+    """
+    Inventory rows with usage features and days_until_zero.
+
+    Shared by training (build_training_frame) and online scoring
+    (app.ml.features.FeatureAssembler) so both see identical features.
+    """
+    df = apply_usage_aggregates(inv, agg, min_history_points=min_history_points)
 
     # --- make numeric (avoid pd.NA / object dtypes) ---
     df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce")
@@ -175,16 +193,13 @@ def build_training_frame(
         df.loc[has_rate, "quantity"].astype(float) / usage_rate.loc[has_rate].astype(float)
     )
 
-    days_until_zero = pd.to_numeric(df["days_until_zero"], errors="coerce")
+    df["days_until_zero"] = pd.to_numeric(df["days_until_zero"], errors="coerce")
 
-    # Baseline label:
-    # shortage_soon = 1 if qty <= critical_threshold OR (days_until_zero <= horizon_days)
-    shortage = df["quantity"].fillna(np.inf) <= cfg.critical_threshold
-    has_days = days_until_zero.notna()
-    shortage = shortage | (has_days & (days_until_zero <= cfg.horizon_days))
+    return df
 
-    y = shortage.astype(int)
 
+def feature_matrix(df: pd.DataFrame) -> pd.DataFrame:
+    """Model input columns, in training order."""
     X = df[
         [
             "quantity",
@@ -197,36 +212,52 @@ def build_training_frame(
     ].copy()
 
     # IMPORTANT: scikit-learn expects np.nan, not pd.NA
-    X = X.apply(pd.to_numeric, errors="coerce").replace({pd.NA: np.nan})
-
-    return X, y
+    return X.apply(pd.to_numeric, errors="coerce").replace({pd.NA: np.nan})
 
 
-def train_and_evaluate(
-    X: pd.DataFrame,
-    y: pd.Series,
+def build_training_frame(
+    db: Session,
     cfg: TrainConfig,
-) -> Tuple[Pipeline, Dict[str, Any]]:
-    if y.nunique() < 2:
-        raise RuntimeError(
-            "Training labels contain only one class. "
-            "Need more varied data (both shortage and non-shortage examples)."
-        )
+) -> Tuple[pd.DataFrame, pd.Series]:
+    inv = load_inventory_df(db)
+    if inv.empty:
+        raise RuntimeError("No inventory data found. Cannot train baseline model.")
 
-    # Stratify only if both classes have at least 2 examples (otherwise sklearn can fail)
-    class_counts = y.value_counts()
-    can_stratify = (class_counts.min() >= 2)
+    # Incremental feature store: fold in new history rows, then read
+    # O(pairs) aggregates - the same ones online scoring uses
+    store = UsageFeatureStore(db)
+    store.catch_up()
+    agg = store.load()
+    df = feature_frame(inv, agg, min_history_points=cfg.min_history_points)
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X,
-        y,
-        test_size=cfg.test_size,
-        random_state=cfg.random_state,
-        stratify=y if can_stratify else None,
-    )
+    days_until_zero = df["days_until_zero"]
 
-    numeric_features = list(X.columns)
+    # Baseline label:
+    # shortage_soon = 1 if qty <= critical_threshold OR (days_until_zero <= horizon_days)
+    shortage = df["quantity"].fillna(np.inf) <= cfg.critical_threshold
+    has_days = days_until_zero.notna()
+    shortage = shortage | (has_days & (days_until_zero <= cfg.horizon_days))
+
+    y = shortage.astype(int)
+
+    X = feature_matrix(df)
 
+    return X, y
+
+
+def time_order(X: pd.DataFrame, y: pd.Series) -> Tuple[pd.DataFrame, pd.Series]:
+    """
+    Oldest activity first, so every CV fold validates on rows that changed
+    later than the ones it was trained on. Rows without history come first.
+    """
+    order = X["last_change_days_ago"].sort_values(
+        ascending=False, na_position="first", kind="stable"
+    ).index
+    return X.loc[order], y.loc[order]
+
+
+def build_pipeline(numeric_features: List[str], model: Any) -> Pipeline:
+    """Median impute -> scale -> model, over the numeric feature columns."""
     pre = ColumnTransformer(
         transformers=[
             (
@@ -243,17 +274,70 @@ def train_and_evaluate(
         remainder="drop",
     )
 
-    model = LogisticRegression(
+    return Pipeline(
+        steps=[
+            ("pre", pre),
+            ("model", model),
+        ]
+    )
+
+
+def baseline_classifier(cfg: TrainConfig) -> LogisticRegression:
+    return LogisticRegression(
         max_iter=1000,
         class_weight="balanced",
         random_state=cfg.random_state,
     )
 
-    pipe = Pipeline(
-        steps=[
-            ("pre", pre),
-            ("model", model),
-        ]
+
+def train_and_evaluate(
+    X: pd.DataFrame,
+    y: pd.Series,
+    cfg: TrainConfig,
+    model: Optional[Any] = None,
+    time_ordered: bool = False,
+) -> Tuple[Pipeline, Dict[str, Any]]:
+    """
+    Fit model (the baseline LogisticRegression by default) on a holdout
+    split and report its test metrics.
+
+    time_ordered holds out the newest cfg.test_size of the rows (in
+    time_order), matching the folds the model search validated on;
+    otherwise the split is random and stratified when possible.
+    """
+    if y.nunique() < 2:
+        raise RuntimeError(
+            "Training labels contain only one class. "
+            "Need more varied data (both shortage and non-shortage examples)."
+        )
+
+    if time_ordered:
+        X, y = time_order(X, y)
+        can_stratify = False
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=cfg.test_size, shuffle=False
+        )
+        if y_train.nunique() < 2:
+            raise RuntimeError(
+                "The time-ordered training split contains only one class. "
+                "Need more varied data or a smaller test_size."
+            )
+    else:
+        # Stratify only if both classes have at least 2 examples (otherwise sklearn can fail)
+        class_counts = y.value_counts()
+        can_stratify = (class_counts.min() >= 2)
+
+        X_train, X_test, y_train, y_test = train_test_split(
+            X,
+            y,
+            test_size=cfg.test_size,
+            random_state=cfg.random_state,
+            stratify=y if can_stratify else None,
+        )
+
+    pipe = build_pipeline(
+        list(X.columns),
+        model if model is not None else baseline_classifier(cfg),
     )
 
     pipe.fit(X_train, y_train)
@@ -273,6 +357,7 @@ def train_and_evaluate(
         "label_positive_rate_train": float(y_train.mean()),
         "label_positive_rate_test": float(y_test.mean()),
         "stratified_split": bool(can_stratify),
+        "time_ordered_split": bool(time_ordered),
     }
 
     return pipe, metrics
@@ -282,14 +367,24 @@ def save_artifacts(
     pipe: Pipeline,
     metrics: Dict[str, Any],
     cfg: TrainConfig,
-) -> Tuple[Path, Path]:
+) -> Tuple[Path, Path, Optional[Path]]:
     artifacts_dir = Path(cfg.artifacts_dir)
     artifacts_dir.mkdir(parents=True, exist_ok=True)
 
     model_path = artifacts_dir / cfg.model_filename
     metrics_path = artifacts_dir / cfg.metrics_filename
+    scorer_path = artifacts_dir / cfg.scorer_filename
 
-    joblib.dump(pipe, model_path)
+    # Atomic and uncompressed, so a running ModelHolder can swap it in and mmap it
+    save_model(pipe, model_path)
+
+    # Same model as plain arrays for the NumPy scorer (app/ml/linear_scorer.py);
+    # only linear models can be exported, so drop a stale file otherwise.
+    try:
+        export_scorer(pipe, list(pipe.feature_names_in_)).save(scorer_path)
+    except ScorerExportError:
+        scorer_path.unlink(missing_ok=True)
+        scorer_path = None
 
     payload: Dict[str, Any] = {
         "trained_at_utc": utc_now().isoformat(),
@@ -298,27 +393,70 @@ def save_artifacts(
     }
     metrics_path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
 
-    return model_path, metrics_path
+    return model_path, metrics_path, scorer_path
 
 
 def main() -> None:
-    cfg = TrainConfig()
+    parser = argparse.ArgumentParser(description="Train the baseline shortage model")
+    parser.add_argument(
+        "--search",
+        action="store_true",
+        help="cross-validate a grid of candidate models and train the best one "
+             "within the latency budget (see app/ml/model_search.py)",
+    )
+    parser.add_argument("--n-jobs", type=int, default=TrainConfig.n_jobs)
+    parser.add_argument(
+        "--latency-budget-ms", type=float, default=TrainConfig.latency_budget_ms
+    )
+    args = parser.parse_args()
+
+    cfg = TrainConfig(n_jobs=args.n_jobs, latency_budget_ms=args.latency_budget_ms)
 
     db = open_db_session()
     try:
         X, y = build_training_frame(db, cfg)
-        pipe, metrics = train_and_evaluate(X, y, cfg)
-        model_path, metrics_path = save_artifacts(pipe, metrics, cfg)
+
+        search = None
+        if args.search:
+            from app.ml.model_search import search_models
+
+            search = search_models(X, y, cfg)
+            print(f"Search winner: {search.winner.name} "
+                  f"(F1 {search.winner.f1:.4f}, p95 {search.winner.latency_p95_ms:.2f}ms)")
+
+        pipe, metrics = train_and_evaluate(
+            X,
+            y,
+            cfg,
+            model=search.winner_model if search else None,
+            time_ordered=search is not None,
+        )
+        if search:
+            metrics["search"] = search.to_dict()
+
+        model_path, metrics_path, scorer_path = save_artifacts(pipe, metrics, cfg)
+
+        registry = ModelRegistry()
+        entry = registry.register(
+            model_path,
+            metrics=metrics,
+            config=asdict(cfg),
+            feature_columns=list(X.columns),
+            data_watermark={"stock_history_id": UsageFeatureStore(db).watermark()},
+            scorer_file=scorer_path,
+        )
+        registry.promote(entry.version)
 
         print("✅ Baseline model training complete")
         print(f"Model saved to:   {model_path}")
         print(f"Metrics saved to: {metrics_path}")
+        if scorer_path is not None:
+            print(f"Scorer saved to:  {scorer_path}")
+        print(f"Registered and promoted model version {entry.version}")
         print(f"Accuracy: {metrics['accuracy']:.4f} | F1: {metrics['f1']:.4f}")
 
     finally:
         db.close()
-        version_path = save_model(pipe, version="v1")
-        print(f"Saved versioned model: {version_path}")
 
 
 if __name__ == "__main__":
@@ -7,7 +7,10 @@ from app.ml.logger import logger
 
 def train_model():
     db = SessionLocal()
-    df = load_inventory_dataset(db)
+    try:
+        df = load_inventory_dataset(db)
+    finally:
+        db.close()
 
     if df is None:
         logger.warning("Training skipped: Not enough data.")
@@ -1,9 +1,15 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
+from typing import Optional
+
 from sqlalchemy import (
+    BigInteger,
+    Date,
     DateTime,
+    Float,
     ForeignKey,
+    ForeignKeyConstraint,
     Integer,
     String,
     UniqueConstraint,
@@ -62,9 +68,17 @@ class Inventory(Base):
     __table_args__ = (
         UniqueConstraint("pharmacy_id", "medication_id", name="uq_inventory_pair"),
         Index("ix_inventory_pharmacy_med", "pharmacy_id", "medication_id"),
+        # risk filters are pushed down as quantity ranges (see ShortageService.risk_filter)
+        Index("ix_inventory_quantity", "quantity"),
+        Index("ix_inventory_pharmacy_quantity", "pharmacy_id", "quantity"),
     )
 
 
+# StockHistory.reason of the change that creates an inventory pair; its
+# old_quantity is 0 but the pair did not exist before.
+CREATED_REASON = "CREATE"
+
+
 class StockHistory(Base):
     __tablename__ = "stock_history"
 
@@ -82,3 +96,139 @@ class StockHistory(Base):
     changed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
     reason: Mapped[str | None] = mapped_column(String(255), nullable=True)
+
+
+class InventoryVersion(Base):
+    """
+    Per-pharmacy change counter: the ETag / result cache version marker
+    (see app/api/conditional.py).
+
+    InventoryService (and app.database.utils.upsert_inventory_quantity)
+    increments it (UPDATE ... SET version = version + 1) inside every write
+    transaction, so a reader sees the new version exactly when it can see
+    the write.
+    """
+    __tablename__ = "inventory_versions"
+
+    pharmacy_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("pharmacies.id", ondelete="CASCADE"), primary_key=True
+    )
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+
+class ShortageRisk(Base):
+    """
+    Current shortage risk per inventory pair.
+
+    Maintained in the same transaction as every InventoryService change and
+    rebuilt with `python -m app.database.rebuild_shortage_risk`, so the risk
+    endpoints read it instead of scoring inventory on every request.
+    """
+    __tablename__ = "shortage_risk"
+
+    pharmacy_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    medication_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False)
+    risk_score: Mapped[float] = mapped_column(Float, nullable=False)
+    reason: Mapped[str] = mapped_column(String(32), nullable=False)
+    risk_level: Mapped[str] = mapped_column(String(16), nullable=False)
+
+    # quantity / average daily usage; NULL without usable usage history
+    days_of_cover: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    # when risk_level last moved (unchanged when only the quantity moves)
+    level_changed_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    calculated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["pharmacy_id", "medication_id"],
+            ["inventory.pharmacy_id", "inventory.medication_id"],
+            ondelete="CASCADE",
+        ),
+        Index("ix_shortage_risk_score", "risk_score"),
+        Index("ix_shortage_risk_pharmacy_score", "pharmacy_id", "risk_score"),
+        Index("ix_shortage_risk_level_pair", "risk_level", "pharmacy_id", "medication_id"),
+    )
+
+
+class UsageFeatures(Base):
+    """
+    Per-pair usage aggregates over all of StockHistory (feature store).
+
+    Folded in incrementally by app.ml.feature_store: only history rows past
+    the "usage_features" watermark are aggregated on each catch-up.
+    """
+    __tablename__ = "usage_features"
+
+    pharmacy_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    medication_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    history_points: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total_decrease: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    first_change: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    last_change: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class UsageDaily(Base):
+    """
+    Per-pair, per-day usage buckets; rolling windows (7/30 days) are sums
+    over the most recent days.
+    """
+    __tablename__ = "usage_daily"
+
+    pharmacy_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    medication_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+
+    changes: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    decrease: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)   # units consumed
+    increase: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )  # units received
+    stockouts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    # quantity after the day's last change
+    end_quantity: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index("ix_usage_daily_day", "day"),
+    )
+
+
+class PharmacyDaily(Base):
+    """
+    Per-pharmacy, per-day rollup of StockHistory (all medications).
+
+    shortage_entries / shortage_exits count changes that crossed the low
+    stock threshold downwards / upwards, so the number of pairs in shortage
+    on any past day follows from today's count. Creating a pair
+    (CREATED_REASON) at or below the threshold is an entry, and never an
+    exit.
+    """
+    __tablename__ = "pharmacy_daily"
+
+    pharmacy_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+
+    changes: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    decrease: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    increase: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    stockouts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    shortage_entries: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    shortage_exits: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_pharmacy_daily_day", "day"),
+    )
+
+
+class FeatureWatermark(Base):
+    """
+    Last StockHistory.id folded into a derived table, per consumer name.
+    """
+    __tablename__ = "feature_watermark"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    last_history_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
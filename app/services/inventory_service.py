@@ -2,11 +2,21 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Set, Tuple
 
+from sqlalchemy import insert, select, tuple_, update
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.models.db_models import Inventory, StockHistory
+from app.models.db_models import CREATED_REASON, Inventory, InventoryVersion, StockHistory
+from app.services.risk_events import risk_events
+from app.services.shortage_service import RiskLevelChange, ShortageService
+
+# Rows per statement for bulk SELECT/INSERT (keeps bind params well under driver limits)
+BULK_CHUNK_SIZE = 1000
+
+STOCK_OPERATIONS = ("add", "update", "remove")
 
 
 class InventoryServiceError(Exception):
@@ -31,13 +41,41 @@ class InventoryChangeResult:
     changed_at: datetime
 
 
+@dataclass(frozen=True)
+class StockOperation:
+    op: str  # "add" | "update" | "remove"
+    pharmacy_id: int
+    medication_id: int
+    quantity: int  # amount to add/remove, or the new quantity for "update"
+
+
+@dataclass(frozen=True)
+class BatchItemResult:
+    index: int
+    pharmacy_id: int
+    medication_id: int
+    applied: bool
+    previous_quantity: Optional[int] = None
+    new_quantity: Optional[int] = None
+    change_amount: int = 0
+    error: Optional[str] = None
+
+
 class InventoryService:
     """
     Business logic for inventory management.
+
+    Every change also refreshes the pair's shortage_risk row and bumps the
+    pharmacy's inventory_versions counter in the same transaction (see
+    ShortageService.refresh_risks and app/api/conditional.py), which moves
+    the ETags and result cache keys of the endpoints that read it. Once
+    committed, risk level changes are published to stream subscribers
+    (risk_events).
     """
 
     def __init__(self, db: Session) -> None:
         self.db = db
+        self.shortage_service = ShortageService(db)
 
     # ---------- helpers ----------
 
@@ -81,6 +119,24 @@ class InventoryService:
         )
         self.db.add(history)
 
+    def _bump_versions(self, pharmacy_ids: Sequence[int]) -> None:
+        """
+        Increment the pharmacies' inventory_versions rows in this
+        transaction (the ETag / cache version marker), in pharmacy order.
+        """
+        table = InventoryVersion.__table__
+        stmt = self._dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.pharmacy_id],
+            set_={"version": table.c.version + 1},
+        )
+        self.db.execute(
+            stmt, [{"pharmacy_id": p, "version": 1} for p in sorted(set(pharmacy_ids))]
+        )
+
+    def _committed(self, changes: List[RiskLevelChange]) -> None:
+        risk_events.publish(self.db, changes)
+
     # ---------- public API ----------
 
     def add_stock(
@@ -104,20 +160,30 @@ class InventoryService:
                 )
                 self.db.add(inventory)
                 new = quantity
+                reason = CREATED_REASON
             else:
                 previous = inventory.quantity
                 inventory.quantity += quantity
                 new = inventory.quantity
+                reason = "ADD"
 
+            # Inventory first: the transaction has an id before it draws a
+            # history id (see UsageFeatureStore._committed_history_bound)
+            self.db.flush()
             self._log_history(
                 pharmacy_id,
                 medication_id,
                 previous,
                 new,
-                reason="ADD",
+                reason=reason,
+            )
+            changes = self.shortage_service.refresh_risks(
+                [(pharmacy_id, medication_id, new)], now
             )
+            self._bump_versions([pharmacy_id])
 
             self.db.commit()
+            self._committed(changes)
             self.db.refresh(inventory)
 
         except SQLAlchemyError as exc:
@@ -155,19 +221,27 @@ class InventoryService:
                     quantity=new_quantity,
                 )
                 self.db.add(inventory)
+                reason = CREATED_REASON
             else:
                 previous = inventory.quantity
                 inventory.quantity = new_quantity
+                reason = "UPDATE"
 
+            self.db.flush()
             self._log_history(
                 pharmacy_id,
                 medication_id,
                 previous,
                 new_quantity,
-                reason="UPDATE",
+                reason=reason,
             )
+            changes = self.shortage_service.refresh_risks(
+                [(pharmacy_id, medication_id, new_quantity)], now
+            )
+            self._bump_versions([pharmacy_id])
 
             self.db.commit()
+            self._committed(changes)
             self.db.refresh(inventory)
 
         except SQLAlchemyError as exc:
@@ -191,22 +265,42 @@ class InventoryService:
         medication_id: int,
         quantity: int,
     ) -> InventoryChangeResult:
+        """
+        Remove stock with a single conditional UPDATE.
+
+        The decrement and the "enough stock" check happen atomically in the
+        database (UPDATE ... SET quantity = quantity - n WHERE quantity >= n
+        RETURNING quantity), so concurrent removals for the same pair can
+        neither lose an update nor drive the quantity negative. The history
+        and shortage_risk rows are written in the same transaction.
+        """
         self._validate_positive(quantity, "quantity")
+        now = datetime.utcnow()
 
-        inventory = self._get_inventory(pharmacy_id, medication_id)
-        if inventory is None:
-            raise InventoryNotFoundError("Inventory record not found")
-
-        previous = inventory.quantity
-        new = previous - quantity
-
-        if new < 0:
-            raise InventoryValidationError(
-                "Cannot remove more stock than available"
+        stmt = (
+            update(Inventory)
+            .where(
+                Inventory.pharmacy_id == pharmacy_id,
+                Inventory.medication_id == medication_id,
+                Inventory.quantity >= quantity,
             )
+            .values(quantity=Inventory.quantity - quantity)
+            .returning(Inventory.quantity)
+            .execution_options(synchronize_session=False)
+        )
 
         try:
-            inventory.quantity = new
+            new = self.db.execute(stmt).scalar_one_or_none()
+
+            if new is None:
+                self.db.rollback()
+                if self._get_inventory(pharmacy_id, medication_id) is None:
+                    raise InventoryNotFoundError("Inventory record not found")
+                raise InventoryValidationError(
+                    "Cannot remove more stock than available"
+                )
+
+            previous = new + quantity
 
             self._log_history(
                 pharmacy_id,
@@ -216,8 +310,13 @@ class InventoryService:
                 reason="REMOVE",
             )
 
+            changes = self.shortage_service.refresh_risks(
+                [(pharmacy_id, medication_id, new)], now
+            )
+            self._bump_versions([pharmacy_id])
+
             self.db.commit()
-            self.db.refresh(inventory)
+            self._committed(changes)
 
         except SQLAlchemyError as exc:
             self.db.rollback()
@@ -231,5 +330,295 @@ class InventoryService:
             previous,
             new,
             new - previous,
-            datetime.utcnow(),
+            now,
+        )
+
+    # ---------- bulk API ----------
+
+    def _dialect_insert(self, table=Inventory.__table__):
+        dialect = self.db.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            raise InventoryServiceError(
+                f"Bulk upsert is not supported for {dialect!r}"
+            )
+        return dialect_insert(table)
+
+    def _upsert_statement(self):
+        """
+        INSERT ... ON CONFLICT (pharmacy_id, medication_id) DO UPDATE ... RETURNING
+
+        Executed with a list of parameter sets, SQLAlchemy batches it into
+        multi-row VALUES statements ("insertmanyvalues").
+        """
+        table = Inventory.__table__
+        stmt = self._dialect_insert()
+        return stmt.on_conflict_do_update(
+            index_elements=[table.c.pharmacy_id, table.c.medication_id],
+            set_={"quantity": stmt.excluded.quantity},
+        ).returning(table.c.pharmacy_id, table.c.medication_id)
+
+    def _insert_missing(
+        self,
+        pairs: List[Tuple[int, int]],
+    ) -> Set[Tuple[int, int]]:
+        """
+        Insert a quantity-0 row for each pair that has none yet
+        (ON CONFLICT DO NOTHING) and return the pairs this call created.
+
+        Afterwards every pair has a row that _load_quantities can lock. A
+        concurrent batch creating the same pair waits on the conflicting
+        row until this transaction ends, then sees its quantity, instead
+        of both writing an absolute quantity computed from 0.
+        """
+        if not pairs:
+            return set()
+
+        table = Inventory.__table__
+        stmt = (
+            self._dialect_insert()
+            .on_conflict_do_nothing(
+                index_elements=[table.c.pharmacy_id, table.c.medication_id]
+            )
+            .returning(table.c.pharmacy_id, table.c.medication_id)
         )
+        rows = [{"pharmacy_id": p, "medication_id": m, "quantity": 0} for p, m in pairs]
+        return {tuple(row) for row in self.db.execute(stmt, rows)}
+
+    def _load_quantities(
+        self,
+        pairs: List[Tuple[int, int]],
+    ) -> Dict[Tuple[int, int], int]:
+        """
+        Current quantity for each existing pair, locking the rows.
+
+        Pairs are locked in key order so concurrent batches cannot deadlock.
+        """
+        quantities: Dict[Tuple[int, int], int] = {}
+        pair_key = tuple_(Inventory.pharmacy_id, Inventory.medication_id)
+
+        for start in range(0, len(pairs), BULK_CHUNK_SIZE):
+            chunk = pairs[start:start + BULK_CHUNK_SIZE]
+            stmt = (
+                select(
+                    Inventory.pharmacy_id,
+                    Inventory.medication_id,
+                    Inventory.quantity,
+                )
+                .where(pair_key.in_(chunk))
+                .order_by(Inventory.pharmacy_id, Inventory.medication_id)
+                .with_for_update()
+            )
+            for row in self.db.execute(stmt):
+                quantities[(row.pharmacy_id, row.medication_id)] = row.quantity
+
+        return quantities
+
+    def _validate_operation(self, operation: StockOperation) -> None:
+        if operation.op not in STOCK_OPERATIONS:
+            raise InventoryValidationError(
+                f"op must be one of {', '.join(STOCK_OPERATIONS)}"
+            )
+        if operation.op == "update":
+            self._validate_non_negative(operation.quantity, "new_quantity")
+        else:
+            self._validate_positive(operation.quantity, "quantity")
+
+    def apply_batch(
+        self,
+        operations: Sequence[StockOperation],
+    ) -> List[BatchItemResult]:
+        """
+        Apply many add/update/remove operations in one transaction.
+
+        Operations run in order (several may touch the same pair) with the
+        same rules as add_stock/update_stock/remove_stock. An invalid
+        operation, such as removing more than is in stock, is reported in
+        its result and skipped; it does not abort the rest of the batch.
+
+        Database work is set-based: one INSERT ... ON CONFLICT DO NOTHING
+        creating rows for new pairs, one locking SELECT, one
+        INSERT ... ON CONFLICT ... RETURNING for the final quantities and one
+        multi-row StockHistory insert (chunked by BULK_CHUNK_SIZE), one
+        shortage_risk upsert for the touched pairs, one inventory_versions
+        upsert for their pharmacies, then a single commit.
+        """
+        now = datetime.utcnow()
+        results: List[Optional[BatchItemResult]] = [None] * len(operations)
+        valid: List[int] = []
+
+        for index, operation in enumerate(operations):
+            try:
+                self._validate_operation(operation)
+                valid.append(index)
+            except InventoryValidationError as exc:
+                results[index] = BatchItemResult(
+                    index,
+                    operation.pharmacy_id,
+                    operation.medication_id,
+                    applied=False,
+                    error=str(exc),
+                )
+
+        pairs = sorted(
+            {(operations[i].pharmacy_id, operations[i].medication_id) for i in valid}
+        )
+
+        creating = sorted(
+            {
+                (operations[i].pharmacy_id, operations[i].medication_id)
+                for i in valid
+                if operations[i].op != "remove"
+            }
+        )
+
+        try:
+            created = self._insert_missing(creating)
+            state = self._load_quantities(pairs)
+            # Placeholder rows: not in stock until an operation below sets them
+            for pair in created:
+                del state[pair]
+            touched: Dict[Tuple[int, int], int] = {}
+            history: List[Dict[str, object]] = []
+
+            for index in valid:
+                operation = operations[index]
+                pair = (operation.pharmacy_id, operation.medication_id)
+                current = state.get(pair)
+
+                if operation.op == "remove":
+                    if current is None:
+                        error = "Inventory record not found"
+                    elif current - operation.quantity < 0:
+                        error = "Cannot remove more stock than available"
+                    else:
+                        error = None
+
+                    if error is not None:
+                        results[index] = BatchItemResult(
+                            index, *pair, applied=False, error=error
+                        )
+                        continue
+
+                previous = current or 0
+                if operation.op == "add":
+                    new = previous + operation.quantity
+                elif operation.op == "update":
+                    new = operation.quantity
+                else:
+                    new = previous - operation.quantity
+
+                state[pair] = new
+                touched[pair] = new
+                history.append(
+                    {
+                        "pharmacy_id": pair[0],
+                        "medication_id": pair[1],
+                        "old_quantity": previous,
+                        "new_quantity": new,
+                        "changed_at": now,
+                        "reason": CREATED_REASON if current is None else operation.op.upper(),
+                    }
+                )
+                results[index] = BatchItemResult(
+                    index,
+                    *pair,
+                    applied=True,
+                    previous_quantity=previous,
+                    new_quantity=new,
+                    change_amount=new - previous,
+                )
+
+            rows = [
+                {"pharmacy_id": p, "medication_id": m, "quantity": q}
+                for (p, m), q in touched.items()
+            ]
+            if rows:
+                written = self.db.execute(self._upsert_statement(), rows).all()
+                if len(written) != len(rows):
+                    self.db.rollback()
+                    raise InventoryServiceError(
+                        f"Bulk upsert wrote {len(written)} of {len(rows)} rows"
+                    )
+
+            if history:
+                self.db.execute(insert(StockHistory.__table__), history)
+
+            changes = self.shortage_service.refresh_risks(
+                ((p, m, q) for (p, m), q in touched.items()), now
+            )
+            if touched:
+                self._bump_versions([p for p, _ in touched])
+
+            self.db.commit()
+            if touched:
+                self._committed(changes)
+
+        except SQLAlchemyError as exc:
+            self.db.rollback()
+            raise InventoryServiceError(
+                "Failed to apply stock batch"
+            ) from exc
+
+        return results  # type: ignore[return-value]
+
+
+class AsyncInventoryService:
+    """
+    InventoryService for an AsyncSession.
+
+    Each call runs the sync implementation through AsyncSession.run_sync:
+    the business rules stay in one place, while every statement is awaited
+    on the async driver instead of blocking the event loop.
+    """
+
+    def __init__(self, db: AsyncSession) -> None:
+        self.db = db
+
+    async def add_stock(
+        self,
+        pharmacy_id: int,
+        medication_id: int,
+        quantity: int,
+    ) -> InventoryChangeResult:
+        return await self.db.run_sync(
+            lambda session: InventoryService(session).add_stock(
+                pharmacy_id, medication_id, quantity
+            )
+        )
+
+    async def update_stock(
+        self,
+        pharmacy_id: int,
+        medication_id: int,
+        new_quantity: int,
+    ) -> InventoryChangeResult:
+        return await self.db.run_sync(
+            lambda session: InventoryService(session).update_stock(
+                pharmacy_id, medication_id, new_quantity
+            )
+        )
+
+    async def remove_stock(
+        self,
+        pharmacy_id: int,
+        medication_id: int,
+        quantity: int,
+    ) -> InventoryChangeResult:
+        return await self.db.run_sync(
+            lambda session: InventoryService(session).remove_stock(
+                pharmacy_id, medication_id, quantity
+            )
+        )
+
+    async def apply_batch(
+        self,
+        operations: Sequence[StockOperation],
+    ) -> List[BatchItemResult]:
+        return await self.db.run_sync(
+            lambda session: InventoryService(session).apply_batch(operations)
+        )
+
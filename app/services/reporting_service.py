@@ -1,13 +1,32 @@
 from __future__ import annotations
 
+import json
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Any, Dict, List
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
 
+from sqlalchemy import and_, case, func, literal_column, select
 from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
 
-from app.services.shortage_service import ShortageRiskResult
-from app.services.shortage_service import ShortageService
+from app.ml.feature_store import WATERMARK_NAME, shortage_entry_expr, shortage_exit_expr
+from app.services.shortage_service import (
+    LOW_THRESHOLD,
+    REASONS,
+    RISK_SCORES,
+    ShortageService,
+    ShortageServiceError,
+)
+
+# REASONS is ordered by severity
+SHORTAGE_CODE_MAX = REASONS.index("low_cover")            # out_of_stock .. low_cover
+CRITICAL_CODE_MAX = REASONS.index("critical_low_cover")   # out_of_stock .. critical_low_cover
+
+# Trend: compare the last TREND_WINDOW_DAYS with the window before. A change
+# within TREND_STABLE_RATIO of last window's shortage count is "stable".
+TREND_WINDOW_DAYS = 7
+TREND_STABLE_RATIO = 0.05
+TREND_TOP_PHARMACIES = 5
 
 
 @dataclass(frozen=True)
@@ -42,73 +61,218 @@ class ReportingService:
         self.db = db
         self.shortage_service = ShortageService(db)
 
+    def _json_items(self, fields: Dict[str, ColumnElement[Any]]) -> Any:
+        """JSON array aggregate of one object per row, for this dialect."""
+        args = []
+        for name, column in fields.items():
+            args.extend([literal_column(f"'{name}'"), column])
+
+        dialect = self.db.get_bind().dialect.name
+        if dialect == "postgresql":
+            return func.json_agg(func.json_build_object(*args))
+        if dialect == "sqlite":
+            return func.json_group_array(func.json_object(*args))
+        raise ShortageServiceError(f"Shortage reports are not supported for {dialect!r}")
+
     def generate_shortage_report(self) -> ShortageReport:
         """
         Generate a shortage report for all pharmacies.
-        Baseline implementation uses rule-based shortage logic.
+
+        One grouped query scores every inventory row with the SQL risk CASE
+        and returns, per pharmacy, the item and shortage counts plus its
+        shortage items as a JSON array. Pharmacies and items are listed in
+        inventory order (by inventory id).
         """
         from app.models.db_models import Inventory
 
         generated_at = datetime.utcnow()
+        shortage_service = self.shortage_service
 
-        inventory_rows = self.db.query(Inventory).all()
-        total_items = len(inventory_rows)
-
-        risks = [
-            self.shortage_service.compute_risk(inv)
-            for inv in inventory_rows
-        ]
-
-        shortages = [
-            r
-            for r in risks
-            if r.reason in {"out_of_stock", "critical_low_stock", "low_stock"}
-        ]
-
-        critical_shortages = [
-            r
-            for r in shortages
-            if r.reason in {"out_of_stock", "critical_low_stock"}
-        ]
+        scored = select(
+            Inventory.id,
+            Inventory.pharmacy_id,
+            Inventory.medication_id,
+            Inventory.quantity,
+            shortage_service.risk_code_expr().label("code"),
+        )
+        if shortage_service.mode == "coverage":
+            scored = shortage_service.join_usage(scored)
+        scored = scored.subquery("scored")
 
-        low_shortages = [r for r in shortages if r.reason == "low_stock"]
+        is_shortage = scored.c.code <= SHORTAGE_CODE_MAX
+        rows = self.db.execute(
+            select(
+                scored.c.pharmacy_id,
+                func.count().label("items"),
+                func.count().filter(is_shortage).label("shortages"),
+                func.count().filter(scored.c.code <= CRITICAL_CODE_MAX).label("critical"),
+                func.min(scored.c.id).filter(is_shortage).label("first_shortage_id"),
+                self._json_items(
+                    {
+                        "id": scored.c.id,
+                        "medication_id": scored.c.medication_id,
+                        "quantity": scored.c.quantity,
+                        "code": scored.c.code,
+                    }
+                )
+                .filter(is_shortage)
+                .label("shortage_items"),
+            ).group_by(scored.c.pharmacy_id)
+        ).all()
 
-        by_pharmacy_map: Dict[int, List[ShortageRiskResult]] = {}
-        for risk in shortages:
-            by_pharmacy_map.setdefault(risk.pharmacy_id, []).append(risk)
+        total_items = sum(row.items for row in rows)
+        total_shortages = sum(row.shortages for row in rows)
+        critical_count = sum(row.critical for row in rows)
 
         by_pharmacy: List[Dict[str, Any]] = []
-        for pharmacy_id, items in by_pharmacy_map.items():
+        for row in sorted(
+            (row for row in rows if row.shortages),
+            key=lambda row: row.first_shortage_id,
+        ):
+            raw = row.shortage_items
+            items = json.loads(raw) if isinstance(raw, str) else raw
+            # JSON aggregates do not promise row order
+            items.sort(key=lambda item: item["id"])
             by_pharmacy.append(
                 {
-                    "pharmacy_id": pharmacy_id,
-                    "shortage_count": len(items),
+                    "pharmacy_id": row.pharmacy_id,
+                    "shortage_count": row.shortages,
                     "items": [
                         {
-                            "medication_id": i.medication_id,
-                            "quantity": i.quantity,
-                            "risk_score": i.risk_score,
-                            "reason": i.reason,
+                            "medication_id": item["medication_id"],
+                            "quantity": item["quantity"],
+                            "risk_score": RISK_SCORES[REASONS[item["code"]]],
+                            "reason": REASONS[item["code"]],
                         }
-                        for i in items
+                        for item in items
                     ],
                 }
             )
 
-        trend = {
-            "status": "stable",
-            "note": (
-                "Trend requires historical data; "
-                "baseline is rule-based only."
-            ),
-        }
-
         return ShortageReport(
             generated_at=generated_at,
             total_items=total_items,
-            total_shortages=len(shortages),
-            critical_shortages=len(critical_shortages),
-            low_shortages=len(low_shortages),
+            total_shortages=total_shortages,
+            critical_shortages=critical_count,
+            low_shortages=total_shortages - critical_count,
             by_pharmacy=by_pharmacy,
-            trend=trend,
+            trend=self.shortage_trend(generated_at.date()),
+        )
+
+    def shortage_trend(self, as_of: Optional[date] = None) -> Dict[str, Any]:
+        """
+        Week-over-week shortage trend from the pharmacy_daily rollup.
+
+        A shortage here is quantity <= the shortage service's low_threshold
+        in units, in either scoring mode: the rollup counts crossings of
+        LOW_THRESHOLD, so a service configured with another threshold is
+        rejected. Rollups are as current as the last feature-store catch-up
+        (as_of_watermark, the last stock_history id folded in), so the
+        count is taken at that watermark too: today's count (from
+        inventory) minus the net entries in the history past it. The count
+        on as_of is that minus the net entries after as_of; a week earlier
+        it is that minus the net entries during the week. Reads at most two
+        windows of rollup rows per pharmacy.
+        """
+        from app.models.db_models import FeatureWatermark, Inventory, PharmacyDaily, StockHistory
+
+        threshold = self.shortage_service.low_threshold
+        if threshold != LOW_THRESHOLD:
+            raise ShortageServiceError(
+                f"Shortage trends are rolled up at low_threshold={LOW_THRESHOLD}, "
+                f"not {threshold}"
+            )
+
+        as_of = as_of or datetime.utcnow().date()
+        week_start = as_of - timedelta(days=TREND_WINDOW_DAYS - 1)
+        previous_start = week_start - timedelta(days=TREND_WINDOW_DAYS)
+        previous_end = week_start - timedelta(days=1)
+
+        def window(column: Any, start: date, end: Optional[date], name: str) -> Any:
+            in_window = PharmacyDaily.day >= start
+            if end is not None:
+                in_window = and_(in_window, PharmacyDaily.day <= end)
+            return func.sum(case((in_window, column), else_=0)).label(name)
+
+        net = PharmacyDaily.shortage_entries - PharmacyDaily.shortage_exits
+        after_as_of = as_of + timedelta(days=1)
+        rows = self.db.execute(
+            select(
+                PharmacyDaily.pharmacy_id,
+                window(net, week_start, as_of, "delta"),
+                window(net, previous_start, previous_end, "previous_delta"),
+                window(net, after_as_of, None, "after"),
+                window(PharmacyDaily.shortage_entries, week_start, as_of, "entries"),
+                window(PharmacyDaily.shortage_exits, week_start, as_of, "exits"),
+                window(PharmacyDaily.stockouts, week_start, as_of, "stockouts"),
+                window(PharmacyDaily.stockouts, previous_start, previous_end, "previous_stockouts"),
+                window(PharmacyDaily.decrease, week_start, as_of, "consumed"),
+                window(PharmacyDaily.increase, week_start, as_of, "received"),
+            )
+            .where(PharmacyDaily.day >= previous_start)
+            .group_by(PharmacyDaily.pharmacy_id)
+        ).all()
+
+        def total(name: str) -> int:
+            return int(sum(getattr(row, name) for row in rows))
+
+        # One statement, so the live count and the history past the
+        # watermark come from the same snapshot
+        watermark = func.coalesce(
+            select(FeatureWatermark.last_history_id)
+            .where(FeatureWatermark.name == WATERMARK_NAME)
+            .scalar_subquery(),
+            0,
         )
+        net_entry = case((shortage_entry_expr(), 1), (shortage_exit_expr(), -1), else_=0)
+        live = self.db.execute(
+            select(
+                watermark.label("watermark"),
+                select(func.count())
+                .where(Inventory.quantity <= threshold)
+                .scalar_subquery()
+                .label("shortages"),
+                select(func.coalesce(func.sum(net_entry), 0))
+                .where(StockHistory.id > watermark)
+                .scalar_subquery()
+                .label("unfolded"),
+            )
+        ).one()
+        shortages = live.shortages - live.unfolded - total("after")
+        delta = total("delta")
+        week_ago = shortages - delta
+
+        tolerance = TREND_STABLE_RATIO * max(week_ago, 1)
+        if delta > tolerance:
+            status = "worsening"
+        elif delta < -tolerance:
+            status = "improving"
+        else:
+            status = "stable"
+
+        worsening = sorted(
+            (row for row in rows if row.delta > 0),
+            key=lambda row: (-row.delta, row.pharmacy_id),
+        )[:TREND_TOP_PHARMACIES]
+
+        return {
+            "status": status,
+            "as_of": as_of.isoformat(),
+            "window_days": TREND_WINDOW_DAYS,
+            "shortage_threshold": threshold,
+            "as_of_watermark": live.watermark,
+            "shortages": shortages,
+            "shortages_week_ago": week_ago,
+            "week_over_week_delta": delta,
+            "previous_week_delta": total("previous_delta"),
+            "new_shortages": total("entries"),
+            "resolved_shortages": total("exits"),
+            "stockouts": total("stockouts"),
+            "previous_week_stockouts": total("previous_stockouts"),
+            "units_consumed": total("consumed"),
+            "units_received": total("received"),
+            "pharmacies_worsening": [
+                {"pharmacy_id": row.pharmacy_id, "week_over_week_delta": int(row.delta)}
+                for row in worsening
+            ],
+        }
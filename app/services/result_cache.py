@@ -0,0 +1,196 @@
+"""
+Result cache for report and risk listing reads.
+
+ResultCache sits in front of ReportingService / ShortageService queries
+whose results are served many times between inventory changes (dashboard
+polling). Keys are (namespace, params). Callers put the database's
+version markers in params (the inventory_versions counter and the usage
+feature watermark, see app/api/conditional.py), read before the result.
+Every committed write moves a marker, on whichever worker made it, so the
+next request after the commit asks for a new key; entries for old
+versions simply age out of the LRU. A request that read its marker just
+before a concurrent commit can still store a result under the old key
+that already includes that write, so it is never older than its key.
+
+Single-flight: concurrent misses for the same key share one computation;
+the first caller computes and the others wait for its result (or error).
+
+The backend is pluggable: anything with the CacheBackend methods. The
+default is an in-process TTLCache; a shared backend (e.g. Redis) would
+let workers reuse each other's entries.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Optional,
+    Protocol,
+    Tuple,
+    TypeVar,
+)
+
+from app.utils.cache import TTLCache
+
+# 0 disables the cache (every call computes)
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "30"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1000"))
+
+T = TypeVar("T")
+
+_MISSING = object()
+
+
+class CacheBackend(Protocol):
+    """Storage for ResultCache entries."""
+
+    def get(self, key: Hashable, default: Any = None) -> Any: ...
+
+    def set(self, key: Hashable, value: Any) -> None: ...
+
+    def invalidate(self, keys: Optional[Iterable[Hashable]] = None) -> None: ...
+
+    def stats(self) -> Dict[str, float]: ...
+
+
+class ResultCache:
+    """
+    Single-flight cache of query results.
+
+    Cached values are shared between callers and must not be mutated.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[CacheBackend] = None,
+        *,
+        ttl_seconds: float = RESULT_CACHE_TTL_SECONDS,
+        max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.enabled = backend is not None or ttl_seconds > 0
+        self.backend: CacheBackend = backend or TTLCache(
+            max_entries, max(ttl_seconds, 0.0)
+        )
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, "Future[Any]"] = {}
+        self._tasks: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], "asyncio.Task[Any]"] = {}
+        self.coalesced = 0
+
+    # ---------- helpers ----------
+
+    def key(self, namespace: str, params: Dict[str, Any]) -> Hashable:
+        return (namespace, tuple(sorted(params.items())))
+
+    async def _compute_and_store(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[T]],
+    ) -> T:
+        value = await compute()
+        self.backend.set(key, value)
+        return value
+
+    # ---------- public ----------
+
+    def get_or_compute(
+        self,
+        namespace: str,
+        params: Dict[str, Any],
+        compute: Callable[[], T],
+    ) -> T:
+        """
+        Cached result for (namespace, params), computing it on a miss.
+
+        For threads: concurrent misses wait for the first caller's result.
+        Do not call from an event loop thread (use aget_or_compute).
+        """
+        if not self.enabled:
+            return compute()
+
+        key = self.key(namespace, params)
+        with self._lock:
+            value = self.backend.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return flight.result()
+
+        try:
+            value = compute()
+            self.backend.set(key, value)
+        except BaseException as exc:
+            flight.set_exception(exc)
+            raise
+        else:
+            flight.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    async def aget_or_compute(
+        self,
+        namespace: str,
+        params: Dict[str, Any],
+        compute: Callable[[], Awaitable[T]],
+    ) -> T:
+        """
+        Async get_or_compute: concurrent misses on this event loop await
+        one computation, run as a task by the first caller.
+
+        If that caller is cancelled the computation is cancelled with it
+        (it runs on the caller's session); waiting callers then retry.
+        """
+        if not self.enabled:
+            return await compute()
+
+        loop = asyncio.get_running_loop()
+        while True:
+            key = self.key(namespace, params)
+            value = self.backend.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+            task_key = (loop, key)
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = loop.create_task(self._compute_and_store(key, compute))
+                self._tasks[task_key] = task
+                task.add_done_callback(lambda _: self._tasks.pop(task_key, None))
+                return await task
+
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise
+
+    def clear(self) -> None:
+        self.backend.invalidate()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "coalesced": self.coalesced,
+            **self.backend.stats(),
+        }
+
+
+# Shared by the API process
+result_cache = ResultCache()
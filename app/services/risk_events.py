@@ -0,0 +1,242 @@
+"""
+Fan-out of shortage risk level changes to streaming subscribers.
+
+InventoryService publishes the RiskLevelChange events returned by
+ShortageService.refresh_risks() once its write commits. RiskEventBroker
+hands them to a transport, which delivers them to every broker that
+should see them; each broker then pushes them to its local subscribers
+(GET /events/risk-levels streams).
+
+Transports (RISK_EVENTS_BACKEND):
+- local: delivery within this process only (one API worker).
+- postgres: NOTIFY on RISK_EVENTS_CHANNEL through the writer's session;
+  every worker LISTENs on a dedicated connection (RiskEventBroker.run())
+  and relays the notifications, so a write on one worker reaches
+  subscribers on all of them.
+
+Backpressure: each subscriber has a bounded queue. When a slow client
+lets it fill up, the oldest event is dropped and counted (the stream tells
+the client, which can resync from GET /inventory/shortage-risks); the
+publisher never waits for a subscriber.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Protocol, Sequence, Set
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.services.shortage_service import RiskLevelChange
+
+logger = logging.getLogger(__name__)
+
+RISK_EVENTS_BACKEND = os.getenv("RISK_EVENTS_BACKEND", "local")
+# Events buffered per subscriber before the oldest are dropped
+RISK_EVENTS_QUEUE_SIZE = int(os.getenv("RISK_EVENTS_QUEUE_SIZE", "1000"))
+
+RISK_EVENTS_CHANNEL = "risk_level_changes"
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_PAYLOAD_LIMIT = 7500
+LISTEN_RETRY_SECONDS = 5.0
+
+Dispatch = Callable[[Sequence[RiskLevelChange]], None]
+
+
+class RiskEventTransport(Protocol):
+    """Carries published events to the brokers that deliver them."""
+
+    def send(self, db: Session, events: Sequence[RiskLevelChange], dispatch: Dispatch) -> None: ...
+
+    async def listen(self, dispatch: Dispatch) -> None: ...
+
+
+class LocalTransport:
+    """Delivers to this process's subscribers only."""
+
+    def send(self, db: Session, events: Sequence[RiskLevelChange], dispatch: Dispatch) -> None:
+        dispatch(events)
+
+    async def listen(self, dispatch: Dispatch) -> None:
+        return None
+
+
+def notify_payloads(events: Iterable[RiskLevelChange]) -> Iterator[str]:
+    """JSON arrays of events, each under NOTIFY_PAYLOAD_LIMIT bytes."""
+    batch: List[str] = []
+    size = 2
+    for event in events:
+        item = json.dumps(event.to_dict(), separators=(",", ":"))
+        if batch and size + len(item) + 1 > NOTIFY_PAYLOAD_LIMIT:
+            yield "[" + ",".join(batch) + "]"
+            batch, size = [], 2
+        batch.append(item)
+        size += len(item) + 1
+    if batch:
+        yield "[" + ",".join(batch) + "]"
+
+
+class PostgresNotifyTransport:
+    """
+    Cross-worker delivery with PostgreSQL LISTEN/NOTIFY.
+
+    send() runs pg_notify on the writer's own connection, in a short
+    transaction after its write committed; listen() keeps a dedicated
+    autocommit connection (reconnecting after errors) and dispatches what
+    arrives, including this worker's own notifications.
+    """
+
+    def __init__(self, conninfo: str, channel: str = RISK_EVENTS_CHANNEL) -> None:
+        self.conninfo = conninfo
+        self.channel = channel
+
+    def send(self, db: Session, events: Sequence[RiskLevelChange], dispatch: Dispatch) -> None:
+        try:
+            for payload in notify_payloads(events):
+                db.execute(select(func.pg_notify(self.channel, payload)))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    async def listen(self, dispatch: Dispatch) -> None:
+        import psycopg
+
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    self.conninfo, autocommit=True
+                ) as conn:
+                    await conn.execute(f'LISTEN "{self.channel}"')
+                    async for notify in conn.notifies():
+                        dispatch(
+                            [RiskLevelChange.from_dict(item) for item in json.loads(notify.payload)]
+                        )
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f"Risk event listener failed, retrying: {exc}")
+                await asyncio.sleep(LISTEN_RETRY_SECONDS)
+
+
+class Subscription:
+    """
+    One stream's view of the events: optionally limited to some
+    pharmacies, buffered in a bounded queue on the subscriber's loop.
+    """
+
+    def __init__(self, pharmacy_ids: Optional[Iterable[int]], queue_size: int) -> None:
+        self.pharmacy_ids = frozenset(pharmacy_ids) if pharmacy_ids else None
+        self.loop = asyncio.get_running_loop()
+        self.queue: "asyncio.Queue[RiskLevelChange]" = asyncio.Queue(queue_size)
+        self.dropped = 0
+
+    def wants(self, event: RiskLevelChange) -> bool:
+        return self.pharmacy_ids is None or event.pharmacy_id in self.pharmacy_ids
+
+    def push(self, events: Sequence[RiskLevelChange]) -> None:
+        """Enqueue events, dropping the oldest when full (runs on self.loop)."""
+        for event in events:
+            if self.queue.full():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(event)
+
+    async def get(self) -> RiskLevelChange:
+        return await self.queue.get()
+
+
+class RiskEventBroker:
+    """
+    In-process pub/sub of RiskLevelChange events, behind a transport.
+    """
+
+    def __init__(
+        self,
+        transport: Optional[RiskEventTransport] = None,
+        *,
+        queue_size: int = RISK_EVENTS_QUEUE_SIZE,
+    ) -> None:
+        self.transport = transport or LocalTransport()
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscriptions: Set[Subscription] = set()
+
+    # ---------- subscribers ----------
+
+    def subscribe(self, pharmacy_ids: Optional[Iterable[int]] = None) -> Subscription:
+        """Start receiving events (call from the subscriber's event loop)."""
+        subscription = Subscription(pharmacy_ids, self.queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def dispatch(self, events: Sequence[RiskLevelChange]) -> None:
+        """
+        Push events to the matching local subscribers. Safe from any
+        thread: delivery is scheduled on each subscriber's loop.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            matching = [event for event in events if subscription.wants(event)]
+            if not matching:
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, matching)
+            except RuntimeError:
+                # The subscriber's loop is closed
+                self.unsubscribe(subscription)
+
+    # ---------- publishers ----------
+
+    def publish(self, db: Session, events: Sequence[RiskLevelChange]) -> None:
+        """
+        Send events for a committed write. Never raises: the write already
+        happened, and subscribers can resync from the risk list.
+        """
+        if not events:
+            return
+        try:
+            self.transport.send(db, events, self.dispatch)
+        except Exception as exc:
+            logger.warning(f"Failed to publish {len(events)} risk level changes: {exc}")
+
+    async def run(self) -> None:
+        """Relay events from other workers (a no-op for the local transport)."""
+        await self.transport.listen(self.dispatch)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        return {
+            "backend": type(self.transport).__name__,
+            "subscribers": len(subscriptions),
+            "dropped": sum(s.dropped for s in subscriptions),
+        }
+
+
+def make_transport(backend: str = RISK_EVENTS_BACKEND) -> RiskEventTransport:
+    if backend == "local":
+        return LocalTransport()
+    if backend == "postgres":
+        from sqlalchemy.engine import make_url
+
+        from app.database.connection import get_database_url
+
+        # libpq connection string for psycopg (no SQLAlchemy driver suffix)
+        url = make_url(get_database_url()).set(drivername="postgresql")
+        return PostgresNotifyTransport(url.render_as_string(hide_password=False))
+    raise ValueError(f"RISK_EVENTS_BACKEND must be 'local' or 'postgres', not {backend!r}")
+
+
+# Shared by the API process
+risk_events = RiskEventBroker(make_transport())
@@ -1,15 +1,142 @@
 from __future__ import annotations
 
+import os
 from dataclasses import dataclass
 from datetime import datetime
-from typing import List, TYPE_CHECKING
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, TYPE_CHECKING
 
+import numpy as np
+from sqlalchemy import (
+    DateTime,
+    Float,
+    Select,
+    and_,
+    case,
+    cast,
+    delete,
+    false,
+    func,
+    literal,
+    select,
+    true,
+    tuple_,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
 
 if TYPE_CHECKING:
     from app.models.db_models import Inventory
 
 
+# Default quantity thresholds (units); LOW_THRESHOLD also defines the
+# shortage crossings counted by the pharmacy_daily rollup.
+CRITICAL_THRESHOLD = 5
+LOW_THRESHOLD = 15
+
+# "quantity": fixed stock thresholds only. "coverage": days of cover
+# (quantity / average daily usage) wherever usage is known, falling back to
+# the quantity thresholds for pairs without usable history.
+RISK_MODES = ("quantity", "coverage")
+SHORTAGE_RISK_MODE = os.getenv("SHORTAGE_RISK_MODE", "quantity")
+
+# reason -> risk_score, shared by the Python and SQL implementations.
+# Ordered from most to least severe (reporting relies on the order).
+RISK_SCORES = {
+    "out_of_stock": 1.0,
+    "critical_low_stock": 0.85,
+    "critical_low_cover": 0.85,
+    "low_stock": 0.55,
+    "low_cover": 0.55,
+    "stock_ok": 0.15,
+}
+
+# Reason codes used by compute_risk_many: index into REASONS
+REASONS = tuple(RISK_SCORES)
+_SCORE_BY_CODE = np.array([RISK_SCORES[reason] for reason in REASONS])
+_CODE = {reason: code for code, reason in enumerate(REASONS)}
+
+# Pairs per usage_features lookup in daily_usage_many()
+USAGE_LOOKUP_CHUNK = 5000
+
+# risk level -> [min_score, max_score) as used by get_risk_level()
+RISK_LEVEL_RANGES = {
+    "CRITICAL": (0.8, None),
+    "WARNING": (0.5, 0.8),
+    "LOW": (0.3, 0.5),
+    "NORMAL": (None, 0.3),
+}
+
+
+class ShortageServiceError(Exception):
+    """Raised when shortage risks cannot be computed or stored."""
+
+
+def get_risk_level(risk_score: float) -> str:
+    """Convert risk score to human-readable level"""
+    if risk_score >= 0.8:
+        return "CRITICAL"
+    elif risk_score >= 0.5:
+        return "WARNING"
+    elif risk_score >= 0.3:
+        return "LOW"
+    else:
+        return "NORMAL"
+
+
+@dataclass(frozen=True)
+class RiskArrays:
+    """
+    Column-oriented risk for many inventory rows (see compute_risk_many).
+    """
+    pharmacy_id: np.ndarray
+    medication_id: np.ndarray
+    quantity: np.ndarray
+    risk_score: np.ndarray   # float64
+    reason_code: np.ndarray  # int8 index into REASONS
+    days_of_cover: np.ndarray  # float64, NaN where usage is unknown or zero
+    calculated_at: datetime  # shared by every row
+
+    def __len__(self) -> int:
+        return len(self.quantity)
+
+    @property
+    def reasons(self) -> np.ndarray:
+        return np.asarray(REASONS, dtype=object)[self.reason_code]
+
+    @property
+    def risk_levels(self) -> np.ndarray:
+        levels = np.asarray([get_risk_level(s) for s in _SCORE_BY_CODE], dtype=object)
+        return levels[self.reason_code]
+
+    def results(self) -> List["ShortageRiskResult"]:
+        return [
+            ShortageRiskResult(
+                pharmacy_id=pharmacy_id,
+                medication_id=medication_id,
+                quantity=quantity,
+                risk_score=risk_score,
+                reason=reason,
+                calculated_at=self.calculated_at,
+                days_of_cover=days_of_cover,
+            )
+            for pharmacy_id, medication_id, quantity, risk_score, reason, days_of_cover in zip(
+                self.pharmacy_id.tolist(),
+                self.medication_id.tolist(),
+                self.quantity.tolist(),
+                self.risk_score.tolist(),
+                self.reasons.tolist(),
+                self.days_of_cover_values(),
+            )
+        ]
+
+    def days_of_cover_values(self) -> List[Optional[float]]:
+        """days_of_cover as a list, None where it is unknown."""
+        return [
+            None if np.isnan(value) else value for value in self.days_of_cover.tolist()
+        ]
+
+
 @dataclass(frozen=True)
 class ShortageRiskResult:
     pharmacy_id: int
@@ -18,6 +145,41 @@ class ShortageRiskResult:
     risk_score: float  # 0.0 (low) -> 1.0 (high)
     reason: str
     calculated_at: datetime
+    level_changed_at: Optional[datetime] = None  # set for shortage_risk rows
+    days_of_cover: Optional[float] = None  # None without known daily usage
+
+
+@dataclass(frozen=True)
+class RiskLevelChange:
+    """
+    A pair whose stored risk_level moved (see ShortageService.refresh_risks).
+
+    previous_level is None for a pair scored for the first time.
+    """
+    pharmacy_id: int
+    medication_id: int
+    previous_level: Optional[str]
+    risk_level: str
+    risk_score: float
+    quantity: int
+    days_of_cover: Optional[float]
+    changed_at: datetime
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pharmacy_id": self.pharmacy_id,
+            "medication_id": self.medication_id,
+            "previous_level": self.previous_level,
+            "risk_level": self.risk_level,
+            "risk_score": self.risk_score,
+            "quantity": self.quantity,
+            "days_of_cover": self.days_of_cover,
+            "changed_at": self.changed_at.isoformat(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "RiskLevelChange":
+        return cls(**{**data, "changed_at": datetime.fromisoformat(data["changed_at"])})
 
 
 class ShortageService:
@@ -27,18 +189,34 @@ class ShortageService:
     Baseline implementation is rule-based (thresholds) so the system can work
     before ML is integrated. Later, swap compute_risk() with model inference
     while keeping the same interface.
+
+    In "coverage" mode the thresholds are in days of cover instead of units,
+    so a fast mover and a slow mover with the same stock score differently.
+    Average daily usage is the one the model trains on (usage_rate_per_day:
+    total decrease over the span of a pair's history, from usage_features).
     """
 
     def __init__(
         self,
         db: Session,
         *,
-        critical_threshold: int = 5,
-        low_threshold: int = 15,
+        critical_threshold: int = CRITICAL_THRESHOLD,
+        low_threshold: int = LOW_THRESHOLD,
+        mode: str = SHORTAGE_RISK_MODE,
+        critical_cover_days: float = 3.0,
+        low_cover_days: float = 7.0,
+        min_history_points: int = 2,
     ) -> None:
+        if mode not in RISK_MODES:
+            raise ValueError(f"Unknown shortage risk mode {mode!r}; expected one of {RISK_MODES}")
+
         self.db = db
         self.critical_threshold = critical_threshold
         self.low_threshold = low_threshold
+        self.mode = mode
+        self.critical_cover_days = critical_cover_days
+        self.low_cover_days = low_cover_days
+        self.min_history_points = min_history_points
 
     def calculate_daily_coverage(
         self,
@@ -48,9 +226,12 @@ class ShortageService:
         """
         Calculate how many days the current stock will last.
 
-        This is a baseline helper for demand-based shortage detection.
-        It will be used later when sales/demand data is available.
+        Out-of-stock items have no cover; without measurable usage the
+        stock lasts indefinitely.
         """
+        if quantity <= 0:
+            return 0.0
+
         if avg_daily_usage <= 0:
             return float("inf")
 
@@ -59,6 +240,7 @@ class ShortageService:
     def compute_risk(
         self,
         inventory: "Inventory",
+        avg_daily_usage: Optional[float] = None,
     ) -> ShortageRiskResult:
         """
         Compute shortage risk for one inventory record.
@@ -68,67 +250,744 @@ class ShortageService:
         - qty <= critical_threshold -> 0.85 (critical low stock)
         - qty <= low_threshold      -> 0.55 (low stock)
         - else -> 0.15 (stock ok)
+
+        In coverage mode, when avg_daily_usage is known, the last three
+        become days of cover <= critical_cover_days (0.85), <=
+        low_cover_days (0.55), else 0.15.
         """
         qty = int(getattr(inventory, "quantity"))
-        now = datetime.utcnow()
+        reason = self.classify(qty, avg_daily_usage)
+
+        days_of_cover = None
+        if avg_daily_usage is not None:
+            days_of_cover = self.calculate_daily_coverage(qty, avg_daily_usage)
+            if days_of_cover == float("inf"):
+                days_of_cover = None
+
+        return ShortageRiskResult(
+            pharmacy_id=int(getattr(inventory, "pharmacy_id")),
+            medication_id=int(getattr(inventory, "medication_id")),
+            quantity=qty,
+            risk_score=RISK_SCORES[reason],
+            reason=reason,
+            calculated_at=datetime.utcnow(),
+            days_of_cover=days_of_cover,
+        )
+
+    def compute_risk_many(
+        self,
+        quantity: Any,
+        pharmacy_id: Any,
+        medication_id: Any,
+        now: Optional[datetime] = None,
+        daily_usage: Any = None,
+    ) -> RiskArrays:
+        """
+        compute_risk() over column arrays in one vectorized pass.
+
+        daily_usage is the average daily usage per row (NaN where unknown;
+        see daily_usage_many). Scores, reason codes and days of cover come
+        back as numpy arrays; every row shares one calculated_at timestamp.
+        """
+        qty = np.asarray(quantity, dtype=np.int64)
+        if daily_usage is None:
+            usage = np.full(len(qty), np.nan)
+        else:
+            usage = np.asarray(daily_usage, dtype=np.float64)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cover = np.where(usage > 0, qty / usage, np.nan)
+        cover = np.where(qty <= 0, 0.0, cover)
 
-        pharmacy_id = int(getattr(inventory, "pharmacy_id"))
-        medication_id = int(getattr(inventory, "medication_id"))
+        if self.mode == "coverage":
+            unknown = np.isnan(usage)
+            conditions = [
+                qty <= 0,
+                unknown & (qty <= self.critical_threshold),
+                unknown & (qty <= self.low_threshold),
+                cover <= self.critical_cover_days,
+                cover <= self.low_cover_days,
+            ]
+            reasons = ["out_of_stock", "critical_low_stock", "low_stock",
+                       "critical_low_cover", "low_cover"]
+        else:
+            conditions = [qty <= 0, qty <= self.critical_threshold, qty <= self.low_threshold]
+            reasons = ["out_of_stock", "critical_low_stock", "low_stock"]
 
+        code = np.select(
+            conditions,
+            [_CODE[reason] for reason in reasons],
+            default=_CODE["stock_ok"],
+        ).astype(np.int8)
+
+        return RiskArrays(
+            pharmacy_id=np.asarray(pharmacy_id, dtype=np.int64),
+            medication_id=np.asarray(medication_id, dtype=np.int64),
+            quantity=qty,
+            risk_score=_SCORE_BY_CODE[code],
+            reason_code=code,
+            days_of_cover=cover,
+            calculated_at=now or datetime.utcnow(),
+        )
+
+    def classify_quantity(self, qty: int) -> str:
+        """Reason (a RISK_SCORES key) for a stock quantity"""
         if qty <= 0:
-            return ShortageRiskResult(
-                pharmacy_id=pharmacy_id,
-                medication_id=medication_id,
-                quantity=qty,
-                risk_score=1.0,
-                reason="out_of_stock",
-                calculated_at=now,
+            return "out_of_stock"
+        if qty <= self.critical_threshold:
+            return "critical_low_stock"
+        if qty <= self.low_threshold:
+            return "low_stock"
+        return "stock_ok"
+
+    def classify(self, qty: int, avg_daily_usage: Optional[float] = None) -> str:
+        """Reason for a stock quantity under the current mode"""
+        if self.mode != "coverage" or avg_daily_usage is None or qty <= 0:
+            return self.classify_quantity(qty)
+
+        days_of_cover = self.calculate_daily_coverage(qty, avg_daily_usage)
+        if days_of_cover <= self.critical_cover_days:
+            return "critical_low_cover"
+        if days_of_cover <= self.low_cover_days:
+            return "low_cover"
+        return "stock_ok"
+
+    # ---------- usage ----------
+
+    def _span_days_expr(self) -> ColumnElement[float]:
+        """Days between a pair's first and last history change, in SQL."""
+        from app.models.db_models import UsageFeatures
+
+        first, last = UsageFeatures.first_change, UsageFeatures.last_change
+        if self.db.get_bind().dialect.name == "sqlite":
+            return func.julianday(last) - func.julianday(first)
+        return cast(func.extract("epoch", last - first), Float) / 86400.0
+
+    def daily_usage_expr(self) -> ColumnElement[float]:
+        """
+        Average daily usage from usage_features, NULL where it is unknown
+        (fewer than min_history_points changes, or all on one instant).
+
+        Same definition as train_baseline_model's usage_rate_per_day.
+        """
+        from app.models.db_models import UsageFeatures
+
+        span = self._span_days_expr()
+        return case(
+            (
+                and_(UsageFeatures.history_points >= self.min_history_points, span > 0),
+                cast(UsageFeatures.total_decrease, Float) / span,
+            ),
+            else_=None,
+        )
+
+    def usage_lookup_expr(self) -> ColumnElement[float]:
+        """
+        daily_usage_expr() of the current inventory row as a correlated
+        scalar subquery (NULL without a usage_features row), for
+        statements that do not join usage_features.
+        """
+        from app.models.db_models import Inventory, UsageFeatures
+
+        return (
+            select(self.daily_usage_expr())
+            .where(
+                UsageFeatures.pharmacy_id == Inventory.pharmacy_id,
+                UsageFeatures.medication_id == Inventory.medication_id,
             )
+            .correlate(Inventory)
+            .scalar_subquery()
+        )
 
-        if qty <= self.critical_threshold:
-            return ShortageRiskResult(
-                pharmacy_id=pharmacy_id,
-                medication_id=medication_id,
-                quantity=qty,
-                risk_score=0.85,
-                reason="critical_low_stock",
-                calculated_at=now,
+    def join_usage(self, stmt: Select) -> Select:
+        """LEFT JOIN usage_features onto a statement selecting from inventory."""
+        from app.models.db_models import Inventory, UsageFeatures
+
+        return stmt.outerjoin(
+            UsageFeatures,
+            and_(
+                UsageFeatures.pharmacy_id == Inventory.pharmacy_id,
+                UsageFeatures.medication_id == Inventory.medication_id,
+            ),
+        )
+
+    def daily_usage_many(self, pairs: Sequence[Tuple[int, int]]) -> np.ndarray:
+        """
+        Average daily usage for each (pharmacy_id, medication_id), aligned
+        with pairs (NaN where unknown).
+        """
+        from app.models.db_models import UsageFeatures
+
+        usage = np.full(len(pairs), np.nan)
+        position = {pair: i for i, pair in enumerate(pairs)}
+        pair_columns = tuple_(UsageFeatures.pharmacy_id, UsageFeatures.medication_id)
+
+        for start in range(0, len(pairs), USAGE_LOOKUP_CHUNK):
+            chunk = pairs[start:start + USAGE_LOOKUP_CHUNK]
+            rows = self.db.execute(
+                select(
+                    UsageFeatures.pharmacy_id,
+                    UsageFeatures.medication_id,
+                    self.daily_usage_expr(),
+                ).where(pair_columns.in_(chunk))
             )
+            for pharmacy_id, medication_id, rate in rows:
+                if rate is not None:
+                    usage[position[(pharmacy_id, medication_id)]] = rate
 
-        if qty <= self.low_threshold:
-            return ShortageRiskResult(
-                pharmacy_id=pharmacy_id,
-                medication_id=medication_id,
-                quantity=qty,
-                risk_score=0.55,
-                reason="low_stock",
-                calculated_at=now,
+        return usage
+
+    # ---------- SQL scoring ----------
+
+    def days_of_cover_expr(
+        self, usage: Optional[ColumnElement[float]] = None
+    ) -> ColumnElement[float]:
+        """
+        calculate_daily_coverage() in SQL; NULL where usage is unknown or
+        zero. Needs usage_features joined (see join_usage) unless usage is
+        given (e.g. usage_lookup_expr()).
+        """
+        from app.models.db_models import Inventory
+
+        qty = Inventory.quantity
+        if usage is None:
+            usage = self.daily_usage_expr()
+        return case(
+            (qty <= 0, 0.0),
+            (usage > 0, cast(qty, Float) / usage),
+            else_=None,
+        )
+
+    def _risk_case(
+        self,
+        by_reason: Mapping[str, Any],
+        usage: Optional[ColumnElement[float]] = None,
+    ) -> ColumnElement[Any]:
+        """
+        classify() as a SQL CASE over inventory.quantity (and, in coverage
+        mode, the joined usage_features or the given usage expression),
+        yielding by_reason[reason].
+        """
+        from app.models.db_models import Inventory
+
+        qty = Inventory.quantity
+        if self.mode != "coverage":
+            return case(
+                (qty <= 0, by_reason["out_of_stock"]),
+                (qty <= self.critical_threshold, by_reason["critical_low_stock"]),
+                (qty <= self.low_threshold, by_reason["low_stock"]),
+                else_=by_reason["stock_ok"],
             )
 
-        return ShortageRiskResult(
+        if usage is None:
+            usage = self.daily_usage_expr()
+        unknown = usage.is_(None)
+        cover = self.days_of_cover_expr(usage)
+        return case(
+            (qty <= 0, by_reason["out_of_stock"]),
+            (and_(unknown, qty <= self.critical_threshold), by_reason["critical_low_stock"]),
+            (and_(unknown, qty <= self.low_threshold), by_reason["low_stock"]),
+            (cover <= self.critical_cover_days, by_reason["critical_low_cover"]),
+            (cover <= self.low_cover_days, by_reason["low_cover"]),
+            else_=by_reason["stock_ok"],
+        )
+
+    def risk_score_expr(self) -> ColumnElement[float]:
+        """
+        compute_risk() rules as a SQL CASE over inventory.quantity.
+        """
+        return self._risk_case(RISK_SCORES)
+
+    def risk_reason_expr(self) -> ColumnElement[str]:
+        return self._risk_case({reason: reason for reason in RISK_SCORES})
+
+    def risk_level_expr(self) -> ColumnElement[str]:
+        return self._risk_case(
+            {reason: get_risk_level(score) for reason, score in RISK_SCORES.items()}
+        )
+
+    def risk_code_expr(self) -> ColumnElement[int]:
+        """compute_risk_many()'s reason_code (index into REASONS) in SQL"""
+        return self._risk_case(_CODE)
+
+    def _max_quantity_for(self, min_risk: float) -> Optional[float]:
+        """
+        Largest quantity whose score is >= min_risk.
+
+        Scores only decrease as quantity grows, so "score >= min_risk" is the
+        same as "quantity <= bound" (None = every quantity qualifies).
+        """
+        if min_risk <= RISK_SCORES["stock_ok"]:
+            return None
+        if min_risk <= RISK_SCORES["low_stock"]:
+            return self.low_threshold
+        if min_risk <= RISK_SCORES["critical_low_stock"]:
+            return self.critical_threshold
+        if min_risk <= RISK_SCORES["out_of_stock"]:
+            return 0
+        return float("-inf")
+
+    def risk_filter(
+        self,
+        min_risk: Optional[float] = None,
+        max_risk: Optional[float] = None,
+    ) -> ColumnElement[bool]:
+        """
+        WHERE clause for min_risk <= risk_score < max_risk.
+
+        Expressed on inventory.quantity so PostgreSQL can use the quantity
+        indexes instead of evaluating the CASE for every row. Only needs
+        inventory in the FROM list: in coverage mode usage is looked up
+        per row (usage_lookup_expr), so callers need not join_usage.
+        """
+        from app.models.db_models import Inventory
+
+        monotonic = 0 <= self.critical_threshold <= self.low_threshold
+        if self.mode == "coverage" or not monotonic:
+            # Score is not a function of quantity alone (coverage mode) or
+            # not monotonic in it: fall back to filtering on the CASE.
+            usage = self.usage_lookup_expr() if self.mode == "coverage" else None
+            score = self._risk_case(RISK_SCORES, usage)
+            clauses = []
+            if min_risk is not None:
+                clauses.append(score >= min_risk)
+            if max_risk is not None:
+                clauses.append(score < max_risk)
+            return and_(true(), *clauses)
+
+        clauses = []
+
+        if min_risk is not None:
+            bound = self._max_quantity_for(min_risk)
+            if bound == float("-inf"):
+                return false()
+            if bound is not None:
+                clauses.append(Inventory.quantity <= bound)
+
+        if max_risk is not None:
+            bound = self._max_quantity_for(max_risk)
+            if bound is None:
+                return false()
+            if bound != float("-inf"):
+                clauses.append(Inventory.quantity > bound)
+
+        return and_(true(), *clauses)
+
+    def risk_statement(
+        self,
+        *,
+        pharmacy_id: Optional[int] = None,
+        min_risk: Optional[float] = None,
+        risk_level: Optional[str] = None,
+    ) -> Select:
+        """
+        SELECT pharmacy_id, medication_id, quantity, risk_score, reason,
+        days_of_cover for the inventory rows matching the filters.
+        """
+        from app.models.db_models import Inventory
+
+        stmt = self.join_usage(
+            select(
+                Inventory.pharmacy_id,
+                Inventory.medication_id,
+                Inventory.quantity,
+                self.risk_score_expr().label("risk_score"),
+                self.risk_reason_expr().label("reason"),
+                self.days_of_cover_expr().label("days_of_cover"),
+            )
+        )
+
+        if pharmacy_id is not None:
+            stmt = stmt.where(Inventory.pharmacy_id == pharmacy_id)
+
+        if min_risk is not None:
+            stmt = stmt.where(self.risk_filter(min_risk=min_risk))
+
+        if risk_level is not None:
+            level_min, level_max = RISK_LEVEL_RANGES[risk_level]
+            stmt = stmt.where(self.risk_filter(level_min, level_max))
+
+        return stmt
+
+    def list_risks(
+        self,
+        *,
+        pharmacy_id: Optional[int] = None,
+        min_risk: Optional[float] = None,
+        risk_level: Optional[str] = None,
+    ) -> List[ShortageRiskResult]:
+        """
+        Risk for every matching inventory row, scored and filtered in SQL.
+
+        Returns the same results as calling compute_risk() on each row.
+        """
+        stmt = self.risk_statement(
             pharmacy_id=pharmacy_id,
-            medication_id=medication_id,
-            quantity=qty,
-            risk_score=0.15,
-            reason="stock_ok",
-            calculated_at=now,
+            min_risk=min_risk,
+            risk_level=risk_level,
         )
+        return self.to_results(self.db.execute(stmt))
+
+    def to_results(self, rows: Iterable[Any]) -> List[ShortageRiskResult]:
+        """
+        Convert rows selected by risk_statement() or stored_risk_statement()
+        into ShortageRiskResults.
+        """
+        now = datetime.utcnow()
+
+        return [
+            ShortageRiskResult(
+                pharmacy_id=row.pharmacy_id,
+                medication_id=row.medication_id,
+                quantity=row.quantity,
+                risk_score=float(row.risk_score),
+                reason=row.reason,
+                calculated_at=getattr(row, "calculated_at", None) or now,
+                level_changed_at=getattr(row, "level_changed_at", None),
+                days_of_cover=getattr(row, "days_of_cover", None),
+            )
+            for row in rows
+        ]
 
     def get_high_risk_items(
         self,
         min_risk: float = 0.8,
+        pharmacy_id: Optional[int] = None,
     ) -> List[ShortageRiskResult]:
         """
         Return inventory items whose computed risk_score >= min_risk.
         """
-        # Local import to avoid import-time issues before models exist
-        from app.models.db_models import Inventory
+        return self.list_risks(pharmacy_id=pharmacy_id, min_risk=min_risk)
 
-        inventory_rows = self.db.query(Inventory).all()
-        results = [self.compute_risk(inv) for inv in inventory_rows]
+    # ---------- shortage_risk table ----------
 
-        return [
-            result
-            for result in results
-            if result.risk_score >= min_risk
+    def _risk_upsert(self, stmt: Any) -> Any:
+        """
+        Add ON CONFLICT (pharmacy_id, medication_id) DO UPDATE to an insert
+        into shortage_risk. level_changed_at only moves with risk_level.
+        """
+        from app.models.db_models import ShortageRisk
+
+        table = ShortageRisk.__table__
+        return stmt.on_conflict_do_update(
+            index_elements=[table.c.pharmacy_id, table.c.medication_id],
+            set_={
+                "quantity": stmt.excluded.quantity,
+                "risk_score": stmt.excluded.risk_score,
+                "reason": stmt.excluded.reason,
+                "risk_level": stmt.excluded.risk_level,
+                "days_of_cover": stmt.excluded.days_of_cover,
+                "calculated_at": stmt.excluded.calculated_at,
+                "level_changed_at": case(
+                    (
+                        table.c.risk_level == stmt.excluded.risk_level,
+                        table.c.level_changed_at,
+                    ),
+                    else_=stmt.excluded.level_changed_at,
+                ),
+            },
+        )
+
+    def _risk_insert(self) -> Any:
+        from app.models.db_models import ShortageRisk
+
+        dialect = self.db.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            raise ShortageServiceError(
+                f"shortage_risk upserts are not supported for {dialect!r}"
+            )
+        return dialect_insert(ShortageRisk.__table__)
+
+    def stored_levels(self, pairs: Sequence[Tuple[int, int]]) -> Dict[Tuple[int, int], str]:
+        """
+        Current shortage_risk.risk_level of the pairs that have a row,
+        locking those rows until the transaction ends (in pair order, so
+        concurrent writers cannot deadlock).
+        """
+        from app.models.db_models import ShortageRisk
+
+        levels: Dict[Tuple[int, int], str] = {}
+        pair_columns = tuple_(ShortageRisk.pharmacy_id, ShortageRisk.medication_id)
+
+        for start in range(0, len(pairs), USAGE_LOOKUP_CHUNK):
+            chunk = pairs[start:start + USAGE_LOOKUP_CHUNK]
+            rows = self.db.execute(
+                select(
+                    ShortageRisk.pharmacy_id,
+                    ShortageRisk.medication_id,
+                    ShortageRisk.risk_level,
+                )
+                .where(pair_columns.in_(chunk))
+                .order_by(ShortageRisk.pharmacy_id, ShortageRisk.medication_id)
+                .with_for_update()
+            )
+            for pharmacy_id, medication_id, level in rows:
+                levels[(pharmacy_id, medication_id)] = level
+
+        return levels
+
+    def refresh_risks(
+        self,
+        quantities: Iterable[Tuple[int, int, int]],
+        now: Optional[datetime] = None,
+    ) -> List[RiskLevelChange]:
+        """
+        Upsert shortage_risk for (pharmacy_id, medication_id, quantity) rows.
+
+        Runs in the caller's transaction (no commit), so the stored risk
+        always matches the inventory row written alongside it. Returns the
+        pairs whose risk level moved (or that were scored for the first
+        time), for InventoryService to publish once it commits.
+
+        Usage is only read in coverage mode, where it drives the score. In
+        quantity mode days_of_cover is left NULL (0.0 when out of stock)
+        until the usage catch-up rescores the pair; the write's own
+        stock_history row is what queues it for that.
+        """
+        quantities = sorted(quantities)
+        if not quantities:
+            return []
+
+        pharmacy_ids, medication_ids, qtys = zip(*quantities)
+        pairs = list(zip(pharmacy_ids, medication_ids))
+        previous_levels = self.stored_levels(pairs)
+        usage = self.daily_usage_many(pairs) if self.mode == "coverage" else None
+        risks = self.compute_risk_many(qtys, pharmacy_ids, medication_ids, now, usage)
+        now = risks.calculated_at
+
+        rows = [
+            {
+                "pharmacy_id": pharmacy_id,
+                "medication_id": medication_id,
+                "quantity": quantity,
+                "risk_score": score,
+                "reason": reason,
+                "risk_level": level,
+                "days_of_cover": days_of_cover,
+                "level_changed_at": now,
+                "calculated_at": now,
+            }
+            for pharmacy_id, medication_id, quantity, score, reason, level, days_of_cover in zip(
+                risks.pharmacy_id.tolist(),
+                risks.medication_id.tolist(),
+                risks.quantity.tolist(),
+                risks.risk_score.tolist(),
+                risks.reasons.tolist(),
+                risks.risk_levels.tolist(),
+                risks.days_of_cover_values(),
+            )
         ]
+        self.db.execute(self._risk_upsert(self._risk_insert()), rows)
+
+        changes = []
+        for row in rows:
+            previous = previous_levels.get((row["pharmacy_id"], row["medication_id"]))
+            if previous != row["risk_level"]:
+                changes.append(
+                    RiskLevelChange(
+                        pharmacy_id=row["pharmacy_id"],
+                        medication_id=row["medication_id"],
+                        previous_level=previous,
+                        risk_level=row["risk_level"],
+                        risk_score=row["risk_score"],
+                        quantity=row["quantity"],
+                        days_of_cover=row["days_of_cover"],
+                        changed_at=now,
+                    )
+                )
+        return changes
+
+    def _rescore(self, now: datetime, where: ColumnElement[bool]) -> None:
+        """
+        Upsert shortage_risk for the inventory rows matching where, scored
+        by the SQL CASE in one INSERT ... SELECT.
+        """
+        from app.models.db_models import Inventory, ShortageRisk
+
+        table = ShortageRisk.__table__
+        source = self.join_usage(
+            select(
+                Inventory.pharmacy_id,
+                Inventory.medication_id,
+                Inventory.quantity,
+                self.risk_score_expr(),
+                self.risk_reason_expr(),
+                self.risk_level_expr(),
+                self.days_of_cover_expr(),
+                literal(now, DateTime()),
+                literal(now, DateTime()),
+            )
+        )
+        # WHERE is required by SQLite for INSERT ... SELECT ... ON CONFLICT
+        source = source.where(where)
+
+        stmt = self._risk_upsert(
+            self._risk_insert().from_select(
+                [
+                    table.c.pharmacy_id,
+                    table.c.medication_id,
+                    table.c.quantity,
+                    table.c.risk_score,
+                    table.c.reason,
+                    table.c.risk_level,
+                    table.c.days_of_cover,
+                    table.c.level_changed_at,
+                    table.c.calculated_at,
+                ],
+                source,
+            )
+        )
+        self.db.execute(stmt)
+
+    def rebuild_risk_table(self, now: Optional[datetime] = None) -> int:
+        """
+        Recompute shortage_risk from inventory with one INSERT ... SELECT
+        (scored by the SQL CASE) and drop rows whose inventory is gone.
+
+        Levels that did not change keep their level_changed_at. Does not
+        commit; returns the number of inventory rows scored.
+        """
+        from app.models.db_models import Inventory, ShortageRisk
+
+        self.db.execute(
+            delete(ShortageRisk).where(
+                ~select(Inventory.id)
+                .where(
+                    Inventory.pharmacy_id == ShortageRisk.pharmacy_id,
+                    Inventory.medication_id == ShortageRisk.medication_id,
+                )
+                .exists()
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        self._rescore(now or datetime.utcnow(), true())
+
+        return self.db.scalar(select(func.count()).select_from(Inventory)) or 0
+
+    def rescore_history_range(
+        self,
+        after_history_id: int,
+        up_to_history_id: int,
+        now: Optional[datetime] = None,
+    ) -> None:
+        """
+        Rescore the pairs with StockHistory ids in (after_history_id,
+        up_to_history_id], i.e. the pairs whose usage a feature-store
+        catch-up just changed. Does not commit.
+        """
+        from app.models.db_models import Inventory, StockHistory
+
+        changed = (
+            select(StockHistory.pharmacy_id, StockHistory.medication_id)
+            .where(
+                StockHistory.id > after_history_id,
+                StockHistory.id <= up_to_history_id,
+            )
+            .distinct()
+        )
+        self._rescore(
+            now or datetime.utcnow(),
+            tuple_(Inventory.pharmacy_id, Inventory.medication_id).in_(changed),
+        )
+
+    def stored_risk_statement(
+        self,
+        *,
+        pharmacy_id: Optional[int] = None,
+        min_risk: Optional[float] = None,
+        risk_level: Optional[str] = None,
+    ) -> Select:
+        """
+        Same filters as risk_statement(), read from the shortage_risk table
+        (indexed on risk_score and risk_level).
+        """
+        from app.models.db_models import ShortageRisk
+
+        stmt = select(
+            ShortageRisk.pharmacy_id,
+            ShortageRisk.medication_id,
+            ShortageRisk.quantity,
+            ShortageRisk.risk_score,
+            ShortageRisk.reason,
+            ShortageRisk.risk_level,
+            ShortageRisk.days_of_cover,
+            ShortageRisk.level_changed_at,
+            ShortageRisk.calculated_at,
+        )
+
+        if pharmacy_id is not None:
+            stmt = stmt.where(ShortageRisk.pharmacy_id == pharmacy_id)
+
+        if min_risk is not None:
+            stmt = stmt.where(ShortageRisk.risk_score >= min_risk)
+
+        if risk_level is not None:
+            stmt = stmt.where(ShortageRisk.risk_level == risk_level)
+
+        return stmt
+
+
+class AsyncShortageService:
+    """
+    ShortageService for an AsyncSession.
+
+    Scoring rules and statement builders are shared with the sync service
+    (available as .rules); only the methods that hit the database are async.
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        *,
+        critical_threshold: int = CRITICAL_THRESHOLD,
+        low_threshold: int = LOW_THRESHOLD,
+        mode: str = SHORTAGE_RISK_MODE,
+    ) -> None:
+        self.db = db
+        self.rules = ShortageService(
+            db.sync_session,
+            critical_threshold=critical_threshold,
+            low_threshold=low_threshold,
+            mode=mode,
+        )
+
+    def compute_risk(
+        self,
+        inventory: "Inventory",
+        avg_daily_usage: Optional[float] = None,
+    ) -> ShortageRiskResult:
+        return self.rules.compute_risk(inventory, avg_daily_usage)
+
+    def compute_risk_many(self, *args: Any, **kwargs: Any) -> RiskArrays:
+        return self.rules.compute_risk_many(*args, **kwargs)
+
+    async def daily_usage_many(self, pairs: Sequence[Tuple[int, int]]) -> np.ndarray:
+        return await self.db.run_sync(lambda _: self.rules.daily_usage_many(pairs))
+
+    async def list_risks(
+        self,
+        *,
+        pharmacy_id: Optional[int] = None,
+        min_risk: Optional[float] = None,
+        risk_level: Optional[str] = None,
+    ) -> List[ShortageRiskResult]:
+        stmt = self.rules.risk_statement(
+            pharmacy_id=pharmacy_id,
+            min_risk=min_risk,
+            risk_level=risk_level,
+        )
+        result = await self.db.execute(stmt)
+        return self.rules.to_results(result)
+
+    async def get_high_risk_items(
+        self,
+        min_risk: float = 0.8,
+        pharmacy_id: Optional[int] = None,
+    ) -> List[ShortageRiskResult]:
+        return await self.list_risks(pharmacy_id=pharmacy_id, min_risk=min_risk)
+
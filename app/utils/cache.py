@@ -0,0 +1,112 @@
+"""
+Small in-process caches.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Hashable, Iterable, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Thread-safe LRU cache whose entries also expire after ttl_seconds.
+
+    Holds at most max_entries; the least recently used entry is evicted
+    first. Expired entries are dropped when they are looked up.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if max_entries <= 0:
+            raise ValueError("max_entries must be > 0")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: K, now: float) -> object:
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        with self._lock:
+            value = self._lookup(key, self._clock())
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value  # type: ignore[return-value]
+
+    def get_many(self, keys: Iterable[K]) -> Dict[K, V]:
+        """Cached values for the keys that are present (misses are omitted)."""
+        found: Dict[K, V] = {}
+        with self._lock:
+            now = self._clock()
+            for key in keys:
+                value = self._lookup(key, now)
+                if value is _MISSING:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    found[key] = value  # type: ignore[assignment]
+        return found
+
+    def set(self, key: K, value: V) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Iterable[Tuple[K, V]]) -> None:
+        with self._lock:
+            expires_at = self._clock() + self.ttl_seconds
+            for key, value in items:
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys: Optional[Iterable[K]] = None) -> None:
+        """Drop the given keys, or everything when keys is None."""
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+                return
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
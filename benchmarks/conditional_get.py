@@ -0,0 +1,166 @@
+"""
+Dashboard polling of the list endpoints: full responses vs 304 Not Modified.
+
+    python -m benchmarks.conditional_get [--pairs 100000] [--requests 20]
+
+Seeds `pairs` inventory rows with one StockHistory row each, their
+pharmacies' inventory_versions rows and the shortage_risk table, then polls GET /api/v1/inventory and
+GET /api/v1/inventory/shortage-risks (all rows, and one pharmacy) the way
+the dashboard does. "full" requests carry no validator; "revalidated"
+requests send the ETag from the previous response, so an unchanged
+inventory costs the marker lookup and an empty 304. Reports p50/p95 and
+bytes per response.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from app.database.session import get_async_db
+from app.main import app
+from app.models.db_models import Base, Inventory, InventoryVersion, StockHistory
+from app.services.result_cache import result_cache
+from app.services.shortage_service import ShortageService
+
+MEDICATIONS = 200
+
+# name -> (path, query parameters)
+ENDPOINTS: Dict[str, Any] = {
+    "inventory": ("/api/v1/inventory", {}),
+    "risks": ("/api/v1/inventory/shortage-risks", {}),
+    "risks, pharmacy": ("/api/v1/inventory/shortage-risks", {"pharmacy_id": 7}),
+}
+
+
+@dataclass(frozen=True)
+class PollLatency:
+    endpoint: str
+    mode: str
+    status: int
+    bytes: int
+    p50_ms: float
+    p95_ms: float
+
+
+def _seed(db_path: Path, pairs: int) -> None:
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    rng = np.random.default_rng(0)
+    pharmacy_ids = (np.arange(pairs) // MEDICATIONS + 1).tolist()
+    medication_ids = (np.arange(pairs) % MEDICATIONS + 1).tolist()
+    quantities = rng.integers(0, 200, pairs).tolist()
+    now = datetime.utcnow()
+
+    with engine.begin() as conn:
+        conn.execute(
+            insert(Inventory),
+            [
+                {"pharmacy_id": p, "medication_id": m, "quantity": q}
+                for p, m, q in zip(pharmacy_ids, medication_ids, quantities)
+            ],
+        )
+        conn.execute(
+            insert(StockHistory),
+            [
+                {
+                    "pharmacy_id": p,
+                    "medication_id": m,
+                    "old_quantity": 0,
+                    "new_quantity": q,
+                    "changed_at": now,
+                }
+                for p, m, q in zip(pharmacy_ids, medication_ids, quantities)
+            ],
+        )
+        conn.execute(
+            insert(InventoryVersion),
+            [{"pharmacy_id": p, "version": 1} for p in sorted(set(pharmacy_ids))],
+        )
+    with Session(engine) as db:
+        ShortageService(db).rebuild_risk_table()
+        db.commit()
+    engine.dispose()
+
+
+def measure(db_path: Path, requests: int) -> List[PollLatency]:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    SessionLocal = async_sessionmaker(bind=engine, autoflush=False)
+
+    async def override_get_async_db():
+        async with SessionLocal() as db:
+            yield db
+
+    # No lifespan: the app's startup work targets the real database
+    client = TestClient(app)
+    results = []
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    try:
+        for name, (path, params) in ENDPOINTS.items():
+            etag = client.get(path, params=params).headers["etag"]
+            for mode, headers in (("full", {}), ("revalidated", {"If-None-Match": etag})):
+                samples = []
+                for _ in range(requests):
+                    # Measure the query, not the result cache
+                    result_cache.clear()
+                    start = time.perf_counter()
+                    response = client.get(path, params=params, headers=headers)
+                    samples.append((time.perf_counter() - start) * 1000.0)
+                samples.sort()
+                results.append(
+                    PollLatency(
+                        endpoint=name,
+                        mode=mode,
+                        status=response.status_code,
+                        bytes=len(response.content),
+                        p50_ms=statistics.median(samples),
+                        p95_ms=samples[max(0, int(len(samples) * 0.95) - 1)],
+                    )
+                )
+    finally:
+        app.dependency_overrides.pop(get_async_db, None)
+        asyncio.run(engine.dispose())
+
+    return results
+
+
+def run(pairs: int = 100_000, requests: int = 20) -> List[PollLatency]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        _seed(db_path, pairs)
+        return measure(db_path, requests)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pairs", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=20, help="calls per endpoint and mode")
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    results = run(args.pairs, args.requests)
+
+    print(f"{args.pairs} inventory pairs")
+    print(f"{'endpoint':<18}{'mode':<13}{'status':>7}{'bytes':>11}{'p50':>10}{'p95':>10}")
+    for r in results:
+        print(
+            f"{r.endpoint:<18}{r.mode:<13}{r.status:>7}{r.bytes:>11}"
+            f"{r.p50_ms:>8.1f}ms{r.p95_ms:>8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
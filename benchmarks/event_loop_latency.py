@@ -0,0 +1,233 @@
+"""
+Event-loop latency with slow queries in flight: sync Session vs AsyncSession.
+
+    python -m benchmarks.event_loop_latency [--concurrency 20] [--query-ms 200]
+
+"before" is the old handler shape (async def route calling the sync
+Session); "after" is the real GET /api/v1/inventory/shortage-risks route on
+an AsyncSession. Each app is served by uvicorn on a local port. While
+`concurrency` slow risk listings are in flight we time GET /api/v1/ping,
+which does no DB work at all: if the loop is blocked it has to wait behind
+the queries.
+
+Slow queries are simulated on SQLite with a trace callback that sleeps
+inside the thread actually running the statement - the loop thread for the
+sync driver, aiosqlite's worker thread for the async one - which is how a
+slow PostgreSQL query behaves with psycopg sync vs async.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sqlite3
+import statistics
+import socket
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Callable, Iterator, List
+
+import aiosqlite
+import httpx
+import uvicorn
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.api.health_check import ping
+from app.database.session import get_async_db
+from app.main import app as real_app
+from app.models.db_models import Base, Inventory
+from app.services.shortage_service import ShortageService
+
+
+@dataclass(frozen=True)
+class LatencyResult:
+    mode: str
+    ping_p50_ms: float
+    ping_p95_ms: float
+    ping_max_ms: float
+    slow_requests_wall_ms: float
+
+
+def _slow_trace(query_ms: int) -> Callable[[str], None]:
+    def trace(statement: str) -> None:
+        if "FROM inventory" in statement or "FROM shortage_risk" in statement:
+            time.sleep(query_ms / 1000.0)
+
+    return trace
+
+
+def _seed(db_path: Path) -> None:
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        db.add_all(
+            [
+                Inventory(pharmacy_id=p, medication_id=m, quantity=(p * m) % 30)
+                for p in range(1, 11)
+                for m in range(1, 51)
+            ]
+        )
+        db.flush()
+        ShortageService(db).rebuild_risk_table()
+        db.commit()
+    engine.dispose()
+
+
+def _before_app(db_path: Path, query_ms: int) -> FastAPI:
+    trace = _slow_trace(query_ms)
+
+    def creator():
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        conn.set_trace_callback(trace)
+        return conn
+
+    engine = create_engine(f"sqlite:///{db_path}", creator=creator, pool_size=50)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.get("/api/v1/ping")(ping)
+
+    @app.get("/api/v1/inventory/shortage-risks")
+    async def get_shortage_risks(db: Session = Depends(get_db)):
+        # Pre-async shape: sync DB call directly inside an async handler
+        return [asdict(r) for r in ShortageService(db).get_high_risk_items()]
+
+    return app
+
+
+def _after_app(db_path: Path, query_ms: int) -> FastAPI:
+    trace = _slow_trace(query_ms)
+
+    async def async_creator():
+        conn = await aiosqlite.connect(db_path)
+        await conn.set_trace_callback(trace)
+        return conn
+
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{db_path}", async_creator=async_creator, pool_size=50
+    )
+    AsyncSessionLocal = async_sessionmaker(bind=engine, autoflush=False)
+
+    async def override_get_async_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    real_app.dependency_overrides[get_async_db] = override_get_async_db
+    real_app.state.bench_engine = engine
+    return real_app
+
+
+@contextmanager
+def _serve(app: FastAPI) -> Iterator[str]:
+    """Run app under uvicorn in a background thread (its own event loop)."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+async def _measure(mode: str, base_url: str, concurrency: int, pings: int) -> LatencyResult:
+    limits = httpx.Limits(max_connections=concurrency + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+
+        async def slow():
+            response = await client.get(
+                "/api/v1/inventory/shortage-risks", params={"high_risk_only": "true"}
+            )
+            response.raise_for_status()
+
+        async def timed_ping() -> float:
+            start = time.perf_counter()
+            response = await client.get("/api/v1/ping")
+            response.raise_for_status()
+            return (time.perf_counter() - start) * 1000.0
+
+        await timed_ping()  # warm up the connection pool
+
+        start = time.perf_counter()
+        slow_tasks = [asyncio.create_task(slow()) for _ in range(concurrency)]
+        await asyncio.sleep(0.02)
+
+        latencies: List[float] = []
+        for _ in range(pings):
+            latencies.append(await timed_ping())
+            await asyncio.sleep(0.005)
+
+        await asyncio.gather(*slow_tasks)
+        wall_ms = (time.perf_counter() - start) * 1000.0
+
+    latencies.sort()
+    return LatencyResult(
+        mode=mode,
+        ping_p50_ms=statistics.median(latencies),
+        ping_p95_ms=latencies[max(0, int(len(latencies) * 0.95) - 1)],
+        ping_max_ms=latencies[-1],
+        slow_requests_wall_ms=wall_ms,
+    )
+
+
+def run(concurrency: int = 20, query_ms: int = 200, pings: int = 20) -> List[LatencyResult]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        _seed(db_path)
+
+        with _serve(_before_app(db_path, query_ms)) as base_url:
+            before = asyncio.run(_measure("before", base_url, concurrency, pings))
+
+        app = _after_app(db_path, query_ms)
+        try:
+            with _serve(app) as base_url:
+                after = asyncio.run(_measure("after", base_url, concurrency, pings))
+        finally:
+            real_app.dependency_overrides.pop(get_async_db, None)
+            asyncio.run(app.state.bench_engine.dispose())
+
+    return [before, after]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--query-ms", type=int, default=200)
+    parser.add_argument("--pings", type=int, default=20)
+    args = parser.parse_args()
+
+    print(
+        f"{args.concurrency} concurrent risk listings, "
+        f"{args.query_ms} ms per query, {args.pings} pings"
+    )
+    print(f"{'mode':<8}{'ping p50':>12}{'ping p95':>12}{'ping max':>12}{'listings wall':>16}")
+    for r in run(args.concurrency, args.query_ms, args.pings):
+        print(
+            f"{r.mode:<8}{r.ping_p50_ms:>10.1f}ms{r.ping_p95_ms:>10.1f}ms"
+            f"{r.ping_max_ms:>10.1f}ms{r.slow_requests_wall_ms:>14.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Resident memory per API worker with and without memory-mapped models.
+
+    python -m benchmarks.model_memory [--workers 4] [--iterations 400] [--leaves 1023]
+
+A HistGradientBoosting pipeline (a stand-in for the tree / per-pharmacy
+models that make artifacts large) is saved with model_utils.save_model.
+Then `workers` spawned processes each load it the way ModelHolder does and
+score a batch (touching every tree), all staying alive until everyone has
+loaded. Each reports, from /proc/self/smaps_rollup, how much its RSS, PSS
+and private memory grew while loading and scoring.
+
+"before" loads with mmap_mode=None (every worker unpickles a private
+copy); "after" loads with mmap_mode="r" (the arrays are mapped from the
+page cache and shared). RSS counts shared pages in every process; PSS
+splits them between the processes sharing them, so the sum of PSS is the
+host's real cost.
+
+Linux only (reads /proc).
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import HistGradientBoostingClassifier
+
+from app.ml.model_utils import save_model
+from app.ml.predict import FEATURE_COLUMNS
+from app.ml.train_baseline_model import build_pipeline
+
+
+@dataclass(frozen=True)
+class WorkerMemory:
+    rss_mib: float
+    pss_mib: float
+    private_mib: float
+
+
+@dataclass(frozen=True)
+class MemoryResult:
+    mode: str
+    artifact_mib: float
+    workers: List[WorkerMemory]
+
+    @property
+    def total_pss_mib(self) -> float:
+        return sum(w.pss_mib for w in self.workers)
+
+
+def _smaps_rollup() -> Dict[str, float]:
+    """Rss/Pss/Private_* of this process in MiB."""
+    values = {}
+    with open("/proc/self/smaps_rollup") as fh:
+        for line in fh:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024.0
+    return values
+
+
+def _private(values: Dict[str, float]) -> float:
+    return values["Private_Clean"] + values["Private_Dirty"]
+
+
+def _synthetic_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(rng.normal(size=(rows, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS)
+
+
+def _worker(
+    path: str,
+    mmap_mode: Optional[str],
+    barrier: "multiprocessing.synchronize.Barrier",
+    results: "multiprocessing.Queue[WorkerMemory]",
+) -> None:
+    import joblib
+
+    X = _synthetic_frame(2000, seed=1)
+    before = _smaps_rollup()
+
+    model = joblib.load(path, mmap_mode=mmap_mode)
+    model.predict_proba(X)
+
+    # Measure while every worker holds the model, so shared pages are split
+    barrier.wait()
+    after = _smaps_rollup()
+    results.put(
+        WorkerMemory(
+            rss_mib=after["Rss"] - before["Rss"],
+            pss_mib=after["Pss"] - before["Pss"],
+            private_mib=_private(after) - _private(before),
+        )
+    )
+    barrier.wait()
+
+
+def build_artifact(path: Path, iterations: int, leaves: int, rows: int) -> Path:
+    X = _synthetic_frame(rows)
+    # Random labels: every tree grows to max_leaf_nodes
+    y = np.random.default_rng(2).integers(0, 2, rows)
+    model = HistGradientBoostingClassifier(
+        max_iter=iterations,
+        max_leaf_nodes=leaves,
+        min_samples_leaf=1,
+        early_stopping=False,
+        random_state=0,
+    )
+    pipe = build_pipeline(list(FEATURE_COLUMNS), model).fit(X, y)
+    return save_model(pipe, path)
+
+
+def measure(path: Path, workers: int, mmap_mode: Optional[str]) -> List[WorkerMemory]:
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=_worker, args=(str(path), mmap_mode, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    memory = [results.get(timeout=600) for _ in processes]
+    for process in processes:
+        process.join()
+    return memory
+
+
+def run(
+    workers: int = 4,
+    iterations: int = 400,
+    leaves: int = 1023,
+    rows: int = 150_000,
+    modes: Sequence[Optional[str]] = (None, "r"),
+) -> List[MemoryResult]:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = build_artifact(Path(tmp) / "model.joblib", iterations, leaves, rows)
+        size = path.stat().st_size / 2**20
+        return [
+            MemoryResult(
+                mode="before (mmap_mode=None)" if mode is None else f"after (mmap_mode={mode!r})",
+                artifact_mib=size,
+                workers=measure(path, workers, mode),
+            )
+            for mode in modes
+        ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=400, help="boosting iterations")
+    parser.add_argument("--leaves", type=int, default=1023, help="max leaf nodes per tree")
+    parser.add_argument("--rows", type=int, default=150_000, help="training rows")
+    args = parser.parse_args()
+
+    results = run(args.workers, args.iterations, args.leaves, args.rows)
+    print(f"artifact: {results[0].artifact_mib:.1f} MiB, {args.workers} workers")
+    print(f"{'mode':<26}{'RSS/worker':>12}{'PSS/worker':>12}{'private/worker':>16}{'PSS total':>12}")
+    for r in results:
+        n = len(r.workers)
+        print(
+            f"{r.mode:<26}"
+            f"{sum(w.rss_mib for w in r.workers) / n:>9.1f}MiB"
+            f"{sum(w.pss_mib for w in r.workers) / n:>9.1f}MiB"
+            f"{sum(w.private_mib for w in r.workers) / n:>13.1f}MiB"
+            f"{r.total_pss_mib:>9.1f}MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
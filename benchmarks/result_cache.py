@@ -0,0 +1,153 @@
+"""
+Shortage report under dashboard polling, with and without the result cache.
+
+    python -m benchmarks.result_cache [--rows 200000] [--clients 20] [--rounds 5]
+
+Seeds `rows` inventory rows, then `rounds` times fires `clients` concurrent
+report requests (ReportingService.generate_shortage_report on an
+AsyncSession, as GET /reports/shortages does) and records the wall time of
+each round and how many reports were actually computed.
+
+Requests key the cache on the inventory version, as the route does.
+"uncached" is ResultCache(ttl_seconds=0): every request computes. "cached"
+is the default setup: the first round's misses are coalesced into one
+computation (single-flight) and later rounds are hits. The last round of
+"cached + writes" follows an inventory write (which moves the version),
+so it computes once more.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.api.conditional import inventory_marker
+from app.models.db_models import Base, Inventory
+from app.services.inventory_service import InventoryService
+from app.services.reporting_service import ReportingService
+from app.services.result_cache import ResultCache
+
+SEED_BATCH = 100_000
+
+
+@dataclass(frozen=True)
+class PollingResult:
+    mode: str
+    computations: int
+    first_round_s: float
+    median_round_s: float
+
+
+def _seed(db_path: Path, rows: int, pharmacies: int = 500) -> None:
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    rng = np.random.default_rng(0)
+    quantities = rng.integers(0, 120, rows).tolist()
+
+    with engine.begin() as conn:
+        for start in range(0, rows, SEED_BATCH):
+            conn.execute(
+                insert(Inventory),
+                [
+                    {
+                        "pharmacy_id": i % pharmacies + 1,
+                        "medication_id": i // pharmacies + 1,
+                        "quantity": quantities[i],
+                    }
+                    for i in range(start, min(start + SEED_BATCH, rows))
+                ],
+            )
+    engine.dispose()
+
+
+async def _poll(
+    mode: str,
+    db_path: Path,
+    cache: ResultCache,
+    clients: int,
+    rounds: int,
+    write_before_last: bool,
+) -> PollingResult:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    SessionLocal = async_sessionmaker(bind=engine, autoflush=False)
+    computations = 0
+
+    async def request() -> Dict[str, Any]:
+        async with SessionLocal() as db:
+            async def compute() -> Dict[str, Any]:
+                nonlocal computations
+                computations += 1
+                return await db.run_sync(
+                    lambda session: ReportingService(session).generate_shortage_report().to_dict()
+                )
+
+            return await cache.aget_or_compute(
+                "shortage_report", {"inventory": await inventory_marker(db)}, compute
+            )
+
+    async def write() -> None:
+        async with SessionLocal() as db:
+            await db.run_sync(lambda session: InventoryService(session).add_stock(1, 1, 1))
+
+    timings: List[float] = []
+    try:
+        for round_no in range(rounds):
+            if write_before_last and round_no == rounds - 1:
+                await write()
+            start = time.perf_counter()
+            await asyncio.gather(*[request() for _ in range(clients)])
+            timings.append(time.perf_counter() - start)
+    finally:
+        await engine.dispose()
+
+    return PollingResult(
+        mode=mode,
+        computations=computations,
+        first_round_s=timings[0],
+        median_round_s=statistics.median(timings),
+    )
+
+
+def run(rows: int = 200_000, clients: int = 20, rounds: int = 5) -> List[PollingResult]:
+    modes = [
+        ("uncached", ResultCache(ttl_seconds=0), False),
+        ("cached", ResultCache(ttl_seconds=60), False),
+        ("cached + writes", ResultCache(ttl_seconds=60), True),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        _seed(db_path, rows)
+        return [
+            asyncio.run(_poll(mode, db_path, cache, clients, rounds, writes))
+            for mode, cache, writes in modes
+        ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--clients", type=int, default=20, help="concurrent requests per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    results = run(args.rows, args.clients, args.rounds)
+    print(f"{args.rows} inventory rows, {args.clients} clients x {args.rounds} rounds")
+    print(f"{'mode':<18}{'computed':>10}{'first round':>14}{'median round':>14}")
+    for r in results:
+        print(
+            f"{r.mode:<18}{r.computations:>10}"
+            f"{r.first_round_s:>13.3f}s{r.median_round_s:>13.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
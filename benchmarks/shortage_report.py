@@ -0,0 +1,179 @@
+"""
+ReportingService.generate_shortage_report at 1M inventory rows.
+
+    python -m benchmarks.shortage_report [--rows 1000000] [--pharmacies 2000] [--repeat 3]
+
+"before" is the previous implementation (every inventory row fetched into
+Python, scored with compute_risk_many and grouped with a dict); "after" is
+the single grouped SQL query. Both reports are compared (minus
+generated_at) to check the output is identical; times are the best of
+`repeat` runs on SQLite.
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app.models.db_models import Base, Inventory
+from app.services.reporting_service import (
+    CRITICAL_CODE_MAX,
+    SHORTAGE_CODE_MAX,
+    ReportingService,
+)
+
+SEED_BATCH = 100_000
+
+
+@dataclass(frozen=True)
+class ReportTiming:
+    mode: str
+    seconds: float
+    shortages: int
+
+
+def generate_shortage_report_before(service: ReportingService) -> Dict[str, Any]:
+    """The Python-side grouping, kept for comparison."""
+    shortage_service = service.shortage_service
+    generated_at = datetime.utcnow()
+
+    rows = service.db.execute(
+        shortage_service.join_usage(
+            select(
+                Inventory.pharmacy_id,
+                Inventory.medication_id,
+                Inventory.quantity,
+                shortage_service.daily_usage_expr(),
+            )
+        )
+    ).all()
+    pharmacy_ids, medication_ids, quantities, usage = (
+        zip(*rows) if rows else ((), (), (), ())
+    )
+    risks = shortage_service.compute_risk_many(
+        quantities, pharmacy_ids, medication_ids, generated_at,
+        np.array(usage, dtype=np.float64),
+    )
+
+    code = risks.reason_code
+    shortage_idx = np.flatnonzero(code <= SHORTAGE_CODE_MAX)
+    critical_count = int(np.count_nonzero(code <= CRITICAL_CODE_MAX))
+
+    by_pharmacy_map: Dict[int, List[Dict[str, Any]]] = {}
+    for pharmacy_id, medication_id, quantity, risk_score, reason in zip(
+        risks.pharmacy_id[shortage_idx].tolist(),
+        risks.medication_id[shortage_idx].tolist(),
+        risks.quantity[shortage_idx].tolist(),
+        risks.risk_score[shortage_idx].tolist(),
+        risks.reasons[shortage_idx].tolist(),
+    ):
+        by_pharmacy_map.setdefault(pharmacy_id, []).append(
+            {
+                "medication_id": medication_id,
+                "quantity": quantity,
+                "risk_score": risk_score,
+                "reason": reason,
+            }
+        )
+
+    return {
+        "total_items": len(rows),
+        "total_shortages": len(shortage_idx),
+        "critical_shortages": critical_count,
+        "low_shortages": len(shortage_idx) - critical_count,
+        "by_pharmacy": [
+            {"pharmacy_id": p, "shortage_count": len(items), "items": items}
+            for p, items in by_pharmacy_map.items()
+        ],
+    }
+
+
+def generate_shortage_report_after(service: ReportingService) -> Dict[str, Any]:
+    report = service.generate_shortage_report().to_dict()
+    del report["generated_at"], report["trend"]
+    return report
+
+
+def _seed(db_path: Path, rows: int, pharmacies: int) -> None:
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    rng = np.random.default_rng(0)
+
+    # Pairs in random order, so inventory order differs from pair order
+    pair_index = rng.permutation(rows)
+    pharmacy_ids = pair_index % pharmacies + 1
+    medication_ids = pair_index // pharmacies + 1
+    quantities = rng.integers(0, 120, rows)
+
+    with engine.begin() as conn:
+        for start in range(0, rows, SEED_BATCH):
+            end = start + SEED_BATCH
+            conn.execute(
+                insert(Inventory),
+                [
+                    {"pharmacy_id": p, "medication_id": m, "quantity": q}
+                    for p, m, q in zip(
+                        pharmacy_ids[start:end].tolist(),
+                        medication_ids[start:end].tolist(),
+                        quantities[start:end].tolist(),
+                    )
+                ],
+            )
+    engine.dispose()
+
+
+def _best_of(repeat: int, fn: Callable[[], Dict[str, Any]]) -> "tuple[float, Dict[str, Any]]":
+    best = float("inf")
+    result: Dict[str, Any] = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(rows: int = 1_000_000, pharmacies: int = 2000, repeat: int = 3) -> List[ReportTiming]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        _seed(db_path, rows, pharmacies)
+
+        engine = create_engine(f"sqlite:///{db_path}")
+        with Session(engine) as db:
+            service = ReportingService(db)
+            before_s, before = _best_of(repeat, lambda: generate_shortage_report_before(service))
+            after_s, after = _best_of(repeat, lambda: generate_shortage_report_after(service))
+        engine.dispose()
+
+    if before != after:
+        raise AssertionError("SQL report differs from the Python report")
+
+    return [
+        ReportTiming("before", before_s, before["total_shortages"]),
+        ReportTiming("after", after_s, after["total_shortages"]),
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--pharmacies", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = run(args.rows, args.pharmacies, args.repeat)
+    print(f"{args.rows} inventory rows, {args.pharmacies} pharmacies (reports identical)")
+    print(f"{'mode':<8}{'seconds':>10}{'shortages':>12}")
+    for r in results:
+        print(f"{r.mode:<8}{r.seconds:>10.3f}{r.shortages:>12}")
+
+
+if __name__ == "__main__":
+    main()
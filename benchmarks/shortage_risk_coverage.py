@@ -0,0 +1,246 @@
+"""
+Coverage-mode shortage risk at 100k+ pairs: scoring cost and list latency.
+
+    python -m benchmarks.shortage_risk_coverage [--pairs 120000] [--budget-ms 100]
+
+Seeds `pairs` inventory rows (80% with usage_features) and then times:
+
+- scoring every pair in coverage mode: ShortageService.compute_risk() per
+  row ("before": the scalar rules) vs compute_risk_many() over the columns
+  and rebuild_risk_table() (the one INSERT ... SELECT joined with
+  usage_features that maintains shortage_risk);
+- GET /api/v1/inventory/shortage-risks for the common query shapes, p50 and
+  p95 over `requests` calls, against the latency budget. "stored" is the
+  real route (reads shortage_risk); "live" runs the same filters through
+  risk_statement(), i.e. computes days of cover at request time.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from app.database.session import get_async_db
+from app.main import app
+from app.models.db_models import Base, Inventory, UsageFeatures
+from app.services.shortage_service import ShortageService
+
+PAGE = 500
+
+# name -> query parameters for GET /inventory/shortage-risks
+QUERY_SHAPES: Dict[str, Dict[str, Any]] = {
+    "first page": {"limit": PAGE},
+    "high risk page": {"high_risk_only": "true", "limit": PAGE},
+    "critical page": {"risk_level": "CRITICAL", "limit": PAGE},
+    "one pharmacy": {"pharmacy_id": 7},
+}
+
+
+@dataclass(frozen=True)
+class ScoringResult:
+    step: str
+    seconds: float
+
+
+@dataclass(frozen=True)
+class ListLatency:
+    query: str
+    source: str
+    rows: int
+    p50_ms: float
+    p95_ms: float
+
+
+def _seed(db_path: Path, pairs: int, medications: int = 200) -> Session:
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    rng = np.random.default_rng(0)
+
+    pharmacy_ids = np.arange(pairs) // medications + 1
+    medication_ids = np.arange(pairs) % medications + 1
+    quantities = rng.integers(0, 200, pairs)
+    rates = rng.lognormal(1.0, 1.2, pairs)
+    has_usage = rng.random(pairs) < 0.8
+    start = datetime(2026, 1, 1)
+
+    with engine.begin() as conn:
+        conn.execute(
+            insert(Inventory),
+            [
+                {"pharmacy_id": p, "medication_id": m, "quantity": q}
+                for p, m, q in zip(
+                    pharmacy_ids.tolist(), medication_ids.tolist(), quantities.tolist()
+                )
+            ],
+        )
+        conn.execute(
+            insert(UsageFeatures),
+            [
+                {
+                    "pharmacy_id": p,
+                    "medication_id": m,
+                    "history_points": 30,
+                    "total_decrease": int(rate * 30),
+                    "first_change": start,
+                    "last_change": start + timedelta(days=30),
+                }
+                for p, m, rate, used in zip(
+                    pharmacy_ids.tolist(),
+                    medication_ids.tolist(),
+                    rates.tolist(),
+                    has_usage.tolist(),
+                )
+                if used
+            ],
+        )
+
+    return Session(engine)
+
+
+def _time(fn: Any) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def measure_scoring(db: Session) -> List[ScoringResult]:
+    service = ShortageService(db, mode="coverage")
+    inventory = db.query(Inventory).all()
+    pairs = [(inv.pharmacy_id, inv.medication_id) for inv in inventory]
+
+    usage_seconds = _time(lambda: service.daily_usage_many(pairs))
+    usage = service.daily_usage_many(pairs)
+    rates = [None if np.isnan(rate) else rate for rate in usage.tolist()]
+    quantities = [inv.quantity for inv in inventory]
+    pharmacy_ids, medication_ids = zip(*pairs)
+
+    results = [
+        ScoringResult(
+            "compute_risk per row",
+            _time(lambda: [service.compute_risk(inv, rate) for inv, rate in zip(inventory, rates)]),
+        ),
+        ScoringResult("daily_usage_many (SQL)", usage_seconds),
+        ScoringResult(
+            "compute_risk_many",
+            _time(lambda: service.compute_risk_many(
+                quantities, pharmacy_ids, medication_ids, daily_usage=usage
+            )),
+        ),
+    ]
+
+    def rebuild() -> None:
+        service.rebuild_risk_table()
+        db.commit()
+
+    results.append(ScoringResult("rebuild_risk_table (SQL)", _time(rebuild)))
+    return results
+
+
+def measure_lists(db_path: Path, requests: int) -> List[ListLatency]:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    SessionLocal = async_sessionmaker(bind=engine, autoflush=False)
+
+    async def override_get_async_db():
+        async with SessionLocal() as db:
+            yield db
+
+    sync_db = Session(create_engine(f"sqlite:///{db_path}"))
+    live = ShortageService(sync_db, mode="coverage")
+
+    def live_list(params: Dict[str, Any]) -> int:
+        stmt = live.risk_statement(
+            pharmacy_id=params.get("pharmacy_id"),
+            min_risk=0.8 if params.get("high_risk_only") else None,
+            risk_level=params.get("risk_level"),
+        ).order_by("pharmacy_id", "medication_id")
+        if "limit" in params:
+            stmt = stmt.limit(params["limit"])
+        return len(live.to_results(sync_db.execute(stmt)))
+
+    # No lifespan: the app's startup work targets the real database
+    client = TestClient(app)
+
+    def stored_list(params: Dict[str, Any]) -> int:
+        response = client.get("/api/v1/inventory/shortage-risks", params=params)
+        response.raise_for_status()
+        return len(response.json())
+
+    results = []
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    try:
+        for name, params in QUERY_SHAPES.items():
+            for source, call in (("stored", stored_list), ("live", live_list)):
+                samples = []
+                for _ in range(requests):
+                    start = time.perf_counter()
+                    rows = call(params)
+                    samples.append((time.perf_counter() - start) * 1000.0)
+                samples.sort()
+                results.append(
+                    ListLatency(
+                        query=name,
+                        source=source,
+                        rows=rows,
+                        p50_ms=statistics.median(samples),
+                        p95_ms=samples[max(0, int(len(samples) * 0.95) - 1)],
+                    )
+                )
+    finally:
+        app.dependency_overrides.pop(get_async_db, None)
+        sync_db.close()
+        asyncio.run(engine.dispose())
+
+    return results
+
+
+def run(pairs: int = 120_000, requests: int = 30) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        db = _seed(db_path, pairs)
+        try:
+            scoring = measure_scoring(db)
+        finally:
+            db.close()
+        return {"scoring": scoring, "lists": measure_lists(db_path, requests)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pairs", type=int, default=120_000)
+    parser.add_argument("--requests", type=int, default=30, help="calls per query shape")
+    parser.add_argument("--budget-ms", type=float, default=100.0, help="p95 budget per list call")
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    results = run(args.pairs, args.requests)
+
+    print(f"{args.pairs} pairs, coverage mode")
+    print(f"{'scoring step':<28}{'seconds':>10}")
+    for r in results["scoring"]:
+        print(f"{r.step:<28}{r.seconds:>10.3f}")
+
+    print()
+    print(f"{'query':<16}{'source':<8}{'rows':>7}{'p50':>10}{'p95':>10}  budget {args.budget_ms:g}ms")
+    for r in results["lists"]:
+        verdict = "ok" if r.p95_ms <= args.budget_ms else "OVER"
+        print(
+            f"{r.query:<16}{r.source:<8}{r.rows:>7}"
+            f"{r.p50_ms:>8.1f}ms{r.p95_ms:>8.1f}ms  {verdict}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Scaling of app.ml.data_loader.load_inventory_dataset.
+
+    python -m benchmarks.training_data_loader [--pairs 1000 2000 4000 8000] [--history 20]
+
+"before" is the previous implementation (all Inventory and StockHistory
+rows as ORM objects, then a scan of the whole history per inventory row);
+"after" is the window-function query. For every size the table reports the
+wall time and the time per input row (inventory + history): flat per-row
+cost means linear scaling, per-row cost growing with size means it is not.
+
+The quadratic "before" run is skipped above --before-max-pairs.
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import pandas as pd
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from app.ml.data_loader import COLUMNS, load_inventory_dataset
+from app.models.db_models import Base, Inventory, StockHistory
+
+
+@dataclass(frozen=True)
+class ScalingResult:
+    pairs: int
+    history_rows: int
+    before_s: Optional[float]
+    after_s: float
+
+    @property
+    def input_rows(self) -> int:
+        return self.pairs + self.history_rows
+
+    @property
+    def after_us_per_row(self) -> float:
+        return self.after_s / self.input_rows * 1e6
+
+
+def load_inventory_dataset_before(db: Session) -> pd.DataFrame:
+    """The pre-rewrite merge loop, kept for comparison."""
+    inventory_records = db.query(Inventory).all()
+    stock_history_records = db.query(StockHistory).all()
+
+    data = []
+    for r in inventory_records:
+        history = [
+            h for h in stock_history_records
+            if h.pharmacy_id == r.pharmacy_id and h.medication_id == r.medication_id
+        ]
+        if history:
+            latest = max(history, key=lambda x: x.changed_at)
+            old_q, new_q, changed_at = latest.old_quantity, latest.new_quantity, latest.changed_at
+        else:
+            old_q, new_q, changed_at = r.quantity, r.quantity, None
+
+        data.append(
+            {
+                "pharmacy_id": r.pharmacy_id,
+                "medication_id": r.medication_id,
+                "quantity": r.quantity,
+                "old_quantity": old_q,
+                "new_quantity": new_q,
+                "changed_at": changed_at,
+            }
+        )
+
+    return pd.DataFrame(data, columns=COLUMNS)
+
+
+def _seed(db_path: Path, pairs: int, history: int) -> int:
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+
+    medications = 100
+    start = datetime(2026, 1, 1)
+    inventory_rows = []
+    history_rows = []
+
+    for i in range(pairs):
+        pharmacy_id, medication_id = i // medications + 1, i % medications + 1
+        quantity = 200
+        for h in range(history):
+            new = max(0, quantity - (i + h) % 7)
+            history_rows.append(
+                {
+                    "pharmacy_id": pharmacy_id,
+                    "medication_id": medication_id,
+                    "old_quantity": quantity,
+                    "new_quantity": new,
+                    "changed_at": start + timedelta(hours=h),
+                    "reason": "BENCH",
+                }
+            )
+            quantity = new
+        inventory_rows.append(
+            {"pharmacy_id": pharmacy_id, "medication_id": medication_id, "quantity": quantity}
+        )
+
+    with engine.begin() as conn:
+        conn.execute(insert(Inventory.__table__), inventory_rows)
+        conn.execute(insert(StockHistory.__table__), history_rows)
+    engine.dispose()
+
+    return len(history_rows)
+
+
+def _time(fn, engine) -> tuple[float, pd.DataFrame]:
+    with Session(engine) as db:
+        start = time.perf_counter()
+        df = fn(db)
+        return time.perf_counter() - start, df
+
+
+def run(
+    pair_counts: Sequence[int] = (1000, 2000, 4000, 8000),
+    history: int = 20,
+    before_max_pairs: int = 1000,
+) -> List[ScalingResult]:
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for pairs in pair_counts:
+            db_path = Path(tmp) / f"loader_{pairs}.db"
+            history_rows = _seed(db_path, pairs, history)
+            engine = create_engine(f"sqlite:///{db_path}")
+
+            after_s, after = _time(load_inventory_dataset, engine)
+
+            before_s = None
+            if pairs <= before_max_pairs:
+                before_s, before = _time(load_inventory_dataset_before, engine)
+                pd.testing.assert_frame_equal(
+                    before.sort_values(["pharmacy_id", "medication_id"]).reset_index(drop=True),
+                    after.reset_index(drop=True),
+                    check_dtype=False,
+                )
+
+            engine.dispose()
+            results.append(ScalingResult(pairs, history_rows, before_s, after_s))
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pairs", type=int, nargs="+", default=[1000, 2000, 4000, 8000])
+    parser.add_argument("--history", type=int, default=20, help="history rows per pair")
+    parser.add_argument("--before-max-pairs", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'pairs':>8}{'history':>10}{'before':>12}{'after':>12}{'after/row':>14}")
+    for r in run(args.pairs, args.history, args.before_max_pairs):
+        before = f"{r.before_s * 1000:>10.0f}ms" if r.before_s is not None else f"{'-':>12}"
+        print(
+            f"{r.pairs:>8}{r.history_rows:>10}{before}"
+            f"{r.after_s * 1000:>10.0f}ms{r.after_us_per_row:>12.2f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
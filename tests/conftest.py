@@ -21,3 +21,86 @@ def db_session():
         yield db
     finally:
         db.close()
+
+
+@pytest.fixture()
+def api_session_factory(tmp_path):
+    """
+    Sync session factory for seeding/inspecting the DB behind the API.
+
+    Routes get an AsyncSession on the same (file-backed) database.
+    """
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from app.database.session import get_async_db
+    from app.main import app
+    from app.services.result_cache import result_cache
+
+    db_path = tmp_path / "api.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    TestingSessionLocal = sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        bind=engine,
+    )
+    Base.metadata.create_all(bind=engine)
+
+    # NullPool: TestClient may run each request on a different event loop
+    async_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool
+    )
+    TestingAsyncSessionLocal = async_sessionmaker(
+        bind=async_engine, autoflush=False
+    )
+
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+
+    # Results cached against another test's database
+    result_cache.clear()
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    try:
+        yield TestingSessionLocal
+    finally:
+        app.dependency_overrides.pop(get_async_db, None)
+        engine.dispose()
+
+
+@pytest.fixture()
+def client(api_session_factory):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    return TestClient(app)
+
+
+@pytest.fixture(scope="session")
+def trained_pipeline():
+    """Small baseline pipeline fitted on synthetic features."""
+    import numpy as np
+    import pandas as pd
+
+    from app.ml.predict import FEATURE_COLUMNS
+    from app.ml.train_baseline_model import TrainConfig, train_and_evaluate
+
+    rng = np.random.default_rng(0)
+    n = 200
+    X = pd.DataFrame(
+        {
+            "quantity": rng.integers(0, 100, n).astype(float),
+            "usage_rate_per_day": rng.uniform(0.5, 10, n),
+            "days_until_zero": np.nan,
+            "last_change_days_ago": rng.uniform(0, 30, n),
+            "pharmacy_id": rng.integers(1, 5, n).astype(float),
+            "medication_id": rng.integers(1, 20, n).astype(float),
+        }
+    )[FEATURE_COLUMNS]
+    X["days_until_zero"] = X["quantity"] / X["usage_rate_per_day"]
+    y = (X["days_until_zero"] <= 3).astype(int)
+
+    pipe, _ = train_and_evaluate(X, y, TrainConfig())
+    return pipe, X
+
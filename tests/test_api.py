@@ -0,0 +1,463 @@
+def test_shortage_risk_batch_keeps_input_order(
+    tmp_path, monkeypatch, trained_pipeline, client, api_session_factory
+):
+    from datetime import datetime, timedelta
+
+    from app.ml import predict
+    from app.ml.features import FeatureAssembler
+    from app.ml.model_utils import ModelHolder, save_model
+    from app.ml.train_baseline_model import TrainConfig, build_training_frame
+    from app.models.db_models import StockHistory
+
+    pipe, _ = trained_pipeline
+    path = save_model(pipe, tmp_path / "model.joblib")
+    monkeypatch.setattr(predict, "model_holder", ModelHolder(path, check_interval=0))
+    monkeypatch.setattr("app.main.feature_assembler", FeatureAssembler())
+
+    _seed_inventory(api_session_factory)
+    db = api_session_factory()
+    start = datetime.utcnow() - timedelta(days=5)
+    db.add_all(
+        [
+            StockHistory(
+                pharmacy_id=p, medication_id=m,
+                old_quantity=40 - 5 * h, new_quantity=35 - 5 * h,
+                changed_at=start + timedelta(days=h), reason="SALE",
+            )
+            for p in (1, 2) for m in range(1, 8) for h in range(m % 4)
+        ]
+    )
+    db.commit()
+    X, _ = build_training_frame(db, TrainConfig())
+    db.close()
+
+    expected = dict(
+        zip(
+            zip(X["pharmacy_id"].astype(int), X["medication_id"].astype(int)),
+            pipe.predict(X).tolist(),
+        )
+    )
+    pairs = [(3, 7), (1, 2), (9, 9), (2, 5), (1, 2), (2, 1)]
+
+    response = client.post(
+        "/api/v1/inventory/shortage-risk/batch",
+        json={"items": [{"pharmacy_id": p, "medication_id": m} for p, m in pairs]},
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == len(pairs)
+    predictions = body["predictions"]
+    assert [(p["pharmacy_id"], p["medication_id"]) for p in predictions] == pairs
+    assert predictions[2]["shortage_pred"] is None
+    assert predictions[2]["error"]
+    assert [p["shortage_pred"] for i, p in enumerate(predictions) if i != 2] == [
+        expected[pair] for i, pair in enumerate(pairs) if i != 2
+    ]
+
+    single = client.post(
+        "/api/v1/inventory/shortage-risk",
+        json={"pharmacy_id": 9, "medication_id": 9},
+    )
+    assert single.status_code == 404
+
+
+def test_shortage_risk_without_predict_proba(
+    tmp_path, monkeypatch, client, api_session_factory
+):
+    import pandas as pd
+    from sklearn.dummy import DummyRegressor
+
+    from app.ml import predict
+    from app.ml.features import FeatureAssembler
+    from app.ml.model_utils import ModelHolder, save_model
+
+    X = pd.DataFrame(0.0, index=range(2), columns=predict.FEATURE_COLUMNS)
+    model = DummyRegressor(strategy="constant", constant=1).fit(X, [1, 1])
+    path = save_model(model, tmp_path / "model.joblib")
+    monkeypatch.setattr(predict, "model_holder", ModelHolder(path, check_interval=0))
+    monkeypatch.setattr("app.main.feature_assembler", FeatureAssembler())
+    _seed_inventory(api_session_factory, pharmacies=1, medications=1)
+
+    response = client.post(
+        "/api/v1/inventory/shortage-risk",
+        json={"pharmacy_id": 1, "medication_id": 1},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"shortage_risk_probability": None}
+
+
+def _seed_inventory(session_factory, pharmacies=3, medications=7):
+    from app.models.db_models import Inventory
+    from app.services.shortage_service import ShortageService
+
+    db = session_factory()
+    db.add_all(
+        [
+            Inventory(pharmacy_id=p, medication_id=m, quantity=(p * m) % 20)
+            for p in range(1, pharmacies + 1)
+            for m in range(1, medications + 1)
+        ]
+    )
+    db.flush()
+    ShortageService(db).rebuild_risk_table()
+    db.commit()
+    db.close()
+
+
+def test_inventory_keyset_pagination(client, api_session_factory):
+    _seed_inventory(api_session_factory)
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 4}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/v1/inventory", params=params)
+        assert response.status_code == 200
+        seen.extend(
+            (row["pharmacy_id"], row["medication_id"]) for row in response.json()
+        )
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert seen == [(p, m) for p in range(1, 4) for m in range(1, 8)]
+
+
+def test_shortage_risks_ndjson_stream(client, api_session_factory):
+    import json
+
+    _seed_inventory(api_session_factory)
+
+    response = client.get(
+        "/api/v1/inventory/shortage-risks",
+        params={"cursor": "1:7", "limit": 5},
+        headers={"Accept": "application/x-ndjson"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [(r["pharmacy_id"], r["medication_id"]) for r in rows] == [
+        (2, m) for m in range(1, 6)
+    ]
+    assert all(r["risk_level"] for r in rows)
+
+
+def test_shortage_risks_expose_days_of_cover(client, api_session_factory):
+    from datetime import datetime
+
+    from app.models.db_models import UsageFeatures
+    from app.services.shortage_service import ShortageService
+
+    _seed_inventory(api_session_factory)
+    db = api_session_factory()
+    # pharmacy 1 / medication 5 holds 5 units and uses 2 a day
+    db.add(
+        UsageFeatures(
+            pharmacy_id=1,
+            medication_id=5,
+            history_points=3,
+            total_decrease=20,
+            first_change=datetime(2026, 1, 1),
+            last_change=datetime(2026, 1, 11),
+        )
+    )
+    db.flush()
+    ShortageService(db).rebuild_risk_table()
+    db.commit()
+    db.close()
+
+    listed = client.get("/api/v1/inventory/shortage-risks", params={"pharmacy_id": 1})
+    assert listed.status_code == 200
+    cover = {row["medication_id"]: row["days_of_cover"] for row in listed.json()}
+    assert cover[5] == 2.5
+    assert cover[4] is None
+
+    single = client.get("/api/v1/inventory/shortage-risks/1/5")
+    assert single.json()["days_of_cover"] == 2.5
+
+
+def test_low_stock_inventory_in_coverage_mode(client, api_session_factory, monkeypatch):
+    from datetime import datetime
+    from functools import partial
+
+    from app.models.db_models import UsageFeatures
+    from app.services.shortage_service import AsyncShortageService
+
+    monkeypatch.setattr(
+        "app.api.routes.AsyncShortageService",
+        partial(AsyncShortageService, mode="coverage"),
+    )
+    # medication m holds m units; 6 uses 3 a day (2 days), 7 uses 0.1 (70 days)
+    _seed_inventory(api_session_factory, pharmacies=1, medications=7)
+    db = api_session_factory()
+    db.add_all(
+        [
+            UsageFeatures(
+                pharmacy_id=1,
+                medication_id=medication_id,
+                history_points=3,
+                total_decrease=total_decrease,
+                first_change=datetime(2026, 1, 1),
+                last_change=datetime(2026, 1, 11),
+            )
+            for medication_id, total_decrease in ((6, 30), (7, 1))
+        ]
+    )
+    db.commit()
+    db.close()
+
+    response = client.get("/api/v1/inventory", params={"low_stock_only": "true"})
+
+    assert response.status_code == 200
+    assert [row["medication_id"] for row in response.json()] == [1, 2, 3, 4, 5, 6]
+
+
+def test_shortage_report_endpoint(client, api_session_factory):
+    _seed_inventory(api_session_factory, pharmacies=2, medications=3)
+
+    response = client.get("/api/v1/reports/shortages")
+
+    assert response.status_code == 200
+    report = response.json()
+    assert report["total_items"] == 6
+    # quantities (p * m) % 20: 1, 2, 3 and 2, 4, 6 -> five critical, one low
+    assert (report["critical_shortages"], report["low_shortages"]) == (5, 1)
+    assert [p["pharmacy_id"] for p in report["by_pharmacy"]] == [1, 2]
+
+
+def test_shortage_report_endpoint_reports_unsupported_database(client, monkeypatch):
+    from app.services.shortage_service import ShortageServiceError
+
+    def unsupported(self):
+        raise ShortageServiceError("Shortage reports are not supported for 'mssql'")
+
+    monkeypatch.setattr("app.api.routes.ReportingService.generate_shortage_report", unsupported)
+
+    response = client.get("/api/v1/reports/shortages")
+
+    assert response.status_code == 501
+    assert response.json()["detail"] == "Shortage reports are not supported for 'mssql'"
+
+
+def test_shortage_report_is_cached_until_inventory_write(client, api_session_factory):
+    from app.models.db_models import Inventory
+
+    _seed_inventory(api_session_factory, pharmacies=2, medications=3)
+    assert client.get("/api/v1/reports/shortages").json()["total_items"] == 6
+
+    # Written behind the service's back: the cached report is still served
+    db = api_session_factory()
+    db.add(Inventory(pharmacy_id=3, medication_id=1, quantity=1))
+    db.commit()
+    db.close()
+    assert client.get("/api/v1/reports/shortages").json()["total_items"] == 6
+
+    added = client.post(
+        "/api/v1/inventory/add",
+        json={"pharmacy_id": 3, "medication_id": 2, "quantity": 2},
+    )
+    assert added.status_code == 201
+    assert client.get("/api/v1/reports/shortages").json()["total_items"] == 8
+
+
+def test_inventory_conditional_get(client, monkeypatch):
+    for pharmacy_id in (1, 2):
+        client.post(
+            "/api/v1/inventory/add",
+            json={"pharmacy_id": pharmacy_id, "medication_id": 1, "quantity": 10},
+        )
+
+    first = client.get("/api/v1/inventory")
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+    scoped_etag = client.get("/api/v1/inventory", params={"pharmacy_id": 1}).headers["etag"]
+
+    # A match is answered before the list query runs
+    def no_query(*args, **kwargs):
+        raise AssertionError("list query ran")
+
+    monkeypatch.setattr("app.api.routes.split_page", no_query)
+    cached = client.get("/api/v1/inventory", headers={"If-None-Match": f'W/"x", {etag}'})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+    monkeypatch.undo()
+
+    # NDJSON is another representation of the same URL
+    stream = client.get(
+        "/api/v1/inventory",
+        headers={"Accept": "application/x-ndjson", "If-None-Match": etag},
+    )
+    assert stream.status_code == 200
+    assert stream.headers["etag"] != etag
+
+    client.post(
+        "/api/v1/inventory/remove",
+        json={"pharmacy_id": 2, "medication_id": 1, "quantity": 4},
+    )
+    changed = client.get("/api/v1/inventory", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    # Pharmacy 1 did not change
+    scoped = client.get(
+        "/api/v1/inventory",
+        params={"pharmacy_id": 1},
+        headers={"If-None-Match": scoped_etag},
+    )
+    assert scoped.status_code == 304
+
+
+def test_shortage_risks_etag_follows_usage_catch_up(client, api_session_factory):
+    from app.ml.feature_store import UsageFeatureStore
+
+    client.post(
+        "/api/v1/inventory/add",
+        json={"pharmacy_id": 1, "medication_id": 1, "quantity": 10},
+    )
+    etag = client.get("/api/v1/inventory/shortage-risks").headers["etag"]
+    assert client.get(
+        "/api/v1/inventory/shortage-risks", headers={"If-None-Match": etag}
+    ).status_code == 304
+
+    db = api_session_factory()
+    UsageFeatureStore(db).catch_up()
+    db.close()
+
+    refreshed = client.get("/api/v1/inventory/shortage-risks", headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert refreshed.headers["etag"] != etag
+
+
+def test_low_stock_inventory_etag_follows_usage_in_coverage_mode(
+    client, api_session_factory, monkeypatch
+):
+    from functools import partial
+
+    from app.ml.feature_store import UsageFeatureStore
+    from app.services.shortage_service import AsyncShortageService
+
+    monkeypatch.setattr(
+        "app.api.routes.AsyncShortageService",
+        partial(AsyncShortageService, mode="coverage"),
+    )
+    client.post(
+        "/api/v1/inventory/add",
+        json={"pharmacy_id": 1, "medication_id": 1, "quantity": 10},
+    )
+    params = {"low_stock_only": "true"}
+    etag = client.get("/api/v1/inventory", params=params).headers["etag"]
+    assert client.get(
+        "/api/v1/inventory", params=params, headers={"If-None-Match": etag}
+    ).status_code == 304
+
+    db = api_session_factory()
+    UsageFeatureStore(db).catch_up()
+    db.close()
+
+    refreshed = client.get("/api/v1/inventory", params=params, headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert refreshed.headers["etag"] != etag
+
+
+def test_risk_level_event_stream(db_session):
+    import asyncio
+    import json
+
+    from app.api.sse import risk_event_stream
+    from app.services.risk_events import RiskEventBroker
+    from app.services.shortage_service import ShortageService
+
+    broker = RiskEventBroker()
+
+    async def main():
+        stream = risk_event_stream(broker, [1], heartbeat_seconds=0.05)
+        assert await stream.__anext__() == ": subscribed\n\n"
+        assert await stream.__anext__() == ": keep-alive\n\n"
+
+        changes = ShortageService(db_session).refresh_risks([(2, 1, 0), (1, 1, 0)])
+        broker.publish(db_session, changes)
+        event = await stream.__anext__()
+        await stream.aclose()
+        return event
+
+    name, data = asyncio.run(main()).strip().split("\n")
+
+    assert name == "event: risk_level_changed"
+    change = json.loads(data.removeprefix("data: "))
+    assert (change["pharmacy_id"], change["previous_level"], change["risk_level"]) == (1, None, "CRITICAL")
+    assert broker.stats()["subscribers"] == 0
+
+
+def test_invalid_cursor_is_rejected(client):
+    response = client.get("/api/v1/inventory", params={"cursor": "nope"})
+
+    assert response.status_code == 400
+
+
+def test_bulk_inventory_endpoint(client):
+    response = client.post(
+        "/api/v1/inventory/bulk",
+        json={
+            "operations": [
+                {"op": "add", "pharmacy_id": 1, "medication_id": 1, "quantity": 4},
+                {"op": "remove", "pharmacy_id": 1, "medication_id": 1, "quantity": 9},
+            ]
+        },
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["applied"] == 1
+    assert body["rejected"] == 1
+    assert body["results"][1]["error"] == "Cannot remove more stock than available"
+
+
+def test_async_routes_only_use_async_sessions():
+    import inspect
+    import typing
+
+    from fastapi.routing import APIRoute
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.orm import Session
+
+    from app.database.session import get_db
+    from app.main import app
+
+    def dependencies(dependant):
+        for dependency in dependant.dependencies:
+            yield dependency
+            yield from dependencies(dependency)
+
+    db_routes = 0
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or not inspect.iscoroutinefunction(route.endpoint):
+            continue
+        # A sync Session in an async route runs its queries on the event loop
+        calls = [dependency.call for dependency in dependencies(route.dependant)]
+        assert get_db not in calls, route.path
+        hints = typing.get_type_hints(route.endpoint)
+        sessions = [hint for hint in hints.values() if hint in (Session, AsyncSession)]
+        assert Session not in sessions, route.path
+        db_routes += AsyncSession in sessions
+
+    assert db_routes > 0
+
+
+def test_status_reports_pool_metrics(client):
+    response = client.get("/api/v1/status")
+
+    assert response.status_code == 200
+    pool = response.json()["database"]["pool"]
+    assert set(pool) == {"async", "sync"}
+    assert "pool_class" in pool["sync"]
+
+
+def test_retrain_job_status_unknown_job(client):
+    response = client.get("/retrain-model/jobs/does-not-exist")
+
+    assert response.status_code == 404
@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.database.connection import engine_options
+from app.database.pool import PoolSettings, TimedQueuePool, pool_status
+
+
+def test_pool_settings_from_env(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "0")
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "5000")
+    monkeypatch.setenv("DB_PREPARE_THRESHOLD", "none")
+
+    settings = PoolSettings.from_env()
+
+    assert settings.pool_size == 20
+    assert settings.max_overflow == 0
+    assert settings.pool_timeout == 30
+    assert settings.statement_timeout_ms == 5000
+    assert settings.prepare_threshold is None
+
+
+def test_engine_options_per_backend():
+    settings = PoolSettings(pool_size=7, statement_timeout_ms=1500, prepare_threshold=None)
+
+    sqlite_options = engine_options(make_url("sqlite://"), settings)
+    assert "pool_size" not in sqlite_options
+    assert "poolclass" not in sqlite_options
+
+    pg_options = engine_options(make_url("postgresql+psycopg://u:p@db/x"), settings)
+    assert pg_options["poolclass"] is TimedQueuePool
+    assert pg_options["pool_size"] == 7
+    assert pg_options["connect_args"] == {
+        "options": "-c statement_timeout=1500",
+        "prepare_threshold": None,
+    }
+
+
+def test_pool_status_reports_checkouts_and_waits(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.2,
+    )
+
+    held = engine.connect()
+    status = pool_status(engine)
+    assert status["checked_out"] == 1
+    assert status["size"] == 1
+
+    # second checkout waits for the first one to be returned
+    releaser = threading.Timer(0.05, held.close)
+    releaser.start()
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    releaser.join()
+
+    # and times out when nothing is returned
+    held = engine.connect()
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    held.close()
+
+    wait = pool_status(engine)["wait"]
+    assert wait["checkouts"] == 3
+    assert wait["timeouts"] == 1
+    assert wait["max_wait_ms"] >= 150
+
+    engine.dispose()
+
+
+def test_upsert_inventory_quantity_bumps_inventory_version(db_session):
+    from app.database.utils import upsert_inventory_quantity
+    from app.models.db_models import InventoryVersion
+
+    upsert_inventory_quantity(db_session, 1, 1, 10)
+    upsert_inventory_quantity(db_session, 1, 2, 5)
+    upsert_inventory_quantity(db_session, 1, 1, 7, reason="SALE")
+    upsert_inventory_quantity(db_session, 2, 1, 3)
+
+    versions = {v.pharmacy_id: v.version for v in db_session.query(InventoryVersion)}
+    assert versions == {1: 3, 2: 1}
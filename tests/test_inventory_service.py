@@ -44,8 +44,215 @@ def test_stock_history_is_created(db_session):
     service = InventoryService(db_session)
 
     service.add_stock(1, 1, 10)
+    service.add_stock(1, 1, 5)
+
+    created, added = db_session.query(StockHistory).order_by(StockHistory.id).all()
+    assert (created.old_quantity, created.new_quantity) == (0, 10)
+    assert created.reason == "CREATE"
+    assert (added.old_quantity, added.new_quantity) == (10, 15)
+    assert added.reason == "ADD"
+
+
+def test_apply_batch_runs_operations_in_order(db_session):
+    from app.services.inventory_service import StockOperation
+
+    service = InventoryService(db_session)
+    service.add_stock(1, 1, 10)
+
+    results = service.apply_batch(
+        [
+            StockOperation("add", 1, 1, 5),
+            StockOperation("remove", 1, 1, 12),
+            StockOperation("update", 1, 2, 7),
+            StockOperation("add", 2, 1, 3),
+        ]
+    )
+
+    assert all(r.applied for r in results)
+    assert [r.new_quantity for r in results] == [15, 3, 7, 3]
+    assert [r.change_amount for r in results] == [5, -12, 7, 3]
+
+    quantities = {
+        (i.pharmacy_id, i.medication_id): i.quantity
+        for i in db_session.query(Inventory).all()
+    }
+    assert quantities == {(1, 1): 3, (1, 2): 7, (2, 1): 3}
+    assert db_session.query(StockHistory).count() == 5
+
+
+def test_apply_batch_reports_invalid_items(db_session):
+    from app.services.inventory_service import StockOperation
+
+    service = InventoryService(db_session)
+    service.add_stock(1, 1, 5)
+
+    results = service.apply_batch(
+        [
+            StockOperation("remove", 1, 1, 10),
+            StockOperation("remove", 9, 9, 1),
+            StockOperation("add", 1, 1, 0),
+            StockOperation("remove", 1, 1, 5),
+        ]
+    )
+
+    assert [r.applied for r in results] == [False, False, False, True]
+    assert results[0].error == "Cannot remove more stock than available"
+    assert results[1].error == "Inventory record not found"
+    assert db_session.query(Inventory).one().quantity == 0
+    assert db_session.query(StockHistory).count() == 2
+
+
+def test_writes_bump_the_pharmacy_inventory_version(db_session):
+    from app.models.db_models import InventoryVersion
+    from app.services.inventory_service import StockOperation
+
+    def versions():
+        return {v.pharmacy_id: v.version for v in db_session.query(InventoryVersion).all()}
+
+    service = InventoryService(db_session)
+    service.add_stock(1, 1, 10)
+    service.update_stock(1, 2, 4)
+    service.remove_stock(1, 1, 3)
+    assert versions() == {1: 3}
+
+    # One bump per pharmacy and batch; rejected operations bump nothing
+    service.apply_batch(
+        [
+            StockOperation("add", 1, 1, 1),
+            StockOperation("add", 1, 3, 1),
+            StockOperation("add", 2, 1, 1),
+        ]
+    )
+    service.apply_batch([StockOperation("remove", 3, 1, 1)])
+    assert versions() == {1: 4, 2: 1}
+
+
+def test_concurrent_removals_do_not_lose_updates(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
 
-    history = db_session.query(StockHistory).one()
-    assert history.old_quantity == 0
-    assert history.new_quantity == 10
-    assert history.reason == "ADD"
+    from app.models.db_models import Base
+    from app.services.inventory_service import InventoryValidationError
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'concurrency.db'}",
+        connect_args={"timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    with SessionLocal() as db:
+        InventoryService(db).add_stock(1, 1, 50)
+
+    def remove_many(_):
+        removed = rejected = 0
+        with SessionLocal() as db:
+            service = InventoryService(db)
+            for _ in range(10):
+                try:
+                    service.remove_stock(1, 1, 1)
+                    removed += 1
+                except InventoryValidationError:
+                    rejected += 1
+        return removed, rejected
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        outcomes = list(pool.map(remove_many, range(16)))
+
+    assert sum(r for r, _ in outcomes) == 50
+    assert sum(x for _, x in outcomes) == 16 * 10 - 50
+
+    with SessionLocal() as db:
+        assert db.query(Inventory).one().quantity == 0
+        history = db.query(StockHistory).filter_by(reason="REMOVE").all()
+        assert len(history) == 50
+        assert all(h.old_quantity - h.new_quantity == 1 for h in history)
+        assert sorted(h.new_quantity for h in history) == list(range(50))
+
+    engine.dispose()
+
+
+def test_concurrent_batches_on_a_new_pair_do_not_lose_updates(tmp_path, monkeypatch):
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.models.db_models import Base
+    from app.services.inventory_service import StockOperation
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'concurrency.db'}",
+        connect_args={"timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    # The first batch pauses after reading quantities; the second runs then
+    loaded = threading.Event()
+    load_quantities = InventoryService._load_quantities
+
+    def load_then_pause(self, pairs):
+        state = load_quantities(self, pairs)
+        if not loaded.is_set():
+            loaded.set()
+            time.sleep(0.5)
+        return state
+
+    monkeypatch.setattr(InventoryService, "_load_quantities", load_then_pause)
+
+    def add_five(wait):
+        if wait:
+            loaded.wait(10)
+        with SessionLocal() as db:
+            return InventoryService(db).apply_batch([StockOperation("add", 1, 1, 5)])
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = list(pool.map(add_five, [False, True]))
+
+    assert [r[0].applied for r in results] == [True, True]
+    with SessionLocal() as db:
+        assert db.query(Inventory).one().quantity == 10
+        history = db.query(StockHistory).order_by(StockHistory.id).all()
+        assert [(h.old_quantity, h.new_quantity) for h in history] == [(0, 5), (5, 10)]
+
+    engine.dispose()
+
+
+def test_stock_changes_maintain_shortage_risk(db_session):
+    from app.models.db_models import ShortageRisk
+    from app.services.inventory_service import StockOperation
+
+    service = InventoryService(db_session)
+
+    service.add_stock(1, 1, 50)
+    risk = db_session.get(ShortageRisk, (1, 1))
+    assert (risk.quantity, risk.risk_level) == (50, "NORMAL")
+    level_changed_at = risk.level_changed_at
+
+    # quantity moves, level does not
+    service.remove_stock(1, 1, 10)
+    db_session.expire_all()
+    risk = db_session.get(ShortageRisk, (1, 1))
+    assert (risk.quantity, risk.risk_level) == (40, "NORMAL")
+    assert risk.level_changed_at == level_changed_at
+
+    service.update_stock(1, 1, 3)
+    db_session.expire_all()
+    risk = db_session.get(ShortageRisk, (1, 1))
+    assert (risk.reason, risk.risk_level) == ("critical_low_stock", "CRITICAL")
+    assert risk.level_changed_at > level_changed_at
+
+    service.apply_batch(
+        [
+            StockOperation("remove", 1, 1, 3),
+            StockOperation("add", 1, 2, 12),
+        ]
+    )
+    db_session.expire_all()
+    assert db_session.get(ShortageRisk, (1, 1)).reason == "out_of_stock"
+    assert db_session.get(ShortageRisk, (1, 2)).risk_level == "WARNING"
@@ -0,0 +1,563 @@
+import os
+
+import joblib
+
+from app.ml.model_utils import ModelHolder, save_model
+
+
+def _bump_mtime(path, seconds=10):
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + seconds * 1_000_000_000))
+
+
+def test_model_holder_loads_once(tmp_path):
+    path = save_model({"name": "a"}, tmp_path / "model.joblib")
+    holder = ModelHolder(path, check_interval=0)
+
+    first = holder.get()
+    second = holder.get()
+
+    assert first is second
+    assert first.model == {"name": "a"}
+
+
+def test_model_holder_reloads_on_content_change(tmp_path):
+    path = save_model({"name": "a"}, tmp_path / "model.joblib")
+    holder = ModelHolder(path, check_interval=0)
+    first = holder.get()
+
+    save_model({"name": "b"}, path)
+    _bump_mtime(path)
+    second = holder.get()
+
+    assert second.model == {"name": "b"}
+    assert second.version != first.version
+    # In-flight callers keep a consistent snapshot.
+    assert first.model == {"name": "a"}
+
+
+def test_model_holder_ignores_touch_without_change(tmp_path):
+    path = save_model({"name": "a"}, tmp_path / "model.joblib")
+    holder = ModelHolder(path, check_interval=0)
+    first = holder.get()
+
+    joblib.dump({"name": "a"}, path)
+    _bump_mtime(path)
+
+    assert holder.get() is first
+
+
+def test_model_holder_missing_artifact(tmp_path):
+    holder = ModelHolder(tmp_path / "missing.joblib", check_interval=0)
+
+    assert holder.get() is None
+    assert holder.describe()["loaded"] is False
+
+
+def test_predict_shortage_batch_matches_pipeline(
+    tmp_path, monkeypatch, trained_pipeline
+):
+    from app.ml import predict
+
+    pipe, X = trained_pipeline
+    path = save_model(pipe, tmp_path / "model.joblib")
+    monkeypatch.setattr(predict, "model_holder", ModelHolder(path, check_interval=0))
+
+    rows = X.to_dict(orient="records")
+    result = predict.predict_shortage_batch(rows)
+
+    assert result["available"] is True
+    preds = [p["shortage_pred"] for p in result["predictions"]]
+    probas = [p["shortage_proba"] for p in result["predictions"]]
+    assert preds == pipe.predict(X).tolist()
+    assert probas == pipe.predict_proba(X)[:, 1].tolist()
+
+
+def test_score_threshold_sends_exact_half_to_negative_class():
+    import numpy as np
+    import pandas as pd
+
+    from app.ml.predict import _score
+
+    class FixedProba:
+        classes_ = np.array([0, 1])
+
+        def predict_proba(self, df):
+            positive = np.array([0.5, np.nextafter(0.5, 1.0), 0.49])
+            return np.column_stack([1.0 - positive, positive])
+
+    pred, proba = _score(FixedProba(), pd.DataFrame({"x": [0, 0, 0]}))
+
+    assert pred.tolist() == [0, 1, 0]
+    assert proba[0] == 0.5
+
+
+def test_load_inventory_dataset_picks_latest_history(db_session, monkeypatch):
+    from datetime import datetime, timedelta
+
+    from app.ml import data_loader
+    from app.models.db_models import Inventory, StockHistory
+
+    t0 = datetime(2026, 1, 1)
+    db_session.add_all(
+        [
+            Inventory(pharmacy_id=1, medication_id=1, quantity=7),
+            Inventory(pharmacy_id=1, medication_id=2, quantity=30),  # no history
+            StockHistory(pharmacy_id=1, medication_id=1, old_quantity=20,
+                         new_quantity=12, changed_at=t0 + timedelta(days=1)),
+            StockHistory(pharmacy_id=1, medication_id=1, old_quantity=12,
+                         new_quantity=7, changed_at=t0 + timedelta(days=2)),
+            StockHistory(pharmacy_id=1, medication_id=1, old_quantity=25,
+                         new_quantity=20, changed_at=t0),
+            StockHistory(pharmacy_id=2, medication_id=1, old_quantity=9,
+                         new_quantity=4, changed_at=t0),
+        ]
+    )
+    db_session.commit()
+
+    monkeypatch.setattr(data_loader, "MIN_ROWS_REQUIRED", 1)
+    df = data_loader.load_inventory_dataset(db_session)
+
+    assert list(df.columns) == data_loader.COLUMNS
+    rows = df.drop(columns="changed_at").values.tolist()
+    assert rows == [[1, 1, 7, 12, 7], [1, 2, 30, 30, 30]]
+    assert df["changed_at"].iloc[0] == t0 + timedelta(days=2)
+    assert df["changed_at"].isna().iloc[1]
+
+    # Too little inventory: fall back to the latest history row per pair
+    monkeypatch.setattr(data_loader, "MIN_ROWS_REQUIRED", 50)
+    df = data_loader.load_inventory_dataset(db_session)
+    rows = df.drop(columns="changed_at").values.tolist()
+    assert rows == [[1, 1, 7, 12, 7], [2, 1, 4, 9, 4]]
+
+
+def test_usage_aggregates_in_sql_match_pandas(db_session):
+    from datetime import datetime, timedelta
+
+    import pandas as pd
+
+    from app.ml import extract
+    from app.ml.train_baseline_model import (
+        apply_usage_aggregates,
+        compute_usage_features,
+    )
+    from app.models.db_models import Inventory, StockHistory
+
+    t0 = datetime(2026, 1, 1)
+    for p in range(1, 4):
+        for m in range(1, 6):
+            db_session.add(Inventory(pharmacy_id=p, medication_id=m, quantity=p * m))
+            qty = 100
+            for h in range((p + m) % 4):
+                new = qty - (h * 7 + m) % 11 + (5 if h == 2 else 0)
+                db_session.add(
+                    StockHistory(pharmacy_id=p, medication_id=m, old_quantity=qty,
+                                 new_quantity=new, changed_at=t0 + timedelta(hours=13 * h))
+                )
+                qty = new
+    db_session.commit()
+
+    inv = extract.load_inventory_columns(db_session, chunk_size=4)
+    hist = extract.load_stock_history_columns(db_session, chunk_size=4)
+    agg = extract.load_usage_aggregates(db_session, chunk_size=4)
+
+    assert inv["quantity"].dtype == "int32"
+    assert hist["pharmacy_id"].dtype == "int32"
+    assert str(hist["changed_at"].dtype) == "datetime64[ns, UTC]"
+    assert len(inv) == 15
+
+    expected = compute_usage_features(inv, hist, min_history_points=2)
+    actual = apply_usage_aggregates(inv, agg, min_history_points=2)
+
+    cols = ["pharmacy_id", "medication_id", "usage_rate_per_day", "last_change_days_ago"]
+    pd.testing.assert_frame_equal(
+        actual[cols], expected[cols], check_dtype=False, atol=1e-3
+    )
+
+
+def test_feature_store_catches_up_incrementally(db_session):
+    from datetime import datetime, timedelta
+
+    import pandas as pd
+
+    from app.ml import extract
+    from app.ml.feature_store import UsageFeatureStore
+    from app.models.db_models import StockHistory
+
+    today = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+
+    def write(days_ago, old, new, pharmacy_id=1, medication_id=1):
+        db_session.add(
+            StockHistory(pharmacy_id=pharmacy_id, medication_id=medication_id,
+                         old_quantity=old, new_quantity=new,
+                         changed_at=today - timedelta(days=days_ago))
+        )
+        db_session.commit()
+
+    write(40, 100, 90)
+    write(10, 90, 80)
+    write(3, 80, 70, medication_id=2)
+
+    store = UsageFeatureStore(db_session, batch_size=2)
+    first = store.catch_up()
+    assert (first.from_history_id, first.to_history_id, first.rows) == (0, 3, 3)
+
+    write(2, 80, 75)
+    write(0, 75, 78)          # restock: no decrease
+    write(0, 70, 60, medication_id=2)
+
+    second = store.catch_up()
+    assert (second.from_history_id, second.rows) == (3, 3)
+    assert store.catch_up().rows == 0
+
+    stored = store.load()
+    cols = list(extract.USAGE_AGGREGATE_DTYPES)
+    pd.testing.assert_frame_equal(
+        stored[cols],
+        extract.load_usage_aggregates(db_session)
+        .sort_values(["pharmacy_id", "medication_id"]).reset_index(drop=True),
+    )
+
+    windows = stored.set_index("medication_id")[["usage_7d", "usage_30d"]]
+    assert windows.loc[1].tolist() == [5, 15]
+    assert windows.loc[2].tolist() == [20, 20]
+
+    assert store.rebuild().rows == 6
+    pd.testing.assert_frame_equal(store.load(), stored)
+    assert len(store.load(pairs=[(1, 2)])) == 1
+
+
+def test_feature_store_rolls_up_days_per_pair_and_pharmacy(db_session):
+    from datetime import datetime, timedelta
+
+    from app.ml.feature_store import UsageFeatureStore
+    from app.models.db_models import PharmacyDaily, StockHistory, UsageDaily
+
+    day = datetime(2026, 3, 10, 9)
+    history = [
+        # (hours after day, pharmacy, medication, old, new)
+        (0, 1, 1, 20, 12),     # crosses the low threshold (15)
+        (1, 1, 1, 12, 0),      # stockout
+        (2, 1, 1, 0, 30),      # restock, leaves shortage
+        (3, 1, 2, 5, 3),
+        (24, 1, 1, 30, 25),
+        (25, 2, 1, 16, 15),    # crosses
+    ]
+    for hours, pharmacy_id, medication_id, old, new in history:
+        db_session.add(
+            StockHistory(pharmacy_id=pharmacy_id, medication_id=medication_id,
+                         old_quantity=old, new_quantity=new,
+                         changed_at=day + timedelta(hours=hours))
+        )
+    db_session.commit()
+
+    store = UsageFeatureStore(db_session, batch_size=2)
+    store.catch_up()
+
+    def snapshot():
+        pairs = {
+            (r.pharmacy_id, r.medication_id, r.day.day):
+                (r.changes, r.decrease, r.increase, r.stockouts, r.end_quantity)
+            for r in db_session.query(UsageDaily)
+        }
+        pharmacies = {
+            (r.pharmacy_id, r.day.day):
+                (r.changes, r.decrease, r.increase, r.stockouts,
+                 r.shortage_entries, r.shortage_exits)
+            for r in db_session.query(PharmacyDaily)
+        }
+        return pairs, pharmacies
+
+    pairs, pharmacies = snapshot()
+    assert pairs == {
+        (1, 1, 10): (3, 20, 30, 1, 30),
+        (1, 2, 10): (1, 2, 0, 0, 3),
+        (1, 1, 11): (1, 5, 0, 0, 25),
+        (2, 1, 11): (1, 1, 0, 0, 15),
+    }
+    assert pharmacies == {
+        (1, 10): (4, 22, 30, 1, 1, 1),
+        (1, 11): (1, 5, 0, 0, 0, 0),
+        (2, 11): (1, 1, 0, 0, 1, 0),
+    }
+
+    store.rebuild()
+    assert snapshot() == (pairs, pharmacies)
+
+
+def test_feature_assembler_caches_rows_with_ttl_and_lru(db_session):
+    from app.ml.features import FeatureAssembler
+    from app.models.db_models import Inventory
+
+    db_session.add_all(
+        [Inventory(pharmacy_id=1, medication_id=m, quantity=10 * m) for m in (1, 2, 3)]
+    )
+    db_session.commit()
+
+    now = [0.0]
+    assembler = FeatureAssembler(ttl_seconds=30, max_entries=2)
+    assembler.cache._clock = lambda: now[0]
+
+    first = assembler.assemble(db_session, [(1, 2), (1, 1), (1, 9)])
+    assert first.pairs == [(1, 2), (1, 1)]
+    assert first.missing == [(1, 9)]
+    assert first.frame["quantity"].tolist() == [20.0, 10.0]
+
+    # Cached rows are served until they expire
+    db_session.query(Inventory).filter_by(medication_id=2).update({"quantity": 5})
+    db_session.commit()
+    assert assembler.assemble(db_session, [(1, 2)]).frame["quantity"].tolist() == [20.0]
+    now[0] = 31.0
+    assert assembler.assemble(db_session, [(1, 2)]).frame["quantity"].tolist() == [5.0]
+
+    # Bounded: the least recently used pair is evicted
+    assembler.assemble(db_session, [(1, 1), (1, 3)])
+    assert len(assembler.cache) == 2
+    assert assembler.cache.get((1, 2)) is None
+
+
+def test_linear_scorer_matches_pipeline(tmp_path, trained_pipeline):
+    import numpy as np
+
+    from app.ml.linear_scorer import LinearScorer
+    from app.ml.train_baseline_model import TrainConfig, save_artifacts
+
+    pipe, X = trained_pipeline
+    X = X.copy()
+    X.iloc[::7, 1] = np.nan  # exercise median imputation
+
+    cfg = TrainConfig(artifacts_dir=str(tmp_path))
+    _, _, scorer_path = save_artifacts(pipe, {}, cfg)
+    scorer = LinearScorer.load(scorer_path)
+
+    assert scorer.feature_columns == tuple(X.columns)
+    proba = scorer.predict_proba(X.to_numpy(dtype=np.float32))
+    expected = pipe.predict_proba(X.astype(np.float32))[:, 1]
+    np.testing.assert_allclose(proba, expected, rtol=1e-6, atol=1e-9)
+    assert scorer.predict(X.to_numpy(dtype=np.float32)).tolist() == (
+        pipe.predict(X.astype(np.float32)).tolist()
+    )
+
+
+def test_linear_scorer_zero_weights_columns_dropped_by_imputer(trained_pipeline):
+    import numpy as np
+
+    from app.ml import linear_scorer
+    from app.ml.train_baseline_model import TrainConfig, train_and_evaluate
+
+    _, X = trained_pipeline
+    X = X.copy()
+    X["days_until_zero"] = np.nan  # imputer drops all-NaN columns
+    y = (X["quantity"] <= 20).astype(int)
+    pipe, _ = train_and_evaluate(X, y, TrainConfig())
+
+    scorer = linear_scorer.export(pipe, list(X.columns))
+
+    assert scorer.coef[2] == 0.0
+    np.testing.assert_allclose(
+        scorer.predict_proba(X.to_numpy(dtype=np.float32)),
+        pipe.predict_proba(X.astype(np.float32))[:, 1],
+        rtol=1e-6, atol=1e-9,
+    )
+
+
+def test_model_search_picks_best_candidate_within_latency_budget(trained_pipeline):
+    import itertools
+    from dataclasses import replace
+
+    import pytest
+    from sklearn.linear_model import LogisticRegression
+
+    from app.ml.model_search import Candidate, search_models
+    from app.ml.train_baseline_model import TrainConfig
+
+    _, X = trained_pipeline
+    y = (X["days_until_zero"] <= 3).astype(int)
+    cfg = TrainConfig(cv_splits=3, n_jobs=2)
+    candidates = [
+        Candidate("weak", LogisticRegression(C=1e-6, max_iter=1000)),
+        Candidate("strong", LogisticRegression(C=10.0, max_iter=1000)),
+    ]
+
+    # Fake clock: every timed predict takes exactly 1ms
+    ticks = itertools.count()
+
+    def timer():
+        return next(ticks) * 0.001
+
+    result = search_models(X, y, cfg, candidates, timer=timer)
+
+    assert result.winner.name == "strong"
+    assert result.winner_model.C == 10.0
+    summary = result.to_dict()
+    assert summary["winner"] == "strong"
+    for candidate in summary["candidates"]:
+        assert candidate["fit_seconds"] > 0
+        assert candidate["latency_p50_ms"] == pytest.approx(1.0)
+        assert candidate["latency_p95_ms"] == pytest.approx(1.0)
+        assert candidate["within_budget"]
+
+    with pytest.raises(RuntimeError, match="latency budget"):
+        search_models(X, y, replace(cfg, latency_budget_ms=0.5), candidates, timer=timer)
+
+
+def test_time_ordered_holdout_is_the_newest_rows(trained_pipeline):
+    from app.ml.train_baseline_model import TrainConfig, time_order, train_and_evaluate
+
+    _, X = trained_pipeline
+    y = (X["days_until_zero"] <= 3).astype(int)
+    cfg = TrainConfig(test_size=0.25)
+
+    _, metrics = train_and_evaluate(X, y, cfg, time_ordered=True)
+
+    _, ordered_y = time_order(X, y)
+    newest = ordered_y.iloc[-metrics["n_test"]:]
+    assert metrics["time_ordered_split"] is True
+    assert metrics["n_test"] == round(len(X) * 0.25)
+    assert metrics["label_positive_rate_test"] == float(newest.mean())
+
+
+def _train_synthetic(artifacts_dir, report, label_noise=0.0):
+    import numpy as np
+    import pandas as pd
+
+    from app.ml.predict import FEATURE_COLUMNS
+    from app.ml.train_baseline_model import TrainConfig, save_artifacts, train_and_evaluate
+
+    report(0.1, "synthetic data")
+    rng = np.random.default_rng(1)
+    n = 300
+    X = pd.DataFrame(
+        {
+            "quantity": rng.integers(0, 100, n).astype(float),
+            "usage_rate_per_day": rng.uniform(0.5, 10, n),
+            "days_until_zero": np.nan,
+            "last_change_days_ago": rng.uniform(0, 30, n),
+            "pharmacy_id": rng.integers(1, 5, n).astype(float),
+            "medication_id": rng.integers(1, 20, n).astype(float),
+        }
+    )[FEATURE_COLUMNS]
+    X["days_until_zero"] = X["quantity"] / X["usage_rate_per_day"]
+    y = (X["days_until_zero"] <= 3).astype(int)
+    if label_noise:
+        y = pd.Series(rng.random(n) < 0.5, index=X.index).astype(int)
+
+    cfg = TrainConfig(artifacts_dir=artifacts_dir)
+    pipe, metrics = train_and_evaluate(X, y, cfg)
+    save_artifacts(pipe, metrics, cfg)
+    return {"f1": metrics["f1"], "rows": n}
+
+
+def _train_random_labels(artifacts_dir, report):
+    return _train_synthetic(artifacts_dir, report, label_noise=1.0)
+
+
+def _wait_for(manager, job, timeout=120):
+    import time
+
+    deadline = time.monotonic() + timeout
+    while manager.get(job.id).active:
+        assert time.monotonic() < deadline, "retrain job did not finish"
+        time.sleep(0.1)
+    return manager.get(job.id)
+
+
+def test_retrain_job_runs_in_background_and_swaps_after_validation(tmp_path):
+    from app.ml.registry import ModelRegistry
+    from app.ml.retrain import CANDIDATES_DIRNAME, RetrainManager
+    from app.ml.train_baseline_model import TrainConfig
+
+    cfg = TrainConfig(artifacts_dir=str(tmp_path))
+    registry = ModelRegistry(tmp_path / "registry")
+    holder = ModelHolder(tmp_path / "unused.joblib", registry=registry, check_interval=0)
+    manager = RetrainManager(
+        train_fn=_train_synthetic, cfg=cfg, registry=registry, min_f1=0.8, holder=holder
+    )
+
+    job, created = manager.submit()
+    again, created_again = manager.submit()
+    assert created and not created_again
+    assert again.id == job.id
+
+    job = _wait_for(manager, job)
+    assert job.status == "succeeded", job.error
+    assert job.progress == 1.0
+    assert job.model_version == holder.get().version == registry.current_version()
+    assert registry.current().metadata["metrics"]["rows"] == 300
+    assert not any((tmp_path / CANDIDATES_DIRNAME).iterdir())
+
+    # A candidate that fails validation never replaces the served model
+    manager.train_fn = _train_random_labels
+    bad, created = manager.submit()
+    assert created
+    bad = _wait_for(manager, bad)
+    assert bad.status == "failed"
+    assert "F1" in bad.error
+    assert holder.get().version == job.model_version
+    assert len(registry.list_versions()) == 1
+    assert [j.id for j in manager.jobs()] == [bad.id, job.id]
+
+
+def test_registry_promote_rollback_and_holder_pickup(tmp_path, trained_pipeline):
+    import pytest
+
+    from app.ml.registry import ModelRegistry, RegistryError
+
+    pipe, X = trained_pipeline
+    registry = ModelRegistry(tmp_path / "registry")
+    holder = ModelHolder(tmp_path / "missing.joblib", registry=registry, check_interval=0)
+    assert holder.get() is None
+
+    def register(C):
+        model = joblib.load(save_model(pipe, tmp_path / "model.joblib"))
+        model.set_params(model__C=C)
+        path = save_model(model, tmp_path / f"model_{C}.joblib")
+        return registry.register(
+            path,
+            metrics={"f1": 0.9},
+            config={"C": C},
+            feature_columns=list(X.columns),
+            data_watermark={"stock_history_id": 42},
+        )
+
+    first, second = register(1.0), register(2.0)
+    assert first.version != second.version
+    assert first.metadata["feature_columns"] == list(X.columns)
+    assert first.metadata["data_watermark"] == {"stock_history_id": 42}
+
+    registry.promote(first.version)
+    loaded = holder.get()
+    assert loaded.version == first.version
+    assert holder.describe()["source"] == "registry"
+
+    registry.promote(second.version)
+    assert holder.get().version == second.version
+    assert holder.get().model.get_params()["model__C"] == 2.0
+
+    assert registry.rollback().version == first.version
+    assert holder.get().version == first.version
+
+    # Rewriting the pointer to the same version does not reload the model
+    same = holder.get()
+    registry.promote(first.version)
+    _bump_mtime(registry.current_file)
+    assert holder.get() is same
+
+    with pytest.raises(RegistryError):
+        registry.rollback()
+    with pytest.raises(RegistryError):
+        registry.promote("no-such-version")
+
+
+def test_model_holder_memory_maps_model_arrays(tmp_path, trained_pipeline):
+    import numpy as np
+
+    pipe, X = trained_pipeline
+    path = save_model(pipe, tmp_path / "model.joblib")
+
+    mapped = ModelHolder(path, check_interval=0).get().model
+    in_memory = ModelHolder(path, check_interval=0, mmap_mode=None).get().model
+
+    assert isinstance(mapped.named_steps["model"].coef_, np.memmap)
+    assert not isinstance(in_memory.named_steps["model"].coef_, np.memmap)
+    assert mapped.predict_proba(X).tolist() == pipe.predict_proba(X).tolist()
@@ -1,4 +1,7 @@
+import pytest
+
 from app.services.reporting_service import ReportingService
+from app.services.shortage_service import ShortageServiceError
 from app.models.db_models import Inventory
 
 
@@ -18,3 +21,199 @@ def test_generate_shortage_report(db_session):
     assert report.total_items == 3
     assert report.total_shortages == 2
     assert report.critical_shortages >= 1
+
+
+def test_shortage_report_groups_shortages_by_pharmacy(db_session):
+    db_session.add_all(
+        [
+            Inventory(pharmacy_id=2, medication_id=1, quantity=12),
+            Inventory(pharmacy_id=1, medication_id=2, quantity=0),
+            Inventory(pharmacy_id=2, medication_id=3, quantity=4),
+            Inventory(pharmacy_id=1, medication_id=4, quantity=80),
+        ]
+    )
+    db_session.commit()
+
+    report = ReportingService(db_session).generate_shortage_report()
+
+    assert (report.total_shortages, report.critical_shortages, report.low_shortages) == (3, 2, 1)
+    assert report.by_pharmacy == [
+        {
+            "pharmacy_id": 2,
+            "shortage_count": 2,
+            "items": [
+                {"medication_id": 1, "quantity": 12, "risk_score": 0.55, "reason": "low_stock"},
+                {"medication_id": 3, "quantity": 4, "risk_score": 0.85,
+                 "reason": "critical_low_stock"},
+            ],
+        },
+        {
+            "pharmacy_id": 1,
+            "shortage_count": 1,
+            "items": [
+                {"medication_id": 2, "quantity": 0, "risk_score": 1.0, "reason": "out_of_stock"},
+            ],
+        },
+    ]
+    assert report.to_dict()["total_items"] == 4
+
+
+def test_shortage_report_matches_per_row_scoring(db_session):
+    import math
+    from datetime import datetime
+
+    from app.models.db_models import UsageFeatures
+    from app.services.shortage_service import ShortageService
+
+    # Inserted out of pharmacy/medication order; some pairs with usage
+    rows = [
+        Inventory(pharmacy_id=(i * 7) % 5 + 1, medication_id=(i * 11) % 40 + 1, quantity=(i * 13) % 30)
+        for i in range(40)
+    ]
+    db_session.add_all(rows)
+    db_session.add_all(
+        [
+            UsageFeatures(
+                pharmacy_id=inv.pharmacy_id,
+                medication_id=inv.medication_id,
+                history_points=4,
+                total_decrease=inv.medication_id * 3,
+                first_change=datetime(2026, 1, 1),
+                last_change=datetime(2026, 1, 11),
+            )
+            for inv in rows[::3]
+        ]
+    )
+    db_session.commit()
+
+    service = ReportingService(db_session)
+    service.shortage_service = ShortageService(db_session, mode="coverage")
+    report = service.generate_shortage_report().to_dict()
+
+    # Reference: compute_risk() on each row in inventory order
+    scoring = service.shortage_service
+    usage = scoring.daily_usage_many([(r.pharmacy_id, r.medication_id) for r in rows])
+    risks = [
+        scoring.compute_risk(inv, None if math.isnan(rate) else float(rate))
+        for inv, rate in zip(rows, usage)
+    ]
+    shortages = [r for r in risks if r.risk_score >= 0.55]
+    by_pharmacy = {}
+    for r in shortages:
+        by_pharmacy.setdefault(r.pharmacy_id, []).append(
+            {"medication_id": r.medication_id, "quantity": r.quantity,
+             "risk_score": r.risk_score, "reason": r.reason}
+        )
+
+    assert report["total_items"] == len(rows)
+    assert report["total_shortages"] == len(shortages)
+    assert report["critical_shortages"] == sum(r.risk_score >= 0.8 for r in shortages)
+    assert report["low_shortages"] == sum(r.risk_score < 0.8 for r in shortages)
+    assert report["by_pharmacy"] == [
+        {"pharmacy_id": p, "shortage_count": len(items), "items": items}
+        for p, items in by_pharmacy.items()
+    ]
+    assert any(r.reason.endswith("_cover") for r in shortages)
+
+
+def test_shortage_report_without_inventory(db_session):
+    report = ReportingService(db_session).generate_shortage_report()
+
+    assert (report.total_items, report.total_shortages, report.by_pharmacy) == (0, 0, [])
+
+
+def test_shortage_report_rejects_unsupported_dialect(db_session, monkeypatch):
+    monkeypatch.setattr(db_session.get_bind().dialect, "name", "mssql")
+
+    with pytest.raises(ShortageServiceError, match="not supported for 'mssql'"):
+        ReportingService(db_session).generate_shortage_report()
+
+
+def test_shortage_report_trend_from_rollups(db_session):
+    from datetime import date, datetime, timedelta
+
+    from app.ml.feature_store import UsageFeatureStore
+    from app.models.db_models import StockHistory
+
+    as_of = date(2026, 3, 20)
+    noon = datetime(2026, 3, 20, 12)
+
+    # Ten items end up in shortage: 2 already were before the last week,
+    # 9 entered during it and 1 recovered.
+    db_session.add_all(
+        [Inventory(pharmacy_id=1, medication_id=m, quantity=5) for m in range(1, 11)]
+        + [Inventory(pharmacy_id=2, medication_id=1, quantity=40)]
+    )
+    changes = [(1, m, 20, 5, 2) for m in range(3, 11)]      # entered in the last week
+    changes += [(1, 1, 20, 5, 10), (1, 2, 20, 5, 12)]        # entered the week before
+    changes += [(2, 1, 20, 10, 3), (2, 1, 10, 40, 1)]        # entered, then recovered
+    for pharmacy_id, medication_id, old, new, days_ago in changes:
+        db_session.add(
+            StockHistory(pharmacy_id=pharmacy_id, medication_id=medication_id,
+                         old_quantity=old, new_quantity=new,
+                         changed_at=noon - timedelta(days=days_ago))
+        )
+    db_session.commit()
+    UsageFeatureStore(db_session).catch_up()
+
+    trend = ReportingService(db_session).shortage_trend(as_of)
+
+    assert trend["status"] == "worsening"
+    assert (trend["shortages"], trend["shortages_week_ago"]) == (10, 2)
+    assert (trend["new_shortages"], trend["resolved_shortages"]) == (9, 1)
+    assert (trend["week_over_week_delta"], trend["previous_week_delta"]) == (8, 2)
+    assert trend["pharmacies_worsening"] == [{"pharmacy_id": 1, "week_over_week_delta": 8}]
+
+    # Days after as_of are rolled back out of the count: the 8 entries of
+    # March 18 are undone and the recovery of March 19 is not applied yet
+    assert ReportingService(db_session).shortage_trend(as_of - timedelta(days=3))["shortages"] == 3
+
+
+def test_shortage_trend_counts_created_pairs(db_session):
+    from datetime import datetime
+
+    from app.ml.feature_store import UsageFeatureStore
+    from app.services.inventory_service import InventoryService, StockOperation
+
+    service = InventoryService(db_session)
+    service.add_stock(1, 1, 50)            # created in stock: not an exit
+    service.update_stock(1, 2, 3)          # created in shortage: an entry
+    service.apply_batch([StockOperation("add", 1, 3, 4), StockOperation("add", 1, 3, 1)])
+    UsageFeatureStore(db_session).catch_up()
+
+    trend = ReportingService(db_session).shortage_trend(datetime.utcnow().date())
+
+    assert (trend["new_shortages"], trend["resolved_shortages"]) == (2, 0)
+    assert (trend["shortages"], trend["shortages_week_ago"]) == (2, 0)
+
+
+def test_shortage_trend_counts_at_the_rollup_watermark(db_session):
+    from datetime import datetime
+
+    from app.ml.feature_store import UsageFeatureStore
+    from app.services.inventory_service import InventoryService
+    from app.services.shortage_service import ShortageService
+
+    service = InventoryService(db_session)
+    service.update_stock(1, 1, 3)
+    service.update_stock(1, 2, 40)
+    watermark = UsageFeatureStore(db_session).catch_up().to_history_id
+
+    # Not folded into the rollups yet: left out of the count as well
+    service.update_stock(1, 2, 2)
+    service.update_stock(1, 3, 1)
+    service.update_stock(1, 1, 30)
+
+    reporting = ReportingService(db_session)
+    trend = reporting.shortage_trend(datetime.utcnow().date())
+    assert trend["as_of_watermark"] == watermark
+    assert (trend["shortages"], trend["new_shortages"]) == (1, 1)
+
+    UsageFeatureStore(db_session).catch_up()
+    trend = reporting.shortage_trend(datetime.utcnow().date())
+    assert trend["as_of_watermark"] > watermark
+    assert (trend["shortages"], trend["new_shortages"]) == (2, 3)
+
+    reporting.shortage_service = ShortageService(db_session, low_threshold=5)
+    with pytest.raises(ShortageServiceError, match="low_threshold"):
+        reporting.shortage_trend()
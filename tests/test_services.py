@@ -0,0 +1,206 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.result_cache import ResultCache
+
+
+def test_result_cache_single_flight_across_threads():
+    cache = ResultCache(ttl_seconds=60)
+    calls = []
+    start = threading.Barrier(8)
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"rows": len(calls)}
+
+    results = []
+
+    def worker():
+        start.wait()
+        results.append(cache.get_or_compute("report", {"pharmacy_id": 1}, compute))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"rows": 1}] * 8
+    assert cache.coalesced + cache.backend.stats()["hits"] == 7
+
+    # Other parameters are separate entries
+    assert cache.get_or_compute("report", {"pharmacy_id": 2}, compute) == {"rows": 2}
+    assert cache.get_or_compute("report", {"pharmacy_id": 1}, compute) == {"rows": 1}
+
+
+def test_result_cache_single_flight_async_shares_errors():
+    cache = ResultCache(ttl_seconds=60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise RuntimeError("database went away")
+        return "report"
+
+    async def main():
+        first = await asyncio.gather(
+            *[cache.aget_or_compute("report", {}, compute) for _ in range(5)],
+            return_exceptions=True,
+        )
+        # Errors are not cached: the next miss computes again
+        second = await asyncio.gather(
+            *[cache.aget_or_compute("report", {}, compute) for _ in range(5)]
+        )
+        return first, second
+
+    first, second = asyncio.run(main())
+
+    assert len(calls) == 2
+    assert all(isinstance(r, RuntimeError) for r in first)
+    assert second == ["report"] * 5
+    assert cache.coalesced == 8
+
+
+def test_result_cache_disabled_with_zero_ttl():
+    cache = ResultCache(ttl_seconds=0)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    assert [cache.get_or_compute("report", {}, compute) for _ in range(3)] == [1, 2, 3]
+
+
+def test_report_cache_follows_the_inventory_version(db_session):
+    from sqlalchemy import func, select
+
+    from app.models.db_models import InventoryVersion
+    from app.services.inventory_service import InventoryService, StockOperation
+    from app.services.reporting_service import ReportingService
+
+    cache = ResultCache(ttl_seconds=60)
+    service = InventoryService(db_session)
+    service.add_stock(1, 1, 3)
+
+    # What GET /reports/shortages keys the entry on (any worker's commit moves it)
+    def version():
+        return db_session.scalar(select(func.sum(InventoryVersion.version)))
+
+    def report():
+        return cache.get_or_compute(
+            "shortage_report",
+            {"inventory": version()},
+            lambda: ReportingService(db_session).generate_shortage_report().to_dict(),
+        )
+
+    assert report()["total_shortages"] == 1
+
+    service.add_stock(2, 1, 4)
+    assert report()["total_shortages"] == 2
+
+    service.apply_batch([StockOperation("update", 1, 1, 40)])
+    assert report()["total_shortages"] == 1
+
+    # A rejected write changes nothing and keeps the entry
+    before = version()
+    with pytest.raises(Exception):
+        service.remove_stock(2, 1, 10)
+    assert version() == before
+    assert cache.backend.stats()["hits"] == 0
+    assert report()["total_shortages"] == 1
+    assert cache.backend.stats()["hits"] == 1
+
+
+def _change(pharmacy_id, medication_id=1, level="CRITICAL"):
+    from datetime import datetime
+
+    from app.services.shortage_service import RiskLevelChange
+
+    return RiskLevelChange(
+        pharmacy_id=pharmacy_id,
+        medication_id=medication_id,
+        previous_level="NORMAL",
+        risk_level=level,
+        risk_score=0.85,
+        quantity=2,
+        days_of_cover=None,
+        changed_at=datetime(2026, 3, 1),
+    )
+
+
+def test_risk_events_fan_out_per_pharmacy_with_bounded_queues():
+    from app.services.risk_events import RiskEventBroker
+
+    broker = RiskEventBroker(queue_size=2)
+
+    async def main():
+        everything = broker.subscribe()
+        pharmacy_2 = broker.subscribe([2])
+
+        # Published from another thread, as sync request handlers do
+        publisher = threading.Thread(
+            target=broker.publish,
+            args=(None, [_change(1, m) for m in range(1, 4)] + [_change(2)]),
+        )
+        publisher.start()
+        publisher.join()
+        await asyncio.sleep(0)
+
+        # The slow subscriber kept the newest two events
+        kept = [everything.queue.get_nowait() for _ in range(everything.queue.qsize())]
+        assert [(c.pharmacy_id, c.medication_id) for c in kept] == [(1, 3), (2, 1)]
+        assert everything.dropped == 2
+
+        assert (await pharmacy_2.get()).pharmacy_id == 2
+        assert pharmacy_2.dropped == 0
+        assert broker.stats()["subscribers"] == 2
+
+        broker.unsubscribe(everything)
+        broker.unsubscribe(pharmacy_2)
+
+    asyncio.run(main())
+    assert broker.stats()["subscribers"] == 0
+
+
+def test_notify_payloads_stay_under_the_limit():
+    import json
+
+    from app.services.risk_events import NOTIFY_PAYLOAD_LIMIT, notify_payloads
+
+    events = [_change(p, m) for p in range(1, 6) for m in range(1, 40)]
+    payloads = list(notify_payloads(events))
+
+    assert len(payloads) > 1
+    assert all(len(payload) < NOTIFY_PAYLOAD_LIMIT for payload in payloads)
+    decoded = [item for payload in payloads for item in json.loads(payload)]
+    assert decoded == [event.to_dict() for event in events]
+
+
+def test_inventory_writes_publish_risk_level_changes(db_session, monkeypatch):
+    from app.services.inventory_service import InventoryService
+    from app.services.risk_events import RiskEventBroker
+
+    published = []
+
+    class RecordingBroker(RiskEventBroker):
+        def publish(self, db, events):
+            published.extend((c.medication_id, c.previous_level, c.risk_level) for c in events)
+
+    monkeypatch.setattr("app.services.inventory_service.risk_events", RecordingBroker())
+    service = InventoryService(db_session)
+
+    service.add_stock(1, 1, 40)
+    service.remove_stock(1, 1, 5)      # 35: still NORMAL
+    service.remove_stock(1, 1, 32)     # 3: CRITICAL
+    with pytest.raises(Exception):
+        service.remove_stock(1, 1, 10)
+
+    assert published == [(1, None, "NORMAL"), (1, "NORMAL", "CRITICAL")]
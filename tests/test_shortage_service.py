@@ -1,4 +1,7 @@
-from app.services.shortage_service import ShortageService
+import numpy as np
+import pytest
+
+from app.services.shortage_service import ShortageService, ShortageServiceError
 from app.models.db_models import Inventory
 
 
@@ -23,3 +26,240 @@ def test_compute_risk_low_stock(db_session):
     risk = service.compute_risk(inv)
 
     assert risk.reason == "low_stock"
+
+
+def _seed_quantities(db_session, quantities, pharmacy_id=1):
+    rows = [
+        Inventory(pharmacy_id=pharmacy_id, medication_id=i + 1, quantity=q)
+        for i, q in enumerate(quantities)
+    ]
+    db_session.add_all(rows)
+    db_session.commit()
+    return rows
+
+
+def test_list_risks_matches_compute_risk(db_session):
+    rows = _seed_quantities(db_session, range(-1, 25))
+
+    service = ShortageService(db_session)
+    expected = {
+        r.medication_id: (r.risk_score, r.reason)
+        for r in (service.compute_risk(inv) for inv in rows)
+    }
+    actual = {
+        r.medication_id: (r.risk_score, r.reason)
+        for r in service.list_risks()
+    }
+
+    assert actual == expected
+
+
+def test_compute_risk_many_matches_compute_risk(db_session):
+    from datetime import datetime
+
+    rows = _seed_quantities(db_session, range(-1, 25))
+    now = datetime(2026, 1, 1)
+
+    service = ShortageService(db_session, critical_threshold=4, low_threshold=12)
+    risks = service.compute_risk_many(
+        [inv.quantity for inv in rows],
+        [inv.pharmacy_id for inv in rows],
+        [inv.medication_id for inv in rows],
+        now,
+    )
+
+    expected = [service.compute_risk(inv) for inv in rows]
+    assert [(r.risk_score, r.reason) for r in expected] == list(
+        zip(risks.risk_score.tolist(), risks.reasons.tolist())
+    )
+    assert all(r.calculated_at == now for r in risks.results())
+    assert [r.medication_id for r in risks.results()] == [r.medication_id for r in expected]
+    assert len(service.compute_risk_many([], [], [])) == 0
+
+
+def test_list_risks_filters_in_sql(db_session):
+    rows = _seed_quantities(db_session, range(0, 25))
+    _seed_quantities(db_session, [0, 3], pharmacy_id=2)
+
+    service = ShortageService(db_session)
+    expected = [
+        (inv.pharmacy_id, inv.medication_id)
+        for inv in rows
+        if service.compute_risk(inv).risk_score >= 0.55
+    ]
+
+    high = service.get_high_risk_items(min_risk=0.55, pharmacy_id=1)
+    assert sorted((r.pharmacy_id, r.medication_id) for r in high) == expected
+
+    warning = service.list_risks(risk_level="WARNING")
+    assert {r.reason for r in warning} == {"low_stock"}
+
+    assert service.list_risks(min_risk=1.01) == []
+
+
+def test_rebuild_risk_table_matches_list_risks(db_session):
+    from datetime import datetime
+
+    from app.models.db_models import ShortageRisk
+
+    rows = _seed_quantities(db_session, range(-1, 25))
+    service = ShortageService(db_session)
+
+    first = datetime(2026, 1, 1)
+    assert service.rebuild_risk_table(now=first) == len(rows)
+    db_session.commit()
+
+    stored = {
+        r.medication_id: (r.risk_score, r.reason)
+        for r in service.to_results(db_session.execute(service.stored_risk_statement()))
+    }
+    assert stored == {
+        r.medication_id: (r.risk_score, r.reason) for r in service.list_risks()
+    }
+
+    # Only pairs whose level moved get a new level_changed_at
+    rows[0].quantity = 100   # CRITICAL -> NORMAL
+    rows[-1].quantity = 30   # NORMAL -> NORMAL
+    db_session.delete(rows[1])
+    db_session.commit()
+
+    second = datetime(2026, 1, 2)
+    service.rebuild_risk_table(now=second)
+    db_session.commit()
+
+    by_med = {r.medication_id: r for r in db_session.query(ShortageRisk)}
+    assert len(by_med) == len(rows) - 1
+    assert (by_med[1].risk_level, by_med[1].level_changed_at) == ("NORMAL", second)
+    assert by_med[len(rows)].level_changed_at == first
+    assert by_med[len(rows)].calculated_at == second
+
+
+def _seed_usage(db_session, usage_by_medication, pharmacy_id=1):
+    """usage_features rows giving each medication the given daily usage"""
+    from datetime import datetime, timedelta
+
+    from app.models.db_models import UsageFeatures
+
+    start = datetime(2026, 1, 1)
+    db_session.add_all(
+        [
+            UsageFeatures(
+                pharmacy_id=pharmacy_id,
+                medication_id=medication_id,
+                history_points=5,
+                total_decrease=int(rate * 10),
+                first_change=start,
+                last_change=start + timedelta(days=10),
+            )
+            for medication_id, rate in usage_by_medication.items()
+        ]
+    )
+    db_session.commit()
+
+
+def test_coverage_mode_scores_by_days_of_cover(db_session):
+    # Same stock: a fast mover (10/day) runs out in 1.5 days, a slow mover
+    # (1/day) lasts 15 days; medication 3 has no usage history.
+    rows = _seed_quantities(db_session, [15, 15, 15, 0])
+    _seed_usage(db_session, {1: 10, 2: 1, 4: 3})
+
+    service = ShortageService(db_session, mode="coverage")
+    risks = {r.medication_id: r for r in service.list_risks()}
+
+    assert {m: r.reason for m, r in risks.items()} == {
+        1: "critical_low_cover",
+        2: "stock_ok",
+        3: "low_stock",
+        4: "out_of_stock",
+    }
+    assert risks[1].days_of_cover == pytest.approx(1.5)
+    assert risks[2].days_of_cover == pytest.approx(15.0)
+    assert risks[3].days_of_cover is None
+    assert risks[4].days_of_cover == 0.0
+
+    # Python, vectorized and SQL scoring agree
+    pairs = [(inv.pharmacy_id, inv.medication_id) for inv in rows]
+    usage = service.daily_usage_many(pairs)
+    many = service.compute_risk_many(
+        [inv.quantity for inv in rows], *zip(*pairs), daily_usage=usage
+    )
+    single = [
+        service.compute_risk(inv, None if np.isnan(rate) else rate)
+        for inv, rate in zip(rows, usage)
+    ]
+    assert many.reasons.tolist() == [r.reason for r in single] == [
+        risks[m].reason for m in (1, 2, 3, 4)
+    ]
+    assert many.days_of_cover_values() == pytest.approx([r.days_of_cover for r in single])
+
+    # The quantity mode ignores usage but still reports days of cover
+    quantity = {r.medication_id: r for r in ShortageService(db_session).list_risks()}
+    assert quantity[1].reason == quantity[2].reason == "low_stock"
+    assert quantity[1].days_of_cover == pytest.approx(1.5)
+
+
+def test_coverage_mode_filters_and_stores_days_of_cover(db_session):
+    from app.models.db_models import ShortageRisk, StockHistory
+
+    rows = _seed_quantities(db_session, [15, 15, 20])
+    _seed_usage(db_session, {1: 10, 2: 1})
+
+    service = ShortageService(db_session, mode="coverage")
+    assert [r.medication_id for r in service.get_high_risk_items(min_risk=0.8)] == [1]
+    assert [r.medication_id for r in service.list_risks(risk_level="NORMAL")] == [2, 3]
+
+    service.rebuild_risk_table()
+    db_session.commit()
+    stored = {r.medication_id: r for r in db_session.query(ShortageRisk)}
+    assert stored[1].reason == "critical_low_cover"
+    assert stored[1].days_of_cover == pytest.approx(1.5)
+    assert (stored[3].reason, stored[3].days_of_cover) == ("stock_ok", None)
+
+    # A catch-up folds in usage for medication 3: 20 units at 4/day
+    _seed_usage(db_session, {3: 4})
+    db_session.add(
+        StockHistory(pharmacy_id=1, medication_id=3, old_quantity=24, new_quantity=20)
+    )
+    db_session.commit()
+    history_id = db_session.query(StockHistory.id).scalar()
+
+    rows[0].quantity = 100  # not rescored: no history in the range
+    db_session.commit()
+
+    service.rescore_history_range(history_id - 1, history_id)
+    db_session.commit()
+    db_session.expire_all()
+    stored = {r.medication_id: r for r in db_session.query(ShortageRisk)}
+    assert stored[3].days_of_cover == pytest.approx(5.0)
+    assert stored[3].reason == "low_cover"
+    assert stored[1].quantity == 15
+
+
+def test_unknown_risk_mode_is_rejected(db_session):
+    with pytest.raises(ValueError):
+        ShortageService(db_session, mode="weekly")
+
+
+def test_risk_upsert_rejects_unsupported_dialect(db_session, monkeypatch):
+    service = ShortageService(db_session)
+    monkeypatch.setattr(db_session.get_bind().dialect, "name", "mssql")
+
+    with pytest.raises(ShortageServiceError, match="not supported for 'mssql'"):
+        service._risk_insert()
+
+
+def test_refresh_risks_reports_level_changes(db_session):
+    service = ShortageService(db_session)
+
+    first = service.refresh_risks([(1, 1, 40), (1, 2, 3)])
+    assert [(c.medication_id, c.previous_level, c.risk_level) for c in first] == [
+        (1, None, "NORMAL"),
+        (2, None, "CRITICAL"),
+    ]
+
+    # 40 -> 30 stays NORMAL; 3 -> 0 stays CRITICAL (only the reason changes)
+    assert service.refresh_risks([(1, 1, 30), (1, 2, 0)]) == []
+
+    [change] = service.refresh_risks([(1, 1, 10), (1, 2, 0)])
+    assert (change.medication_id, change.previous_level, change.risk_level) == (1, "NORMAL", "WARNING")
+    assert (change.quantity, change.risk_score) == (10, 0.55)